@@ -1,11 +1,7 @@
 '''
 readmanager package
+
+The modules are not imported here, so that readmana imports only
+those needed by the mode it runs in, e.g. readmanager.main for -c.
 '''
 __VERSION__ = "0.0.1"
-
-from readmanager import bookitem
-from readmanager import manager
-from readmanager import presenter
-from readmanager import utils
-from readmanager import opener
-from readmanager import main
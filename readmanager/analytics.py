@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+'''
+Reading activity analytics built from the logs of all book items.
+
+The log of a book maps iso dates to the page reached on that date.
+The cumulative snapshots are converted to the number of pages read per day,
+and summed over the whole library to a daily series with weekly and monthly rollups.
+Per-book deltas are cached on disk, such that only changed JSONs are read again.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import json
+import datetime as dt
+from readmanager.layout import iter_book_jsons
+from readmanager.logcompact import full_log
+from readmanager import codec
+from readmanager import profiler
+
+__cacheVersion = 1
+__nameCache = "activity.json"
+
+def log_to_deltas(log):
+    '''
+    Convert the cumulative page snapshots of a book log to pages read per day
+
+    The first snapshot is counted from page 0, since the log is initialized
+    when the book is created. Going back to an earlier page counts as 0 pages read.
+
+    Parameters
+    ----------
+    log : dict
+        {"yyyy-mm-dd": page}
+
+    Returns
+    -------
+    dict : {"yyyy-mm-dd": pages read on that day}, days without reading excluded
+    '''
+    deltas = {}
+    pagePrev = 0
+    # iso dates sort chronologically as strings
+    for dateStr in sorted(log):
+        page = log[dateStr]
+        if page > pagePrev:
+            deltas[dateStr] = page - pagePrev
+        pagePrev = page
+    return deltas
+
+def iter_logs(dirsDB):
+    '''
+    Stream the logs of all book JSONs in the database directories
+
+    Parameters
+    ----------
+    dirsDB : list of str
+        database directories, e.g. [dbJSON, dbArchive]
+
+    Returns
+    -------
+    generator of (str, dict) : path of book JSON and its log
+    '''
+    for dirDB in dirsDB:
+        for pathJSON in iter_book_jsons(dirDB):
+            yield pathJSON, __read_log(pathJSON)
+
+def __read_log(pathJSON):
+    '''
+    Read the log of a book JSON. An empty dict is returned if log is missing
+    '''
+    return full_log(codec.load_path(pathJSON))
+
+def __add_deltas(daily, deltas, sign=1):
+    '''
+    Add (sign=1) or subtract (sign=-1) the per-day deltas of a book to the daily series
+    '''
+    for dateStr, pages in deltas.items():
+        pagesNew = daily.get(dateStr, 0) + sign * pages
+        if pagesNew:
+            daily[dateStr] = pagesNew
+        else:
+            daily.pop(dateStr, None)
+
+def __load_cache(pathCache):
+    '''
+    Load the activity cache. An empty cache is returned if not found or outdated
+    '''
+    cacheEmpty = {"version": __cacheVersion, "books": {}, "daily": {}}
+    if pathCache is None or not os.path.isfile(pathCache):
+        return cacheEmpty
+    try:
+        with open(pathCache, 'r') as hFileIn:
+            cache = json.load(hFileIn)
+    except ValueError:
+        return cacheEmpty
+    if cache.get("version", None) != __cacheVersion:
+        return cacheEmpty
+    return cache
+
+def __dump_cache(cache, pathCache):
+    '''
+    Dump the activity cache atomically
+    '''
+    os.makedirs(os.path.dirname(pathCache), exist_ok=True)
+    pathTmp = pathCache + ".tmp"
+    with open(pathTmp, 'w') as hFileOut:
+        json.dump(cache, hFileOut)
+    os.replace(pathTmp, pathCache)
+
+@profiler.timed("analytics.daily")
+def daily_series(dirsDB, pathCache=None):
+    '''
+    Get the number of pages read per day across all books in dirsDB
+
+    Parameters
+    ----------
+    dirsDB : list of str
+        database directories, e.g. [dbJSON, dbArchive]
+    pathCache : str
+        path of the on-disk cache. If set, only JSONs whose size or mtime
+        changed since the last call are read, and the cache is updated.
+
+    Returns
+    -------
+    dict : {"yyyy-mm-dd": pages}, sorted by date
+    '''
+    cache = __load_cache(pathCache)
+    booksCache = cache["books"]
+    daily = cache["daily"]
+    fChanged = False
+    pathsSeen = set()
+
+    for dirDB in dirsDB:
+        for pathJSON in iter_book_jsons(dirDB):
+            pathsSeen.add(pathJSON)
+            st = os.stat(pathJSON)
+            stamp = [st.st_mtime_ns, st.st_size]
+            entry = booksCache.get(pathJSON, None)
+            if entry is not None and entry["stamp"] == stamp:
+                continue
+            deltas = log_to_deltas(__read_log(pathJSON))
+            if entry is not None:
+                __add_deltas(daily, entry["deltas"], sign=-1)
+            __add_deltas(daily, deltas)
+            booksCache[pathJSON] = {"stamp": stamp, "deltas": deltas}
+            fChanged = True
+
+    # books removed or moved since last time
+    for pathJSON in [p for p in booksCache if p not in pathsSeen]:
+        __add_deltas(daily, booksCache.pop(pathJSON)["deltas"], sign=-1)
+        fChanged = True
+
+    if pathCache is not None and fChanged:
+        __dump_cache(cache, pathCache)
+    return dict(sorted(daily.items()))
+
+def rollup(daily, period):
+    '''
+    Sum a daily series over weeks or months
+
+    Parameters
+    ----------
+    daily : dict
+        {"yyyy-mm-dd": pages}
+    period : str, "day", "week" or "month"
+        weeks are labeled by iso week, e.g. "2018-W43", months by "yyyy-mm"
+
+    Returns
+    -------
+    dict : {label: pages}, sorted by label
+    '''
+    __period = period.strip().lower()
+    if __period == "day":
+        return dict(sorted(daily.items()))
+    if __period == "week":
+        def label(dateStr):
+            return dt.date.fromisoformat(dateStr).strftime("%G-W%V")
+    elif __period == "month":
+        def label(dateStr):
+            return dateStr[:7]
+    else:
+        raise ValueError("period should be one of \"day\", \"week\" and \"month\".")
+    series = {}
+    for dateStr, pages in daily.items():
+        key = label(dateStr)
+        series[key] = series.get(key, 0) + pages
+    return dict(sorted(series.items()))
+
+def activity(dirsDB, dirCache=None, period="day"):
+    '''
+    Get the library-wide activity series, using the cache in dirCache
+
+    Parameters
+    ----------
+    dirsDB : list of str
+        database directories, e.g. [dbJSON, dbArchive]
+    dirCache : str
+        the cache directory, e.g. dbCache of manager. None to disable the cache
+    period : str, "day", "week" or "month"
+
+    Returns
+    -------
+    dict : {label: pages}
+    '''
+    pathCache = None
+    if dirCache is not None:
+        pathCache = os.path.join(dirCache, __nameCache)
+    return rollup(daily_series(dirsDB, pathCache), period)
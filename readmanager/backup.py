@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+'''
+Content-addressed backup store of book JSONs.
+
+Each version of a book JSON is stored once, gzip-compressed, as
+objects/<first two hex digits>/<sha256>.gz, whatever books and saves it comes from.
+The versions of each book are listed in refs/<name>.json as [time, hash] pairs, oldest first.
+A save backs up the JSON being replaced, which costs a hash check
+when that content is already in the store.
+
+Retention keeps the last keepLast versions and the latest version of each
+of the last keepDaily days with a backup. Objects no longer referred to are
+removed by prune.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import json
+import time
+from readmanager import profiler
+# gzip and hashlib are imported where used, as a library opens its store at each start-up
+
+nameBackup = "backup"
+formatTimeBackup = "%Y-%m-%d %H:%M:%S"
+
+def hash_of(content):
+    '''
+    Get the hex sha256 digest of bytes
+    '''
+    import hashlib
+    return hashlib.sha256(content).hexdigest()
+
+def write_atomic(path, content):
+    '''
+    Write bytes to path through a temporary file and os.replace
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pathTmp = path + ".tmp%d" % os.getpid()
+    with open(pathTmp, 'wb') as hFileOut:
+        hFileOut.write(content)
+    os.replace(pathTmp, path)
+
+def select_retained(refs, keepLast=10, keepDaily=30):
+    '''
+    Select the versions to keep under the retention policy
+
+    Parameters
+    ----------
+    refs : list of [str, str]
+        time and hash of versions, oldest first
+    keepLast : int
+        the number of latest versions kept
+    keepDaily : int
+        the number of latest days, each of which keeps its latest version
+
+    Returns
+    -------
+    list of [str, str] : the kept versions, oldest first
+    '''
+    kept = set(range(max(0, len(refs) - keepLast), len(refs)))
+    days = []
+    for i in range(len(refs) - 1, -1, -1):
+        day = refs[i][0][:10]
+        if day in days:
+            continue
+        if len(days) >= keepDaily:
+            break
+        days.append(day)
+        kept.add(i)
+    return [refs[i] for i in sorted(kept)]
+
+class backup_store():
+    '''
+    Backup store under a directory, usually dbJSON/.readmana/backup
+
+    attributes:
+        public:
+            dirStore : str
+            keepLast : int
+            keepDaily : int
+    '''
+
+    def __init__(self, dirStore, keepLast=10, keepDaily=30):
+        self.dirStore = dirStore
+        self.keepLast = keepLast
+        self.keepDaily = keepDaily
+
+    def __object_path(self, digest):
+        return os.path.join(self.dirStore, "objects", digest[:2], digest + ".gz")
+
+    def __refs_path(self, name):
+        return os.path.join(self.dirStore, "refs", name + ".json")
+
+    def versions(self, name):
+        '''
+        Get the backed-up versions of a book
+
+        Parameters
+        ----------
+        name : str
+            the name of book JSON without extension
+
+        Returns
+        -------
+        list of [str, str] : time and hash of versions, oldest first
+        '''
+        try:
+            with open(self.__refs_path(name), 'r') as hFileIn:
+                return json.load(hFileIn)
+        except FileNotFoundError:
+            return []
+
+    @profiler.timed("backup.backup")
+    def backup(self, name, content):
+        '''
+        Back up a version of a book JSON
+
+        Parameters
+        ----------
+        name : str
+            the name of book JSON without extension
+        content : bytes
+            the content of JSON
+
+        Returns
+        -------
+        bool : False if the content is already the latest version of the book
+        '''
+        import gzip
+        digest = hash_of(content)
+        refs = self.versions(name)
+        if refs and refs[-1][1] == digest:
+            return False
+        pathObject = self.__object_path(digest)
+        if not os.path.isfile(pathObject):
+            write_atomic(pathObject, gzip.compress(content))
+        refs.append([time.strftime(formatTimeBackup), digest])
+        refs = select_retained(refs, self.keepLast, self.keepDaily)
+        write_atomic(self.__refs_path(name), json.dumps(refs).encode("utf-8"))
+        return True
+
+    def backup_file(self, name, pathJSON):
+        '''
+        Back up the current content of a book JSON file, if it exists
+
+        Returns
+        -------
+        bool : True if a new version is recorded
+        '''
+        try:
+            with open(pathJSON, 'rb') as hFileIn:
+                content = hFileIn.read()
+        except FileNotFoundError:
+            return False
+        return self.backup(name, content)
+
+    def read(self, digest):
+        '''
+        Get the content of a version by its hash, or a unique prefix of it
+
+        Returns
+        -------
+        bytes
+        '''
+        import gzip
+        if len(digest) < 64:
+            dirObjects = os.path.join(self.dirStore, "objects", digest[:2])
+            matches = [f[:-3] for f in os.listdir(dirObjects) if f.startswith(digest)] \
+                    if os.path.isdir(dirObjects) and len(digest) >= 2 else []
+            if len(matches) != 1:
+                raise KeyError("no unique backup matches %s" % digest)
+            digest = matches[0]
+        with gzip.open(self.__object_path(digest), 'rb') as hFileIn:
+            return hFileIn.read()
+
+    def restore(self, name, pathJSON, digest=None):
+        '''
+        Restore a version of a book to pathJSON. The JSON being replaced is backed up first
+
+        Parameters
+        ----------
+        name : str
+            the name of book JSON without extension
+        pathJSON : str
+            the path to restore to
+        digest : str
+            the hash (or its prefix) of the version. None for the latest
+
+        Returns
+        -------
+        str : the hash of the restored version
+        '''
+        refs = self.versions(name)
+        if digest is None:
+            if not refs:
+                raise KeyError("no backup of %s" % name)
+            digest = refs[-1][1]
+        content = self.read(digest)
+        self.backup_file(name, pathJSON)
+        write_atomic(pathJSON, content)
+        return hash_of(content)
+
+    def prune(self):
+        '''
+        Apply the retention policy to all books and remove the objects not referred to
+
+        Returns
+        -------
+        int : the number of objects removed
+        '''
+        dirRefs = os.path.join(self.dirStore, "refs")
+        used = set()
+        if os.path.isdir(dirRefs):
+            for fileRefs in os.listdir(dirRefs):
+                if not fileRefs.endswith(".json"):
+                    continue
+                name = fileRefs[:-5]
+                refs = self.versions(name)
+                kept = select_retained(refs, self.keepLast, self.keepDaily)
+                if kept != refs:
+                    write_atomic(self.__refs_path(name), json.dumps(kept).encode("utf-8"))
+                used.update(digest for _, digest in kept)
+        nRemoved = 0
+        dirObjects = os.path.join(self.dirStore, "objects")
+        if os.path.isdir(dirObjects):
+            for dirShard in os.listdir(dirObjects):
+                for fileObject in os.listdir(os.path.join(dirObjects, dirShard)):
+                    if fileObject[:-3] not in used:
+                        os.remove(os.path.join(dirObjects, dirShard, fileObject))
+                        nRemoved += 1
+        return nRemoved
@@ -4,11 +4,14 @@ The book_item class is defined. Each book item will be a book_item instance
 '''
 
 from __future__ import print_function, absolute_import
-import json
 import os
 import time
-from shutil import copy2
+import copy
 import datetime as dt
+from readmanager.layout import book_name, is_book_json, is_compressed
+from readmanager.logcompact import full_log, compact_log, expand_log, keyCompact
+from readmanager import codec
+from readmanager import profiler
 
 # datePlan default is set to a huge value 
 # so that the default plan progress will be 0
@@ -25,6 +28,74 @@ keysMust = { \
             "tag": [], \
             }
 keysOptl = ("press", "edition", "year", "titleShort", "isbn", "url")
+# the format of time that timeLastRead and timeLastMod adapt
+formatTime = "%Y-%m-%d %X"
+# the keys whose change alone does not make a book item modified
+keysBookkeeping = ("timeLastMod", )
+
+def parse_time(timeStr):
+    '''
+    Parse the time of last read or modification
+
+    Parameters
+    ----------
+    timeStr : str or None
+
+    Returns
+    -------
+    datetime : 1900-01-01 if timeStr is null
+    '''
+    if timeStr in [None, ""]:
+        return dt.datetime(1900, 1, 1, 0, 0, 0)
+    # fromisoformat is much faster than strptime, for sorting many books
+    if len(timeStr) == 19 and timeStr[10] == " ":
+        try:
+            return dt.datetime.fromisoformat(timeStr)
+        except ValueError:
+            pass
+    return dt.datetime.strptime(timeStr, formatTime)
+
+def calculate_progress(pageCurrent, pageTotal, dateAdded, datePlan, filepath=None):
+    '''
+    Calculate the reading progress (in percentage) 
+    and the progress as planed
+
+    Parameters
+    ----------
+    pageCurrent : int
+    pageTotal : int
+    dateAdded : str
+        isoformat date when the book is added
+    datePlan : str
+        isoformat date planned to finish
+    filepath : str
+        the path of book JSON, printed when the dates are invalid
+
+    Returns
+    -------
+    int, int : reading and plan progress (in percentage)
+    '''
+    assert pageTotal != 0
+    progCurrent = float(pageCurrent) / float(pageTotal) * 100.0
+    progCurrent = int(progCurrent)
+    assert 0 <= progCurrent <= 100
+    progPlan = 0
+    try:
+        dateAdded = dt.date.fromisoformat(dateAdded)
+        datePlan = dt.date.fromisoformat(datePlan)
+        today = dt.date.today()
+        assert datePlan - dateAdded > dt.timedelta()
+        assert today - dateAdded >= dt.timedelta()
+        progPlan = (today - dateAdded) / (datePlan - dateAdded) * 100
+        progPlan = int(progPlan)
+    except AssertionError:
+        print("in %s:" % filepath)
+        raise ValueError("datePlan is earlier than dateAdded, or dateAdded later than today")
+    except ValueError:
+        print("in %s:" % filepath)
+        raise ValueError("check whether the date keys are in iso format, i.e. YYYY-MM-DD")
+
+    return progCurrent, progPlan
 
 # book_item
 class book_item():
@@ -34,7 +105,11 @@ class book_item():
         private:
             __fMod : bool
                 the flag to mark if the information contained in __jsonDict
-                is different from those of the initial load of JSON file
+                is different from those of the initial load of JSON file,
+                i.e. if any key other than keysBookkeeping is dirty
+            __dirty : dict
+                the keys changed since the JSON file is loaded or saved -> their
+                values at that time. A key absent then is marked by __absent
             __keysMust : dict
                 the keys in dictionary are the keys that the JSON file 
                 MUST include, even though they can be null. the values are 
@@ -47,7 +122,11 @@ class book_item():
                 of the book item
             __formatTime : str
                 the format of time that timeLastRead and timeLastMod adapt.
+            __storage : str
+                the storage of JSON file, "pretty", "compact" or "gzip". See codec
         public:
+            revision : int
+                increased at each modification, e.g. for views to re-evaluate changed books only
             title : str
                 the title of the book
             pageTotal : str
@@ -58,38 +137,46 @@ class book_item():
 
     __keysMust = keysMust
     __keysOptl = keysOptl
-    __formatTime = "%Y-%m-%d %X"
+    __formatTime = formatTime
+    __absent = object()
     noteSupportType = ["md", "tex", "txt", "docx"]
 
     # private methods
-    def __init__(self, jsonfile, create_new=False):
-        self.__readjson(jsonfile, create_new)
-        self.__fMod = False
+    def __init__(self, jsonfile, create_new=False, storage="pretty"):
+        self.__readjson(jsonfile, create_new, storage)
+        self.__dirty = {}
+        self.revision = 0
         self.__check_keysMust()
         self.__update_public_attr()
 
-    def __readjson(self, jsonfile, create_new):
+    @profiler.timed("bookitem.readjson")
+    def __readjson(self, jsonfile, create_new, storage):
         '''
         Read and decode the JSON file
 
         Parameters
         ----------
         jsonfile : str
-            the file name of JSON input
+            the file name of JSON input, with .json or .json.gz extension
 
         create_new : bool
             flag to create a new #empty json file by __dump_json
             if set true, the original JSON will be overwritten
+        storage : str
+            the storage of new JSON file. That of an existing file is detected
         '''
-        assert os.path.splitext(jsonfile)[1] == '.json'
+        assert is_book_json(jsonfile)
         if create_new:
             # deal with duplicate outside
             assert not os.path.isfile(jsonfile)
             self.__jsonDict = {}
+            self.__storage = "gzip" if is_compressed(jsonfile) else storage
             #self.__dump_json(jsonfile, overwrite=True)
         else:
-            with open(jsonfile, 'r') as hFileIn:
-                self.__jsonDict = json.load(hFileIn)
+            with open(jsonfile, 'rb') as hFileIn:
+                content = hFileIn.read()
+            self.__jsonDict = codec.decode(content)
+            self.__storage = codec.storage_of(content)
         # absolute path is used
         self.filepath = os.path.abspath(jsonfile)
 
@@ -102,36 +189,53 @@ class book_item():
         self.pageCurrent = self.__jsonDict["pageCurrent"]
         self.noteLocation = self.__jsonDict["noteLocation"]
 
+    @profiler.timed("bookitem.check_keysMust")
     def __check_keysMust(self):
         '''
         Check if all member in keysMust exist in __jsonDict dictionatry
         if tag does not exist, add k-v pair {tag: None} to __jsonDict
         '''
-        # record the original __jsonDict
-        tagDictOrig = self.__jsonDict.copy()
-        # check members in keysMust
         for tag in self.__keysMust:
-            self.__jsonDict.setdefault(tag, self.__keysMust[tag])
-        if self.__jsonDict != tagDictOrig:
-            self.__fMod = True
+            if tag not in self.__jsonDict:
+                self.__dirty[tag] = self.__absent
+                # not to share the mutable defaults between book items
+                self.__jsonDict[tag] = copy.deepcopy(self.__keysMust[tag])
+
+    @property
+    def __fMod(self):
+        return any(key not in keysBookkeeping for key in self.__dirty)
 
-    def __dump_json(self, jsonout, overwrite=False):
+    @profiler.timed("bookitem.dump_json")
+    def __dump_json(self, jsonout, overwrite=False, store=None):
         '''
         Dump the __jsonDict to a JSON file
-        If the JSON file exists and overwrite is False, back up it with _bak suffix
+        If the JSON file exists and overwrite is False, back up it to the backup store.
+        The file is not written again if its content is unchanged.
+        The changes are cleared once the file is written, so that they are kept if it fails
 
         Parameters
         ----------
         jsonout : str
             the file name of output JSON
         overwrite : bool
-            flag to overwrite file if jsonout exists
-
+            flag to overwrite file if jsonout exists without backup
+        store : backup_store instance
+            None for no backup
         '''
-        if os.path.isfile(jsonout) and not overwrite:
-            copy2(jsonout, jsonout.strip()+'_bak')
-        with open(jsonout, 'w') as hFileOut:
-            json.dump(self.__jsonDict, hFileOut, indent=2)
+        content = codec.encode(self.__jsonDict, self.__storage)
+        try:
+            with open(jsonout, 'rb') as hFileIn:
+                contentOld = hFileIn.read()
+        except FileNotFoundError:
+            contentOld = None
+        if contentOld == content:
+            self.__dirty.clear()
+            return
+        if contentOld is not None and not overwrite and store is not None:
+            store.backup(book_name(jsonout), contentOld)
+        with open(jsonout, 'wb') as hFileOut:
+            hFileOut.write(content)
+        self.__dirty.clear()
 
     def __calculate_progress(self):
         '''
@@ -143,27 +247,8 @@ class book_item():
         int, int : reading and plan progress (in percentage)
 
         '''
-        assert self.pageTotal != 0
-        progCurrent = float(self.pageCurrent) / float(self.pageTotal) * 100.0
-        progCurrent = int(progCurrent)
-        assert 0 <= progCurrent <= 100
-        progPlan = 0
-        try:
-            dateAdded = dt.date.fromisoformat(self.__jsonDict["dateAdded"])
-            datePlan = dt.date.fromisoformat(self.__jsonDict["datePlan"])
-            today = dt.date.today()
-            assert datePlan - dateAdded > dt.timedelta()
-            assert today - dateAdded >= dt.timedelta()
-            progPlan = (today - dateAdded) / (datePlan - dateAdded) * 100
-            progPlan = int(progPlan)
-        except AssertionError:
-            print("in %s:" % self.filepath)
-            raise ValueError("datePlan is earlier than dateAdded, or dateAdded later than today")
-        except ValueError:
-            print("in %s:" % self.filepath)
-            raise ValueError("check whether the date keys are in iso format, i.e. YYYY-MM-DD")
-
-        return progCurrent, progPlan
+        return calculate_progress(self.pageCurrent, self.pageTotal, \
+                self.__jsonDict["dateAdded"], self.__jsonDict["datePlan"], self.filepath)
 
     def __change_key(self, key, newValue):
         '''
@@ -180,12 +265,41 @@ class book_item():
         assert key != "tag"
         assert key != "remark"
         assert self.__check_key_exist(key)
-        oldValue = self.__jsonDict[key]
-        self.__jsonDict.update({key: newValue})
-        if newValue != oldValue:
-            self.__fMod = True
-            self.__update_public_attr()
-            self.update_last_time("mod")
+        if newValue == self.__jsonDict[key]:
+            return
+        self.__touch(key)
+        self.__jsonDict[key] = newValue
+        self.__mark_mod(key)
+        self.__update_public_attr()
+        self.update_last_time("mod")
+
+    def __touch(self, key, fCopy=True):
+        '''
+        Record the value of key before it is changed, if not dirty yet.
+        The value is copied unless fCopy is False, i.e. it will be replaced but not changed in place
+        '''
+        if key not in self.__dirty:
+            if key not in self.__jsonDict:
+                self.__dirty[key] = self.__absent
+            else:
+                value = self.__jsonDict[key]
+                self.__dirty[key] = copy.deepcopy(value) if fCopy else value
+
+    def __mark_mod(self, *keys):
+        '''
+        Mark keys changed after __touch, and increase the revision.
+        A key changed back to its recorded value is no longer dirty
+        '''
+        self.revision += 1
+        self.__settle(*keys)
+
+    def __settle(self, *keys):
+        '''
+        Clean the keys changed back to their recorded values
+        '''
+        for key in keys:
+            if self.__jsonDict.get(key, self.__absent) == self.__dirty[key]:
+                del self.__dirty[key]
 
     def __add_key(self, key, value):
         '''
@@ -199,8 +313,9 @@ class book_item():
             the value of the new key
         '''
         assert not self.__check_key_exist(key)
-        self.__jsonDict.update({key: value})
-        self.__fMod = True
+        self.__touch(key)
+        self.__jsonDict[key] = value
+        self.__mark_mod(key)
         self.update_last_time("mod")
 
     def __check_key_exist(self, key):
@@ -231,10 +346,25 @@ class book_item():
         
         Returns
         -------
-        int or str or list or dict : the value of the key if it exists, otherwise None
+        int or str or list or dict : the value of the key if it exists, otherwise None.
+            For "log", the complete log including the compacted entries
         '''
+        if key == "log":
+            return full_log(self.__jsonDict)
         return self.__jsonDict.get(key, None)
 
+    def get_changes(self):
+        '''
+        Get the keys changed since the JSON file is loaded or saved,
+        e.g. to write only the changed fields or to make a patch
+
+        Returns
+        -------
+        dict : key -> (old value, new value). The old value is None for a key added
+        '''
+        return {key: (None if old is self.__absent else old, self.__jsonDict.get(key, None)) \
+                for key, old in self.__dirty.items()}
+
     def get_tag(self):
         '''
         get the tag of book item
@@ -365,7 +495,7 @@ class book_item():
             return pathExt.lower()
         return self.__jsonDict["bookLocalSource"]
 
-    def update_last_time(self, timeType):
+    def update_last_time(self, timeType, timeSec=None):
         '''
         update the key of last time of read or modification with current time
         
@@ -373,6 +503,8 @@ class book_item():
         ----------
         timeType : str
             "read" for "timeLastRead", "mod" for "timeLastMod"
+        timeSec : float
+            seconds since the epoch to use instead of current time, e.g. the mtime of note
         '''
         try:
             __timeType = timeType.strip().lower()
@@ -380,7 +512,7 @@ class book_item():
                 __key = "timeLastRead"
             elif __timeType.startswith("mod"):
                 __key = "timeLastMod"
-            self.__change_key(__key, time.strftime(self.__formatTime))
+            self.__change_key(__key, time.strftime(self.__formatTime, time.localtime(timeSec)))
         except AttributeError:
             pass
 
@@ -407,9 +539,7 @@ class book_item():
         else:
             raise ValueError("timeType should be either \"read\" or \"mod\".")
        
-        if self.__jsonDict[__key] in [None, ""]:
-            return dt.datetime(1900, 1, 1, 0, 0, 0)
-        return dt.datetime.strptime(self.__jsonDict[__key], self.__formatTime)
+        return parse_time(self.__jsonDict[__key])
 
 
     #def get_last_read(self):
@@ -524,9 +654,48 @@ class book_item():
         Update the log dictionary with {"yyyy-mm-dd": self.pageCurrent} 
         the date stamp in iso format is generated by datetime.date.today()
         '''
-        self.__jsonDict["log"].update({str(dt.date.today()): self.pageCurrent})
-        # hard to tell if the log is really updated. Let's say it is
-        self.__fMod = True
+        __today = str(dt.date.today())
+        if self.__jsonDict["log"].get(__today, None) == self.pageCurrent:
+            return
+        self.__touch("log")
+        self.__jsonDict["log"][__today] = self.pageCurrent
+        self.__mark_mod("log")
+
+    def compact_log(self, keepDays=90):
+        '''
+        Compact the log entries older than keepDays days. See logcompact module
+
+        Returns
+        -------
+        int : the number of entries compacted
+        '''
+        # the values are replaced by new ones, not changed in place
+        self.__touch("log", fCopy=False)
+        self.__touch(keyCompact, fCopy=False)
+        nMoved = compact_log(self.__jsonDict, keepDays)
+        if nMoved:
+            self.__mark_mod("log", keyCompact)
+        else:
+            self.__settle("log", keyCompact)
+        return nMoved
+
+    def expand_log(self):
+        '''
+        Expand the compacted log entries back to the log
+
+        Returns
+        -------
+        int : the number of entries expanded
+        '''
+        # the values are replaced by new ones, not changed in place
+        self.__touch("log", fCopy=False)
+        self.__touch(keyCompact, fCopy=False)
+        nMoved = expand_log(self.__jsonDict)
+        if nMoved:
+            self.__mark_mod("log", keyCompact)
+        else:
+            self.__settle("log", keyCompact)
+        return nMoved
 
     def update_tag(self, listTag, fAdd=True):
         '''
@@ -541,14 +710,16 @@ class book_item():
         for tag in listTag:
             if tag:
                 if fAdd and tag not in __bookTag:
+                    self.__touch("tag")
                     self.__jsonDict["tag"].append(tag)
-                    self.__fMod = True
+                    self.__mark_mod("tag")
                 elif not fAdd and tag in __bookTag:
                     i = self.__jsonDict["tag"].index(tag)
+                    self.__touch("tag")
                     del self.__jsonDict["tag"][i]
-                    self.__fMod = True
+                    self.__mark_mod("tag")
 
-    def update_json(self, overwrite=False):
+    def update_json(self, overwrite=False, store=None):
         '''
         Update the json file with current __jsonDict
         only when the __jsonDict has been modified
@@ -556,12 +727,33 @@ class book_item():
         Parameters
         ----------
         overwrite : bool
-            flag to overwrite the originial JSON file
+            flag to overwrite the originial JSON file without backup
+        store : backup_store instance
+            the store to back up the originial JSON file, None for no backup
         '''
         if self.__fMod:
             self.update_last_time("mod")
-            self.__fMod = False
-            self.__dump_json(self.filepath, overwrite)
+            self.__dump_json(self.filepath, overwrite, store)
+
+    def relocate(self, pathNew):
+        '''
+        Move the JSON file of book item to pathNew atomically by os.replace.
+        If the JSON has not been saved yet, only the file path is changed.
+
+        Parameters
+        ----------
+        pathNew : str
+            the new path of JSON file, which should not exist
+        '''
+        pathNew = os.path.abspath(pathNew)
+        if pathNew == self.filepath:
+            return
+        if os.path.exists(pathNew):
+            raise FileExistsError("JSON exists at the destination: %s" % pathNew)
+        os.makedirs(os.path.dirname(pathNew), exist_ok=True)
+        if os.path.isfile(self.filepath):
+            os.replace(self.filepath, pathNew)
+        self.filepath = pathNew
 
     def update_remark(self, strRemark):
         '''
@@ -577,10 +769,11 @@ class book_item():
             return
 
         strToday = str(dt.date.today())
+        self.__touch("remark")
         remarkToday = self.__jsonDict['remark'].get(strToday, False)
         if remarkToday:
             remarkToday.append(strRemark)
         else:
             self.__jsonDict["remark"].update({strToday:[strRemark]})
-        self.__fMod = True
+        self.__mark_mod("remark")
 
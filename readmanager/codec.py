@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+'''
+JSON codec of book JSONs.
+
+orjson is used when it is installed, otherwise the stdlib json module.
+It is imported on first use, as importing it takes longer than the check mode needs the codec.
+The backend can be forced by the READMANA_CODEC environment variable ("orjson" or "json").
+
+Two output modes are provided:
+    pretty : the bytes of json.dumps(obj, indent=2), to keep the files
+        stable and easy to edit by hand whichever backend writes them
+    compact : no indent or spaces, non-ASCII characters unescaped
+
+A book JSON is stored in one of the storages: "pretty", "compact",
+or "gzip" for gzip-compressed compact JSON with .json.gz extension.
+Reading detects the storage from the content.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import re
+import json
+import math
+import struct
+import codecs
+from importlib.machinery import PathFinder
+from readmanager.layout import iter_book_jsons, is_compressed, extsBook
+
+# the orjson module once imported, see __orjson
+orjson = None
+hasOrjson = PathFinder.find_spec("orjson") is not None
+
+backends = ("orjson", "json")
+storages = ("pretty", "compact", "gzip")
+__magicGzip = b"\x1f\x8b"
+# floats written differently, e.g. 1e+16 by json and 1e16 by orjson,
+# or 1e-05 by json and 0.00001 by orjson.
+# Matches in strings only make the slower json backend used
+__reExponent = re.compile(rb'e[-+]?[0-9]')
+__smallFloat = b"0.0000"
+
+def __has_nonfinite(obj):
+    '''
+    Check if obj holds NaN or infinity, which orjson writes as null
+    '''
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(__has_nonfinite(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(__has_nonfinite(value) for value in obj)
+    return False
+
+def __orjson():
+    '''
+    Get the orjson module, imported on the first call
+    '''
+    global orjson
+    if orjson is None:
+        import orjson as module
+        orjson = module
+    return orjson
+
+def __default_backend():
+    backend = os.environ.get("READMANA_CODEC", None)
+    if backend in backends:
+        if backend == "orjson" and not hasOrjson:
+            raise ImportError("READMANA_CODEC is orjson, but orjson is not installed")
+        return backend
+    return "orjson" if hasOrjson else "json"
+
+backend = __default_backend()
+
+def set_backend(name):
+    '''
+    Choose the backend, "orjson" or "json"
+    '''
+    global backend
+    if name not in backends:
+        raise ValueError("backend should be one of %s" % ", ".join(backends))
+    if name == "orjson" and not hasOrjson:
+        raise ImportError("orjson is not installed")
+    backend = name
+
+def __escape_non_ascii(err):
+    '''
+    Encoding error handler to escape non-ASCII characters as json.dumps does
+    with ensure_ascii, i.e. each UTF-16 code unit as \\uxxxx
+    '''
+    units = err.object[err.start:err.end].encode("utf-16-be")
+    return ('\\u%04x' * (len(units) // 2)) % struct.unpack(">%dH" % (len(units) // 2), units), \
+            err.end
+
+codecs.register_error("readmana.json", __escape_non_ascii)
+
+def loads(content):
+    '''
+    Decode a JSON document
+
+    Parameters
+    ----------
+    content : bytes or str
+
+    Returns
+    -------
+    the decoded object
+    '''
+    if backend == "orjson":
+        try:
+            return __orjson().loads(content)
+        except orjson.JSONDecodeError:
+            # e.g. NaN accepted by json, or to raise the error of json
+            pass
+    return json.loads(content)
+
+def load_path(path):
+    '''
+    Decode the JSON file at path, either compressed or not
+    '''
+    with open(path, 'rb') as hFileIn:
+        return decode(hFileIn.read())
+
+def decode(content):
+    '''
+    Decode the content of a book JSON in any storage
+
+    Parameters
+    ----------
+    content : bytes
+
+    Returns
+    -------
+    the decoded object
+    '''
+    if content[:2] == __magicGzip:
+        import gzip
+        content = gzip.decompress(content)
+    return loads(content)
+
+def storage_of(content):
+    '''
+    Detect the storage of the content of a book JSON
+
+    Parameters
+    ----------
+    content : bytes
+
+    Returns
+    -------
+    str : "pretty", "compact" or "gzip"
+    '''
+    if content[:2] == __magicGzip:
+        return "gzip"
+    if content[:2] == b"{\n" or content.strip() == b"{}":
+        return "pretty"
+    return "compact"
+
+def encode(obj, storage="pretty"):
+    '''
+    Encode a book JSON for storage
+
+    Parameters
+    ----------
+    obj : dict
+    storage : str, "pretty", "compact" or "gzip"
+
+    Returns
+    -------
+    bytes
+    '''
+    if storage == "pretty":
+        return dumps(obj, pretty=True)
+    if storage == "compact":
+        return dumps(obj, pretty=False)
+    if storage == "gzip":
+        import io
+        import gzip
+        # no time stamp, so that unchanged books give the same bytes.
+        # By GzipFile, as gzip.compress takes mtime from Python 3.8
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb", mtime=0) as hFileOut:
+            hFileOut.write(dumps(obj, pretty=False))
+        return buf.getvalue()
+    raise ValueError("storage should be one of %s" % ", ".join(storages))
+
+def convert(dirDB, storage, verbose=True):
+    '''
+    Convert all book JSONs in dirDB to storage.
+    The extension is changed to .json.gz for "gzip" and to .json otherwise.
+    Each file is written to a temporary file and moved by os.replace
+
+    Parameters
+    ----------
+    dirDB : str
+    storage : str, "pretty", "compact" or "gzip"
+    verbose : bool
+
+    Returns
+    -------
+    int : the number of JSONs converted
+    '''
+    assert storage in storages
+    nConverted = 0
+    for pathJSON in list(iter_book_jsons(dirDB)):
+        with open(pathJSON, 'rb') as hFileIn:
+            content = hFileIn.read()
+        if storage_of(content) == storage and is_compressed(pathJSON) == (storage == "gzip"):
+            continue
+        extOld = extsBook[0 if is_compressed(pathJSON) else 1]
+        pathNew = pathJSON[:-len(extOld)] + extsBook[0 if storage == "gzip" else 1]
+        if pathNew != pathJSON and os.path.exists(pathNew):
+            raise FileExistsError("JSON exists at the destination: %s" % pathNew)
+        pathTmp = pathNew + ".tmp%d" % os.getpid()
+        with open(pathTmp, 'wb') as hFileOut:
+            hFileOut.write(encode(decode(content), storage))
+        os.replace(pathTmp, pathNew)
+        if pathNew != pathJSON:
+            os.remove(pathJSON)
+        nConverted += 1
+    if verbose:
+        print("--  %d JSONs converted to %s storage in %s" % (nConverted, storage, dirDB))
+    return nConverted
+
+def dumps(obj, pretty=True):
+    '''
+    Encode an object to JSON
+
+    Parameters
+    ----------
+    obj : JSON-serializable object
+    pretty : bool
+        True for the output of json.dumps(obj, indent=2), False for compact output
+
+    Returns
+    -------
+    bytes : utf-8 encoded JSON
+    '''
+    if backend == "orjson":
+        try:
+            content = __orjson().dumps(obj, option=orjson.OPT_INDENT_2 if pretty else None)
+        except TypeError:
+            # e.g. non-str keys or integers out of 64 bit
+            content = None
+        if content is not None and b"null" in content and __has_nonfinite(obj):
+            content = None
+        if content is not None and not pretty:
+            return content
+        if content is not None and __smallFloat not in content \
+                and not __reExponent.search(content):
+            if not content.isascii():
+                content = content.decode("utf-8").encode("ascii", "readmana.json")
+            # DEL is ASCII but escaped by json.dumps. It only appears in strings
+            return content.replace(b"\x7f", b"\\u007f")
+    if pretty:
+        return json.dumps(obj, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
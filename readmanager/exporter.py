@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming export of the catalog, logs and remarks of book items.
+
+Book JSONs are read one at a time through a generator pipeline and written
+to JSON-lines, CSV or a normalized set of CSV tables (books, logs, remarks, tags),
+so the memory stays constant regardless of the size of library.
+Outputs can be gzip-compressed.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import csv
+import gzip
+import json
+from copy import deepcopy
+from readmanager.bookitem import keysMust, keysOptl
+from readmanager.layout import iter_book_jsons, book_name
+from readmanager.logcompact import full_log, keyCompact
+from readmanager import codec
+from readmanager import profiler
+
+# columns of the flat and books tables. log, remark and tag are handled separately
+columnsBook = ["name", "shelf"] + \
+        [key for key in keysMust if key not in ["log", "remark", "tag"]] + list(keysOptl)
+
+def fill_defaults(dictBook):
+    '''
+    Fill the keys in keysMust missing from a book dictionary with their defaults
+
+    Parameters
+    ----------
+    dictBook : dict
+
+    Returns
+    -------
+    dict : the same dictionary, filled
+    '''
+    for key, value in keysMust.items():
+        if key not in dictBook:
+            dictBook[key] = deepcopy(value)
+    return dictBook
+
+def iter_books(shelves):
+    '''
+    Stream the book dictionaries with keysMust defaults filled
+
+    Parameters
+    ----------
+    shelves : list of (str, str)
+        the shelf label and the database directory, e.g. [("shelf", dbJSON), ("archive", dbArchive)]
+
+    Returns
+    -------
+    generator of (str, str, dict) : shelf label, name of JSON without extension, book dictionary
+    '''
+    for shelf, dirDB in shelves:
+        for pathJSON in iter_book_jsons(dirDB):
+            dictBook = codec.load_path(pathJSON)
+            dictBook["log"] = full_log(dictBook)
+            dictBook.pop(keyCompact, None)
+            yield shelf, book_name(pathJSON), fill_defaults(dictBook)
+
+def __open_out(pathOut, fCompress):
+    '''
+    Open the output file for text writing, gzip-compressed if fCompress
+    '''
+    if fCompress:
+        return gzip.open(pathOut, 'wt', newline='', encoding='utf-8')
+    return open(pathOut, 'w', newline='', encoding='utf-8')
+
+def __book_row(shelf, name, dictBook):
+    '''
+    Flatten a book to a row of columnsBook
+    '''
+    row = dict(dictBook, name=name, shelf=shelf)
+    return [row.get(column, None) for column in columnsBook]
+
+def __write_jsonl(books, hFileOut):
+    '''
+    write one JSON object per book, with name and shelf keys added
+    '''
+    n = 0
+    for shelf, name, dictBook in books:
+        record = dict(dictBook, name=name, shelf=shelf)
+        hFileOut.write(codec.dumps(record, pretty=False).decode("utf-8") + "\n")
+        n += 1
+    return n
+
+def __write_csv(books, hFileOut):
+    '''
+    write one CSV row per book. tags are joined by "; ", log and remark are JSON-encoded
+    '''
+    writer = csv.writer(hFileOut)
+    writer.writerow(columnsBook + ["tag", "log", "remark"])
+    n = 0
+    for shelf, name, dictBook in books:
+        writer.writerow(__book_row(shelf, name, dictBook) + [ \
+                "; ".join(dictBook["tag"] or []), \
+                json.dumps(dictBook["log"] or {}, ensure_ascii=False), \
+                json.dumps(dictBook["remark"] or {}, ensure_ascii=False), \
+                ])
+        n += 1
+    return n
+
+def __write_tables(books, writers):
+    '''
+    write books, log entries, remarks and tags to separate tables, linked by name
+    '''
+    writers["books"].writerow(columnsBook)
+    writers["logs"].writerow(["name", "date", "page"])
+    writers["remarks"].writerow(["name", "date", "remark"])
+    writers["tags"].writerow(["name", "tag"])
+    n = 0
+    for shelf, name, dictBook in books:
+        writers["books"].writerow(__book_row(shelf, name, dictBook))
+        for dateStr, page in sorted((dictBook["log"] or {}).items()):
+            writers["logs"].writerow([name, dateStr, page])
+        for dateStr, remarks in sorted((dictBook["remark"] or {}).items()):
+            for remark in remarks:
+                writers["remarks"].writerow([name, dateStr, remark])
+        for tag in dictBook["tag"] or []:
+            writers["tags"].writerow([name, tag])
+        n += 1
+    return n
+
+@profiler.timed("exporter.export")
+def export_books(pathOut, shelves, fmt="jsonl", fCompress=None):
+    '''
+    Export books to pathOut
+
+    Parameters
+    ----------
+    pathOut : str
+        the output file for "jsonl" and "csv" formats,
+        or the output directory for "tables", where books.csv, logs.csv,
+        remarks.csv and tags.csv are written
+    shelves : list of (str, str)
+        the shelf label and the database directory, see iter_books
+    fmt : str, "jsonl", "csv" or "tables"
+    fCompress : bool
+        gzip the output(s). None to compress if pathOut ends with ".gz"
+
+    Returns
+    -------
+    int : the number of books exported
+    '''
+    if fCompress is None:
+        fCompress = pathOut.lower().endswith(".gz")
+    books = iter_books(shelves)
+    if fmt == "jsonl":
+        with __open_out(pathOut, fCompress) as hFileOut:
+            return __write_jsonl(books, hFileOut)
+    if fmt == "csv":
+        with __open_out(pathOut, fCompress) as hFileOut:
+            return __write_csv(books, hFileOut)
+    if fmt == "tables":
+        os.makedirs(pathOut, exist_ok=True)
+        ext = ".csv.gz" if fCompress else ".csv"
+        handles = {}
+        try:
+            for table in ["books", "logs", "remarks", "tags"]:
+                handles[table] = __open_out(os.path.join(pathOut, table + ext), fCompress)
+            return __write_tables(books, {k: csv.writer(h) for k, h in handles.items()})
+        finally:
+            for h in handles.values():
+                h.close()
+    raise ValueError("fmt should be one of \"jsonl\", \"csv\" and \"tables\".")
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+'''
+Libraries federated into one shelf.
+
+Besides its own dbJSON and dbNote, the home library of a config can list other libraries,
+e.g. one shared by a lab, in the optional key "libraries" as name -> path of their config.json,
+or of the directory containing it:
+    "libraries": {"lab": "/shared/lab/readmana/config.json"}
+Each library keeps its own archive, cache, backup store and catalog snapshot under its dbJSON,
+so that it can still be used alone. The name of the home library is set by the key "name",
+"home" by default.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+from readmanager.backup import backup_store, nameBackup
+from readmanager.snapshot import nameSnapshot
+
+nameHome = "home"
+
+def config_path_of(path):
+    '''
+    Get the path of config.json of a library, given either itself or its directory
+    '''
+    path = os.path.expanduser(os.path.expandvars(path))
+    if os.path.isdir(path):
+        path = os.path.join(path, "config.json")
+    return path
+
+class library():
+    '''
+    A library root, i.e. the databases of one config
+
+    attributes:
+        public:
+            name : str
+            pathConfig : str
+            dbJSON, dbNote, dbArchive, dbCache : str
+                the databases, see manager.load_config
+            pathSnapshot : str
+                the catalog snapshot of the books on its shelf
+            layout : str
+            storage : str
+            backup : backup_store instance
+    '''
+
+    def __init__(self, name, pathConfig, dictConfig):
+        '''
+        Parameters
+        ----------
+        name : str
+        pathConfig : str
+        dictConfig : dict
+            the config loaded by manager.load_config
+        '''
+        self.name = name
+        self.pathConfig = pathConfig
+        self.dbJSON = dictConfig["dbJSON"]
+        self.dbNote = dictConfig["dbNote"]
+        self.dbArchive = dictConfig["dbArchive"]
+        self.dbCache = dictConfig["dbCache"]
+        self.pathSnapshot = os.path.join(self.dbCache, nameSnapshot)
+        self.layout = dictConfig["layout"]
+        self.storage = dictConfig["storage"]
+        # e.g. "backup": {"keepLast": 10, "keepDaily": 30}
+        self.backup = backup_store(os.path.join(self.dbCache, nameBackup), \
+                **dictConfig.get("backup", {}))
+        os.makedirs(self.dbArchive, exist_ok=True)
+        self.__prefix = os.path.join(os.path.abspath(self.dbJSON), "")
+
+    def owns(self, path):
+        '''
+        Check if the book JSON at path is in this library, on the shelf or in the archive
+        '''
+        return os.path.abspath(path).startswith(self.__prefix)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Forecast of reading velocity and finish date of book items from their logs.
+
+The velocity is the weighted moving average of pages read per day over a recent window,
+with linearly increasing weights toward today. Days without reading count as zero.
+'''
+
+from __future__ import print_function, absolute_import
+import math
+import datetime as dt
+from readmanager import profiler
+
+nDaysWindow = 28
+
+def velocity(log, today=None, nDays=nDaysWindow):
+    '''
+    Estimate the recent reading velocity from a book log
+
+    Only the snapshots inside the window, plus the last one before it
+    as the baseline, are sorted, so the cost is linear in the log length.
+
+    Parameters
+    ----------
+    log : dict
+        {"yyyy-mm-dd": page}
+    today : date
+        the end of the window, default datetime.date.today()
+    nDays : int
+        the length of the window in days
+
+    Returns
+    -------
+    float : pages per day
+    '''
+    # not imported by the presenter, which shows the forecast only on demand
+    from readmanager.analytics import log_to_deltas
+    if not log:
+        return 0.0
+    if today is None:
+        today = dt.date.today()
+    dateCut = str(today - dt.timedelta(days=nDays - 1))
+    # baseline: the last snapshot before the window
+    dateBase = None
+    window = {}
+    for dateStr, page in log.items():
+        if dateStr >= dateCut:
+            window[dateStr] = page
+        elif dateBase is None or dateStr > dateBase:
+            dateBase = dateStr
+    if not window:
+        return 0.0
+    if dateBase is not None:
+        window[dateBase] = log[dateBase]
+    deltas = log_to_deltas(window)
+    if dateBase is not None:
+        # the baseline itself is not read inside the window
+        deltas.pop(dateBase, None)
+        nSpan = nDays
+    else:
+        # a book started inside the window is averaged from its first log
+        nSpan = (today - dt.date.fromisoformat(min(window))).days + 1
+    nSpan = max(1, min(nSpan, nDays))
+    # weight of a day is nSpan for today, down to 1 for the first day in span
+    sumWeight = nSpan * (nSpan + 1) / 2.0
+    sumPages = 0.0
+    for dateStr, pages in deltas.items():
+        age = (today - dt.date.fromisoformat(dateStr)).days
+        if 0 <= age < nSpan:
+            sumPages += (nSpan - age) * pages
+    return sumPages / sumWeight
+
+def forecast_finish(bi, today=None, nDays=nDaysWindow):
+    '''
+    Forecast the finish date of a book item
+
+    Parameters
+    ----------
+    bi : book_item instance
+    today : date
+    nDays : int
+        the length of the window to estimate velocity
+
+    Returns
+    -------
+    float, date or None, bool : velocity in pages per day, forecast finish date
+        and the flag if the forecast misses datePlan.
+        For a finished book, the finish date is the date of its last log.
+        The finish date is None if the velocity is zero and the book is not finished.
+    '''
+    if today is None:
+        today = dt.date.today()
+    pageRemain = bi.pageTotal - bi.pageCurrent
+    log = bi.get_key("log") or {}
+    v = velocity(log, today, nDays)
+    if pageRemain <= 0:
+        # finished at the last log, if any
+        if log:
+            return v, dt.date.fromisoformat(max(log)), False
+        return v, today, False
+    try:
+        datePlan = dt.date.fromisoformat(bi.get_key("datePlan"))
+    except (TypeError, ValueError):
+        datePlan = dt.date.max
+    if v <= 0.0:
+        return v, None, datePlan != dt.date.max
+    nDaysLeft = int(math.ceil(pageRemain / v))
+    try:
+        dateFinish = today + dt.timedelta(days=nDaysLeft)
+    except OverflowError:
+        dateFinish = dt.date.max
+    return v, dateFinish, dateFinish > datePlan
+
+@profiler.timed("forecast.all")
+def forecast_all(bm, today=None, nDays=nDaysWindow):
+    '''
+    Forecast the finish dates of all books of a manager
+
+    Parameters
+    ----------
+    bm : manager instance
+    today : date
+    nDays : int
+
+    Returns
+    -------
+    list of tuple : (velocity, finish date, late flag) for each book, see forecast_finish
+    '''
+    if today is None:
+        today = dt.date.today()
+    return [forecast_finish(bi, today, nDays) for bi in bm.books]
+
+def forecast_str(fc):
+    '''
+    Format a forecast tuple to show in the presenter
+
+    Parameters
+    ----------
+    fc : tuple
+        (velocity, finish date, late flag)
+
+    Returns
+    -------
+    str : "-" if no pace, otherwise the iso finish date,
+        with "!" appended if the forecast misses datePlan
+    '''
+    v, dateFinish, fLate = fc
+    marker = "!" if fLate else " "
+    if dateFinish is None:
+        return "-" + marker
+    if dateFinish == dt.date.max:
+        return "never" + marker
+    return str(dateFinish) + marker
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+'''
+Typo-tolerant fuzzy search by a trigram index.
+
+Texts are lowered and stripped of accents, and split to words at non-alphanumeric
+characters and underscores. Each word is padded by two spaces in front and one behind,
+from which the trigrams are taken.
+A candidate is scored by the fraction of the query trigrams it contains,
+ties broken by the Jaccard similarity of the trigram sets.
+Only the postings of the query trigrams are visited for a query.
+'''
+
+from __future__ import print_function, absolute_import
+import re
+import math
+import unicodedata
+from collections import Counter
+from itertools import chain
+from readmanager import profiler
+
+def normalize(text):
+    '''
+    Lower the text and strip the accents, e.g. "Schrödinger" to "schrodinger"
+    '''
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def trigrams(text):
+    '''
+    Get the set of trigrams of a text
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    set of str
+    '''
+    grams = set()
+    for word in re.split(r'[\W_]+', normalize(text)):
+        if not word:
+            continue
+        padded = "  " + word + " "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+class trigram_index():
+    '''
+    Trigram index of items, each described by a few texts
+
+    attributes:
+        private:
+            __postings : dict
+                trigram -> set of items containing it
+            __grams : dict
+                item -> set of its trigrams
+    '''
+
+    def __init__(self):
+        self.__postings = {}
+        self.__grams = {}
+
+    def __len__(self):
+        return len(self.__grams)
+
+    def __contains__(self, item):
+        return item in self.__grams
+
+    def add(self, item, texts):
+        '''
+        Add or update an item
+
+        Parameters
+        ----------
+        item : hashable
+            e.g. a book_item instance
+        texts : list of str
+            the texts to index, None members are skipped
+        '''
+        grams = set()
+        for text in texts:
+            if text:
+                grams |= trigrams(str(text))
+        gramsOld = self.__grams.get(item, None)
+        if gramsOld == grams:
+            return
+        if gramsOld is not None:
+            self.remove(item)
+        self.__grams[item] = grams
+        for gram in grams:
+            self.__postings.setdefault(gram, set()).add(item)
+
+    def remove(self, item):
+        '''
+        Remove an item, if indexed
+        '''
+        grams = self.__grams.pop(item, None)
+        if grams is None:
+            return
+        for gram in grams:
+            posting = self.__postings[gram]
+            posting.discard(item)
+            if not posting:
+                del self.__postings[gram]
+
+    @profiler.timed("fuzzy.query")
+    def query(self, text, limit=20, threshold=0.3):
+        '''
+        Find the items most similar to text
+
+        Parameters
+        ----------
+        text : str
+        limit : int
+            the maximal number of items returned
+        threshold : float
+            the minimal fraction of query trigrams found in an item
+
+        Returns
+        -------
+        list of (item, float) : items and their scores, best first
+        '''
+        gramsQuery = trigrams(text)
+        if not gramsQuery:
+            return []
+        nQuery = float(len(gramsQuery))
+        nMin = max(1, int(math.ceil(threshold * nQuery)))
+        # an item sharing at least nMin grams must be in one of the
+        # (nQuery - nMin + 1) rarest postings, so only those are scanned for candidates,
+        # and the common postings are probed by membership
+        postings = sorted((self.__postings.get(gram, frozenset()) for gram in gramsQuery), key=len)
+        nRare = len(postings) - nMin + 1
+        counts = Counter(chain.from_iterable(postings[:nRare]))
+        for posting in postings[nRare:]:
+            for item in counts:
+                if item in posting:
+                    counts[item] += 1
+        scored = []
+        for item, nShared in counts.items():
+            if nShared < nMin:
+                continue
+            jaccard = nShared / (nQuery + len(self.__grams[item]) - nShared)
+            scored.append((nShared / nQuery, jaccard, item))
+        scored.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        return [(item, score) for score, _, item in scored[:limit]]
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+'''
+Bulk import of book items from CSV, BibTeX or JSON-lines files.
+
+Records are streamed from the input file, mapped to the keys of book JSON,
+given collision-free file names and written to dbJSON by a pool of threads,
+such that thousands of entries can be migrated without interactive prompts.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import re
+import csv
+import json
+import time
+import datetime as dt
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from readmanager.bookitem import keysMust, keysOptl
+from readmanager.layout import iter_book_jsons, book_json_path, book_name
+from readmanager.notetemplate import render, write_note
+from readmanager import codec
+from readmanager import profiler
+
+__formatTime = "%Y-%m-%d %X"
+__nameKey = "__name"
+# aliases of input fields, compared after removing non-alphanumeric characters and lowering
+__fieldAlias = {
+    "name": "title", "booktitle": "title",
+    "authors": "author", "creator": "author", "writer": "author",
+    "pages": "pageTotal", "numpages": "pageTotal", "totalpages": "pageTotal",
+    "page": "pageCurrent", "currentpage": "pageCurrent",
+    "tags": "tag", "keywords": "tag", "keyword": "tag", "categories": "tag",
+    "publisher": "press", "shorttitle": "titleShort",
+    "file": "bookLocalSource", "source": "bookLocalSource", "path": "bookLocalSource",
+    "added": "dateAdded", "plan": "datePlan", "deadline": "datePlan",
+    "remarks": "remark",
+    "id": __nameKey, "key": __nameKey, "filename": __nameKey, "citekey": __nameKey,
+    }
+__formats = {".csv": "csv", ".bib": "bibtex", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+def __normalize_field(field):
+    '''
+    lower the field name and remove non-alphanumeric characters
+    '''
+    return re.sub(r'[^0-9a-z]', '', field.lower())
+
+# normalized field -> key of book JSON
+__fieldMap = {__normalize_field(key): key for key in list(keysMust) + list(keysOptl)}
+__fieldMap.update(__fieldAlias)
+
+def guess_format(pathIn):
+    '''
+    Guess the format of input file from its extension
+
+    Returns
+    -------
+    str : "csv", "bibtex" or "jsonl"
+    '''
+    ext = os.path.splitext(pathIn)[1].lower()
+    try:
+        return __formats[ext]
+    except KeyError:
+        raise ValueError("cannot guess the import format of %s, use one of %s" % \
+                (pathIn, ", ".join(sorted(set(__formats.values())))))
+
+def iter_csv(hFileIn):
+    '''
+    Stream records from a CSV file with a header line
+
+    Parameters
+    ----------
+    hFileIn : file object
+    '''
+    for row in csv.DictReader(hFileIn):
+        yield {k: v for k, v in row.items() if k is not None and v not in [None, ""]}
+
+def iter_jsonl(hFileIn):
+    '''
+    Stream records from a JSON-lines file, one JSON object per line
+
+    Parameters
+    ----------
+    hFileIn : file object
+    '''
+    for iLine, line in enumerate(hFileIn):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError("invalid JSON at line %d" % (iLine + 1))
+        if not isinstance(record, dict):
+            raise ValueError("line %d is not a JSON object" % (iLine + 1))
+        yield record
+
+def iter_bibtex(hFileIn):
+    '''
+    Stream records from a BibTeX file. The citation key is used as the name hint of JSON.
+    @comment, @preamble and @string entries are skipped.
+
+    Parameters
+    ----------
+    hFileIn : file object
+    '''
+    entry = []
+    depth = 0
+    fOpened = False
+    for line in hFileIn:
+        if not entry:
+            iAt = line.find("@")
+            if iAt < 0:
+                continue
+            line = line[iAt:]
+        entry.append(line)
+        depth += __brace_depth(line)
+        fOpened = fOpened or "{" in line
+        if fOpened and depth <= 0:
+            record = __parse_bibtex_entry("".join(entry))
+            entry = []
+            depth = 0
+            fOpened = False
+            if record is not None:
+                yield record
+
+def __brace_depth(line):
+    '''
+    net brace depth of a line, escaped braces are ignored
+    '''
+    line = line.replace(r'\{', '').replace(r'\}', '')
+    return line.count("{") - line.count("}")
+
+def __parse_bibtex_entry(text):
+    '''
+    Parse a single BibTeX entry to a record
+    '''
+    match = re.match(r'@\s*(\w+)\s*[{(]\s*([^,\s]*)\s*,', text)
+    if match is None:
+        return None
+    if match.group(1).lower() in ["comment", "preamble", "string"]:
+        return None
+    record = {}
+    if match.group(2):
+        record[__nameKey] = match.group(2)
+    body = text[match.end():]
+    i = 0
+    while True:
+        fieldMatch = re.compile(r'\s*(\w[\w-]*)\s*=\s*').match(body, i)
+        if fieldMatch is None:
+            break
+        i = fieldMatch.end()
+        value, i = __read_bibtex_value(body, i)
+        record[fieldMatch.group(1)] = " ".join(value.split())
+        # skip to the next field
+        iComma = body.find(",", i)
+        if iComma < 0:
+            break
+        i = iComma + 1
+    if "author" in record:
+        record["author"] = ", ".join(a.strip() for a in re.split(r'\s+and\s+', record["author"]))
+    return record
+
+def __read_bibtex_value(body, i):
+    '''
+    Read a braced, quoted or bare value, and strip the braces
+
+    Returns
+    -------
+    str, int : the value and the position after it
+    '''
+    if i < len(body) and body[i] in '{"':
+        fQuoted = body[i] == '"'
+        depth = 0 if fQuoted else 1
+        j = i + 1
+        while j < len(body):
+            c = body[j]
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+                if depth == 0 and not fQuoted:
+                    break
+            elif c == '"' and fQuoted and depth == 0 and body[j - 1] != "\\":
+                break
+            j += 1
+        value = body[i + 1:j]
+        return value.replace("{", "").replace("}", ""), j + 1
+    match = re.compile(r'[^,}\n]*').match(body, i)
+    return match.group(0).strip(), match.end()
+
+def __to_int(value):
+    '''
+    Convert page numbers to int. A range "a--b" gives the number of pages in it
+    '''
+    if isinstance(value, int):
+        return value
+    numbers = [int(x) for x in re.findall(r'\d+', str(value))]
+    if not numbers:
+        raise ValueError("no page number in %r" % value)
+    if len(numbers) == 2 and re.search(r'\d\s*-+\s*\d', str(value)):
+        return abs(numbers[1] - numbers[0]) + 1
+    return numbers[0]
+
+def map_record(record, today=None):
+    '''
+    Map an input record to the dictionary of book JSON
+
+    Parameters
+    ----------
+    record : dict
+        field-value pairs from the input file
+    today : date
+        the default dateAdded, default datetime.date.today()
+
+    Returns
+    -------
+    dict, str, list : the book dictionary, the name hint (None if not set)
+        and the list of fields not recognized
+
+    Raises
+    ------
+    ValueError : if the title is missing, a value is malformed, datePlan is not after dateAdded
+        or dateAdded is after today, i.e. the progress of the book could not be calculated
+    '''
+    if today is None:
+        today = dt.date.today()
+    dictBook = deepcopy(keysMust)
+    dictBook["dateAdded"] = str(today)
+    nameHint = None
+    unknown = []
+    for field, value in record.items():
+        if field == __nameKey:
+            key = __nameKey
+        else:
+            key = __fieldMap.get(__normalize_field(field), None)
+        if key is None:
+            unknown.append(field)
+            continue
+        if key == __nameKey:
+            nameHint = str(value)
+        elif key in ["pageTotal", "pageCurrent"]:
+            dictBook[key] = __to_int(value)
+        elif key == "tag":
+            if not isinstance(value, (list, tuple)):
+                value = re.split(r'[,;]', str(value))
+            value = [str(t).strip().lower() for t in value]
+            dictBook["tag"] = [t for t in value if t]
+        elif key == "remark":
+            if isinstance(value, str):
+                value = {str(today): [value]}
+            dictBook["remark"] = value
+        elif key in ["dateAdded", "datePlan"]:
+            dictBook[key] = str(dt.date.fromisoformat(str(value).strip()[:10]))
+        elif key == "year":
+            dictBook[key] = str(value)
+        else:
+            dictBook[key] = value
+    if not dictBook["title"]:
+        raise ValueError("title not found")
+    # as required by bookitem.calculate_progress
+    if dictBook["datePlan"] <= dictBook["dateAdded"]:
+        raise ValueError("datePlan %s not after dateAdded %s" % \
+                (dictBook["datePlan"], dictBook["dateAdded"]))
+    if dictBook["dateAdded"] > str(today):
+        raise ValueError("dateAdded %s after today %s" % (dictBook["dateAdded"], today))
+    if dictBook["pageTotal"] < 1:
+        dictBook["pageTotal"] = 1
+    dictBook["pageCurrent"] = min(max(dictBook["pageCurrent"], 0), dictBook["pageTotal"])
+    if not dictBook["log"]:
+        dictBook["log"] = {str(today): dictBook["pageCurrent"]}
+    return dictBook, nameHint, unknown
+
+def slugify(text, maxLen=40):
+    '''
+    Convert a title or name hint to a file name without extension
+    '''
+    slug = re.sub(r'[^\w]+', '_', text.strip().lower(), flags=re.UNICODE).strip('_')
+    return slug[:maxLen].rstrip('_') or "book"
+
+def unique_name(name, namesTaken):
+    '''
+    Get a name not in namesTaken by appending _2, _3, ..., and reserve it
+
+    Parameters
+    ----------
+    name : str
+    namesTaken : set of str
+        lower-case names already used. The returned name is added to it
+    '''
+    newName = name
+    n = 1
+    while newName.lower() in namesTaken:
+        n += 1
+        newName = "%s_%d" % (name, n)
+    namesTaken.add(newName.lower())
+    return newName
+
+def __write_book(pathJSON, dictBook, pathNote, storage, noteTemplates):
+    '''
+    Write a new book JSON, never overwriting, and create its note from template if pathNote is set
+    '''
+    data = codec.encode(dictBook, storage)
+    os.makedirs(os.path.dirname(pathJSON), exist_ok=True)
+    with open(pathJSON, 'xb') as hFileOut:
+        try:
+            hFileOut.write(data)
+        except OSError:
+            # no partial JSON left on the shelf
+            hFileOut.close()
+            os.remove(pathJSON)
+            raise
+    if pathNote is not None:
+        text = render(dictBook.get, dictBook["noteType"], noteTemplates)
+        # no empty note of a noteType without template, e.g. docx
+        if text is not None:
+            write_note(pathNote, text)
+    return pathJSON
+
+@profiler.timed("importer.import")
+def import_books(pathIn, dbJSON, dbNote=None, fmt=None, dryRun=False, noteType=None, \
+                 nWorkers=8, verbose=True, dirsTaken=None, layout="flat", storage="pretty", \
+                 noteTemplates=None):
+    '''
+    Import books from a CSV, BibTeX or JSON-lines file into dbJSON
+
+    Parameters
+    ----------
+    pathIn : str
+        the input file
+    dbJSON : str
+        the JSON database to write new books
+    dbNote : str
+        the note database. If set together with noteType, a note directory
+        "-/name" and a note from template are created for each book without noteLocation
+    fmt : str
+        "csv", "bibtex" or "jsonl". Guessed from the extension if None
+    dryRun : bool
+        only map and report, without writing anything
+    noteType : str
+        the default note type for books without one, e.g. "md"
+    nWorkers : int
+        the number of threads writing JSONs
+    verbose : bool
+        print the progress
+    dirsTaken : list of str
+        other directories whose JSON names should be avoided, e.g. dbArchive
+    layout : str, "flat" or "sharded"
+        the directory layout of dbJSON
+    storage : str, "pretty", "compact" or "gzip"
+        the storage of new JSONs
+    noteTemplates : dict
+        noteType -> path of template file of new notes, see notetemplate module
+
+    Returns
+    -------
+    dict : report with keys "read", "imported", "skipped" (list of (record number, reason)),
+        "unknown" (field -> count) and "paths" (the JSON paths, or those to write if dryRun).
+        A record whose JSON fails to be written is skipped, without aborting the import
+    '''
+    if fmt is None:
+        fmt = guess_format(pathIn)
+    reader = {"csv": iter_csv, "bibtex": iter_bibtex, "jsonl": iter_jsonl}[fmt]
+    today = dt.date.today()
+    timeNow = time.strftime(__formatTime)
+    namesTaken = set()
+    for dirDB in [dbJSON] + list(dirsTaken or []):
+        for pathJSON in iter_book_jsons(dirDB):
+            namesTaken.add(book_name(pathJSON).lower())
+
+    report = {"read": 0, "imported": 0, "skipped": [], "unknown": {}, "paths": []}
+    pending = []
+
+    def __collect(fAll=False):
+        # keep the number of pending writes bounded, so memory does not grow with input
+        while pending and (fAll or len(pending) >= 4 * nWorkers):
+            iRecord, future = pending.pop(0)
+            try:
+                report["paths"].append(future.result())
+            except (OSError, ValueError, TypeError) as err:
+                report["skipped"].append((iRecord + 1, str(err)))
+                continue
+            report["imported"] += 1
+            if verbose and report["imported"] % 100 == 0:
+                print("\r--  %d books imported" % report["imported"], end="")
+
+    with open(pathIn, 'r', newline='' if fmt == "csv" else None) as hFileIn, \
+            ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        for iRecord, record in enumerate(reader(hFileIn)):
+            report["read"] += 1
+            try:
+                dictBook, nameHint, unknown = map_record(record, today)
+            except (ValueError, TypeError) as err:
+                report["skipped"].append((iRecord + 1, str(err)))
+                continue
+            for field in unknown:
+                report["unknown"][field] = report["unknown"].get(field, 0) + 1
+            nameBase = nameHint or dictBook.get("titleShort", None) or dictBook["title"]
+            name = unique_name(slugify(nameBase), namesTaken)
+            dictBook["timeLastMod"] = timeNow
+            pathNote = None
+            if dbNote is not None and noteType is not None and not dictBook["noteLocation"]:
+                dictBook["noteLocation"] = "-/" + name
+                dictBook["noteType"] = dictBook["noteType"] or noteType
+                pathNote = os.path.join(dbNote, name, name + "." + dictBook["noteType"])
+            pathJSON = book_json_path(dbJSON, name, layout, storage == "gzip")
+            if dryRun:
+                report["paths"].append(pathJSON)
+                continue
+            pending.append((iRecord, pool.submit(__write_book, pathJSON, dictBook, pathNote, \
+                    storage, noteTemplates)))
+            __collect()
+        __collect(fAll=True)
+    if verbose and not dryRun and report["imported"] >= 100:
+        print()
+    return report
+
+def print_report(report, dryRun=False):
+    '''
+    Print the report returned by import_books
+    '''
+    if dryRun:
+        print("--  Dry run: %d records read, %d books would be imported." % \
+                (report["read"], len(report["paths"])))
+        for pathJSON in report["paths"][:10]:
+            print("    %s" % pathJSON)
+        if len(report["paths"]) > 10:
+            print("    ... (%d more)" % (len(report["paths"]) - 10))
+    else:
+        print("--  %d records read, %d books imported." % (report["read"], report["imported"]))
+    for iRecord, reason in report["skipped"]:
+        print("    record %d skipped: %s" % (iRecord, reason))
+    for field, count in sorted(report["unknown"].items()):
+        print("    unknown field ignored: %s (%d records)" % (field, count))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+'''
+Directory layout of the JSON database.
+
+In the "flat" layout, all book JSONs are placed directly in dbJSON (and dbArchive).
+In the "sharded" layout, each JSON is placed in a subdirectory named by
+the first two hex digits of the md5 hash of its lower-case name, e.g. dbJSON/3f/name.json,
+to keep directories small for very large libraries.
+Discovery handles both layouts at the same time, so a library can be migrated in place.
+
+Book JSONs are stored as pretty-printed or compact ".json", or as gzip-compressed
+compact ".json.gz" (see codec). Books in any of these coexist in a library.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import re
+
+layouts = ("flat", "sharded")
+# file extensions of book JSON, compressed and not
+extsBook = (".json.gz", ".json")
+__reShard = re.compile(r'^[0-9a-f]{2}$')
+
+def is_book_json(fileName):
+    '''
+    Check if a file name has the extension of book JSON
+    '''
+    return fileName.lower().endswith(extsBook)
+
+def is_compressed(pathJSON):
+    '''
+    Check if a book JSON path is of a compressed JSON, i.e. ends with .json.gz
+    '''
+    return pathJSON.lower().endswith(extsBook[0])
+
+def book_name(pathJSON):
+    '''
+    Get the name of book from the path of its JSON, i.e. the file name without extension
+
+    Parameters
+    ----------
+    pathJSON : str
+
+    Returns
+    -------
+    str
+    '''
+    name = os.path.basename(pathJSON)
+    for ext in extsBook:
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def shard_of(name):
+    '''
+    Get the shard directory name of a book name
+
+    Parameters
+    ----------
+    name : str
+        the name of book JSON without extension
+
+    Returns
+    -------
+    str : two hex digits
+    '''
+    import hashlib
+    return hashlib.md5(name.lower().encode("utf-8")).hexdigest()[:2]
+
+def book_json_path(dirDB, name, layout="flat", compressed=False):
+    '''
+    Get the path of book JSON with name in database dirDB under layout
+
+    Parameters
+    ----------
+    dirDB : str
+        the database directory, e.g. dbJSON or dbArchive
+    name : str
+        the name of book JSON without extension
+    layout : str, "flat" or "sharded"
+    compressed : bool
+        True for the path of compressed JSON, with .json.gz extension
+
+    Returns
+    -------
+    str : the path of JSON
+    '''
+    fileName = name + extsBook[0 if compressed else 1]
+    if layout == "sharded":
+        return os.path.join(dirDB, shard_of(name), fileName)
+    if layout == "flat":
+        return os.path.join(dirDB, fileName)
+    raise ValueError("layout should be one of %s" % ", ".join(layouts))
+
+def find_book(dirDB, name):
+    '''
+    Find the book JSON named name in dirDB under either layout, compressed or not
+
+    Returns
+    -------
+    str or None : the path of JSON, None if not found
+    '''
+    for layout in layouts:
+        for compressed in [False, True]:
+            pathJSON = book_json_path(dirDB, name, layout, compressed)
+            if os.path.isfile(pathJSON):
+                return pathJSON
+    return None
+
+def book_exists(dirDB, name):
+    '''
+    Check if a book JSON named name exists in dirDB under either layout, compressed or not
+
+    Returns
+    -------
+    bool
+    '''
+    return find_book(dirDB, name) is not None
+
+def iter_book_jsons(dirDB):
+    '''
+    Iterate over the paths of book JSON files in the database directory dirDB,
+    including those in shard subdirectories. Other subdirectories, e.g. archive,
+    are not entered.
+
+    Parameters
+    ----------
+    dirDB : str
+        the database directory, e.g. dbJSON or dbArchive
+
+    Returns
+    -------
+    generator of str : path of each book JSON
+    '''
+    if not os.path.isdir(dirDB):
+        return
+    with os.scandir(dirDB) as entries:
+        shards = []
+        for entry in entries:
+            if entry.is_dir():
+                if __reShard.match(entry.name):
+                    shards.append(entry.path)
+            elif is_book_json(entry.name):
+                yield entry.path
+    for dirShard in shards:
+        with os.scandir(dirShard) as entries:
+            for entry in entries:
+                if is_book_json(entry.name) and entry.is_file():
+                    yield entry.path
+
+def migrate(dirDB, layout, verbose=True):
+    '''
+    Move all book JSONs in dirDB to layout by os.replace.
+    Empty shard directories are removed when migrating to "flat".
+
+    Parameters
+    ----------
+    dirDB : str
+    layout : str, "flat" or "sharded"
+    verbose : bool
+
+    Returns
+    -------
+    int : the number of JSONs moved
+    '''
+    assert layout in layouts
+    nMoved = 0
+    for pathJSON in list(iter_book_jsons(dirDB)):
+        pathNew = book_json_path(dirDB, book_name(pathJSON), layout, is_compressed(pathJSON))
+        if pathNew == pathJSON:
+            continue
+        if os.path.exists(pathNew):
+            raise FileExistsError("JSON exists at the destination: %s" % pathNew)
+        os.makedirs(os.path.dirname(pathNew), exist_ok=True)
+        os.replace(pathJSON, pathNew)
+        nMoved += 1
+    if layout == "flat":
+        for entry in os.scandir(dirDB):
+            if entry.is_dir() and __reShard.match(entry.name):
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    pass
+    if verbose:
+        print("--  %d JSONs moved to %s layout in %s" % (nMoved, layout, dirDB))
+    return nMoved
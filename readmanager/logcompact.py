@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+'''
+Lossless compaction of the reading log of book JSONs.
+
+The log entries older than a number of days are moved from "log" to "logCompact",
+which stores the dates and pages as two arrays of integers:
+    {"start": "yyyy-mm-dd", "days": [0, gap, ...], "pages": [page, change, ...]}
+"days" are the gaps in days from the previous entry (from start for the first),
+and "pages" the change of page from the previous entry (from 0 for the first).
+Recent entries stay verbatim in "log", so update_log is not affected.
+full_log merges both, and expand_log moves all entries back to "log".
+'''
+
+from __future__ import print_function, absolute_import
+import datetime as dt
+
+keyCompact = "logCompact"
+
+def __is_compactable(dateStr, page):
+    '''
+    Check if a log entry can be encoded, i.e. an iso date and an integer page
+    '''
+    if not isinstance(page, int) or isinstance(page, bool):
+        return False
+    try:
+        return str(dt.date.fromisoformat(dateStr)) == dateStr
+    except (TypeError, ValueError):
+        return False
+
+def encode_log(log):
+    '''
+    Encode log entries
+
+    Parameters
+    ----------
+    log : dict
+        {"yyyy-mm-dd": page}, all entries compactable
+
+    Returns
+    -------
+    dict : the compact log, None for an empty log
+    '''
+    if not log:
+        return None
+    dates = sorted(log)
+    start = dt.date.fromisoformat(dates[0])
+    days = []
+    pages = []
+    ordinalPrev = start.toordinal()
+    pagePrev = 0
+    for dateStr in dates:
+        ordinal = dt.date.fromisoformat(dateStr).toordinal()
+        days.append(ordinal - ordinalPrev)
+        pages.append(log[dateStr] - pagePrev)
+        ordinalPrev, pagePrev = ordinal, log[dateStr]
+    return {"start": str(start), "days": days, "pages": pages}
+
+def decode_log(compact):
+    '''
+    Decode a compact log
+
+    Parameters
+    ----------
+    compact : dict or None
+
+    Returns
+    -------
+    dict : {"yyyy-mm-dd": page}, in date order
+    '''
+    log = {}
+    if not compact:
+        return log
+    ordinal = dt.date.fromisoformat(compact["start"]).toordinal()
+    page = 0
+    for gap, change in zip(compact["days"], compact["pages"]):
+        ordinal += gap
+        page += change
+        log[str(dt.date.fromordinal(ordinal))] = page
+    return log
+
+def full_log(dictBook):
+    '''
+    Get the complete log of a book dictionary, compacted entries included
+
+    Parameters
+    ----------
+    dictBook : dict
+
+    Returns
+    -------
+    dict : {"yyyy-mm-dd": page}. The "log" value itself if nothing is compacted
+    '''
+    log = dictBook.get("log", None) or {}
+    compact = dictBook.get(keyCompact, None)
+    if not compact:
+        return log
+    logFull = decode_log(compact)
+    logFull.update(log)
+    return logFull
+
+def compact_log(dictBook, keepDays=90, today=None):
+    '''
+    Move the log entries older than keepDays days to the compact log, in place
+
+    Parameters
+    ----------
+    dictBook : dict
+    keepDays : int
+        entries within the last keepDays days are kept verbatim
+    today : datetime.date
+
+    Returns
+    -------
+    int : the number of entries moved
+    '''
+    today = today or dt.date.today()
+    dateCut = str(today - dt.timedelta(days=keepDays))
+    log = dictBook.get("log", None) or {}
+    old = {d: p for d, p in log.items() if d < dateCut and __is_compactable(d, p)}
+    if not old:
+        return 0
+    logCompacted = decode_log(dictBook.get(keyCompact, None))
+    logCompacted.update(old)
+    dictBook[keyCompact] = encode_log(logCompacted)
+    dictBook["log"] = {d: p for d, p in log.items() if d not in old}
+    return len(old)
+
+def expand_log(dictBook):
+    '''
+    Move all compacted entries back to "log", in place
+
+    Parameters
+    ----------
+    dictBook : dict
+
+    Returns
+    -------
+    int : the number of entries moved
+    '''
+    compact = dictBook.pop(keyCompact, None)
+    if compact is None:
+        return 0
+    logCompacted = decode_log(compact)
+    nMoved = len(logCompacted)
+    logCompacted.update(dictBook.get("log", None) or {})
+    dictBook["log"] = logCompacted
+    return nMoved
@@ -5,17 +5,19 @@ Main executable classes of readmanager.
 
 from __future__ import print_function, absolute_import
 import sys
+import time
 #from copy import deepcopy
-from readmanager import utils, opener
-from readmanager.manager import manager
+from readmanager import utils
+from readmanager.manager import manager, load_config
 from readmanager.presenter import presenter
+from readmanager.watcher import watcher, watch_config
 
 class readmanager_ui():
     '''
     readmanager user interface class
     '''
 
-    def __init__(self, modeRead=False, modeNonInter=False):
+    def __init__(self, modeRead=False, modeNonInter=False, showForecast=False):
      
         assert isinstance(modeRead, bool)
         self.modeRead = modeRead
@@ -38,9 +40,9 @@ class readmanager_ui():
         # get config file path
         configFile = utils.get_config()
         # initialize manager instance
-        self.__bm = manager(configFile, modeNonInter=modeNonInter)
+        self.__bm = manager(configFile, modeNonInter=modeNonInter, modeRead=modeRead)
         # initialize presenter instance
-        self.__pre = presenter(self.__bm)
+        self.__pre = presenter(self.__bm, showForecast=showForecast)
         
         # ===================================================================
         # initialize options and help string
@@ -59,9 +61,11 @@ class readmanager_ui():
            "m": utils.modify, \
            "c": utils.create_new, \
            "r": utils.add_remark, \
-           # "check archive"
-           # "archive"
-           # "unarchive"
+           "l": utils.show_activity, \
+           "n": utils.search_notes, \
+           "A": utils.show_archive, \
+           "a": utils.archive_items, \
+           "u": utils.unarchive_items, \
            }
 
     def __set_utils_options_pre(self):
@@ -73,6 +77,7 @@ class readmanager_ui():
            "i": utils.show_item_details, \
            "f": utils.find_item, \
            "t": utils.show_tags, \
+           "e": utils.toggle_forecast, \
            }
 
     def __set_utils_options_manapre(self):
@@ -81,6 +86,8 @@ class readmanager_ui():
         '''
         self.dictOptionsManaPre = { \
            "S": utils.sort_items, \
+           "k": utils.show_top, \
+           "v": utils.switch_view, \
            }
 
     def __set_ui_help_str(self):
@@ -134,6 +141,7 @@ class readmanager_ui():
         bool : True if an empty option is selected, False otherwise
             this is used to specify if it is a retry of option input
         '''
+        from readmanager import opener
         if iBI in range(len(self.__bm)):
             fRetry = False
             opener.open_book(self.__bm, iBI, fNoNote)
@@ -188,12 +196,17 @@ class readmanager_ui():
         '''
         start main UI loop
         '''
+        # imported here, as check mode opens no viewer
+        from readmanager import opener
         fRetry = False
         while True:
             if fRetry:
                 option = input(self.helpStrPrompt).strip()
             else:
                 utils.flush_screen()
+                # pick up the books saved by another session
+                if self.modeRead and self.__bm.check_snapshot():
+                    self.__pre.rebuild()
                 self.show_pre()
                 option = input(self.helpStr).strip()
                 
@@ -209,6 +222,80 @@ class readmanager_ui():
                         pass
                 else:
                     fRetry = self.run_option(option)
+            # reap the viewers closed, also on retries
+            opener.reap()
+
+def check(pathConfig=None, showForecast=False, top=None, topKey="read", view=None):
+    '''
+    Check-mode: print the table of books on the shelf once.
+    Unlike readmanager_ui, only the headline fields of the shelf are loaded,
+    from the catalog snapshot when it is up to date, and the screen, archive
+    and help strings are not touched.
+
+    Parameters
+    ----------
+    pathConfig : str
+        the path of config json, by utils.get_config if None
+    showForecast : bool
+        flag to show the column of forecast finish date, which needs the full books
+    top : int
+        if set, show only the first top unfinished books by topKey
+    topKey : str
+        sort key or spec to select the top books, see manager.top_indices
+    view : str
+        if set, show only the books in this saved view, see manager.view_indices
+    '''
+    if pathConfig is None:
+        pathConfig = utils.get_config()
+    bm = manager(pathConfig, modeRead=True, verbose=False)
+    pre = presenter(bm, showForecast=showForecast)
+    if top is None:
+        pre.set_view(view)
+        pre.show()
+        return
+    if view is None:
+        pre.show_indices(bm.top_indices(top, topKey))
+        return
+    __members = set(bm.view_indices(view))
+    pre.show_indices([i for i in bm.top_indices(len(bm), topKey) if i in __members][:top])
+
+def watch(pathConfig=None, showForecast=False):
+    '''
+    Watch-mode: show the table of books on the shelf, and keep it updated when
+    the book JSONs or notes are changed by other tools, until interrupted by Ctrl-C.
+    Only the changed books are reloaded and their rows redrawn.
+    The optional key "watch" of config, e.g. {"interval": 1.0, "readOnNoteEdit": true},
+    sets the seconds between polls, and whether a note edit updates the time of last read.
+    The books are loaded in write mode if readOnNoteEdit, as their JSONs are then written,
+    otherwise in read mode.
+
+    Parameters
+    ----------
+    pathConfig : str
+        the path of config json, by utils.get_config if None
+    showForecast : bool
+        flag to show the column of forecast finish date
+    '''
+    if pathConfig is None:
+        pathConfig = utils.get_config()
+    dictWatch = watch_config(load_config(pathConfig))
+    bm = manager(pathConfig, modeRead=not dictWatch["readOnNoteEdit"], verbose=False)
+    pre = presenter(bm, showForecast=showForecast)
+    wat = watcher(bm, interval=dictWatch["interval"], readOnNoteEdit=dictWatch["readOnNoteEdit"])
+    utils.flush_screen()
+    pre.show()
+    try:
+        while True:
+            time.sleep(wat.interval)
+            fReorder, indices = wat.poll()
+            if fReorder:
+                utils.flush_screen()
+                pre.rebuild()
+                pre.show()
+            elif indices:
+                pre.update_rows(indices)
+    except KeyboardInterrupt:
+        print()
 
 #T O D O batch mode
 #class readmanager_batch(__executable):
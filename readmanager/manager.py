@@ -6,8 +6,60 @@ the manager class is defined to manage the book item instances and notes
 from __future__ import print_function, absolute_import
 import json
 import os
-from fnmatch import fnmatch
+from heapq import merge
 from readmanager.bookitem import book_item
+from readmanager.layout import iter_book_jsons, book_json_path, book_exists, book_name, layouts, \
+        is_compressed
+from readmanager.codec import storages
+from readmanager.snapshot import catalog_snapshot, snapshot_book, publish, nameSnapshot, is_current
+from readmanager.sorting import parse_spec, sort_order, sort_value, top_order
+from readmanager.federation import library, config_path_of, nameHome
+from readmanager.views import view_index
+from readmanager import profiler
+
+__paraConfigMust = ("dbJSON", "dbNote")
+
+def load_config(pathConfig):
+    '''
+    Load the config file and resolve the paths of databases,
+    without loading any book item
+
+    Parameters
+    ----------
+    pathConfig : str
+        the path of config json
+
+    Returns
+    -------
+    dict : the config dictionary, with "dbJSON", "dbNote" resolved to absolute paths,
+        and "dbArchive" and "dbCache" added
+    '''
+    with open(pathConfig, 'r') as hFileIn:
+        dictConfig = json.load(hFileIn)
+    # check config file consistency
+    for key in __paraConfigMust:
+        if key not in dictConfig:
+            raise ValueError("Broken config.json: key \"%s\" not found" % key)
+    # JSON and note are in the same directory as configuration json. For travis test
+    for key, dirSame in [("dbJSON", "JSON"), ("dbNote", "note")]:
+        if dictConfig[key] in ["-", "-/"]:
+            dictConfig[key] = os.path.abspath(pathConfig + "/../" + dirSame)
+        else:
+            dictConfig[key] = os.path.expanduser(os.path.expandvars(dictConfig[key]))
+        assert os.path.isdir(dictConfig[key])
+    # Archive database under dbJSON
+    dictConfig["dbArchive"] = os.path.join(dictConfig["dbJSON"], "archive")
+    # Cache files, e.g. analytics, under dbJSON
+    dictConfig["dbCache"] = os.path.join(dictConfig["dbJSON"], ".readmana")
+    # Directory layout of JSON database, see layout module
+    dictConfig.setdefault("layout", "flat")
+    if dictConfig["layout"] not in layouts:
+        raise ValueError("Broken config.json: layout should be one of %s" % ", ".join(layouts))
+    # Storage of new and converted book JSONs, see codec module
+    dictConfig.setdefault("storage", "pretty")
+    if dictConfig["storage"] not in storages:
+        raise ValueError("Broken config.json: storage should be one of %s" % ", ".join(storages))
+    return dictConfig
 
 class manager():
     '''
@@ -31,11 +83,9 @@ class manager():
             "docx": None, \
             "doc": None, \
             }
-    __paraConfigMust = ("dbJSON", "dbNote")
-
     # try to get custom config file path from READMANA_CONFIG environment variable
 
-    def __init__(self, pathConfig, modeNonInter=False):
+    def __init__(self, pathConfig, modeNonInter=False, modeRead=False, verbose=True):
         '''
         Initialize the book manager instance from the JSON file pathConfig
         
@@ -45,6 +95,11 @@ class manager():
             the path of config json
         modeNonInter : bool
             flag for non-interactive mode, used for unittest of ui
+        modeRead : bool
+            flag for read mode. The books on the shelf are loaded from the
+            catalog snapshot if available, and the archive is not loaded
+        verbose : bool
+            flag to print the progress of loading books
         '''
         assert not os.path.isdir(pathConfig)
         if os.path.isfile(pathConfig):
@@ -55,8 +110,16 @@ class manager():
         #    self.__fUseConfigDe = True
         self.books = []
         self.booksArchive = []
+        self.sortKey = None
+        # trigram index for fuzzy search, built on first use
+        self.__fuzzy = None
+        # (library, mapped catalog snapshot) in read mode
+        self.__snaps = []
         assert isinstance(modeNonInter, bool)
         self.modeNonIner = modeNonInter
+        assert isinstance(modeRead, bool)
+        self.modeRead = modeRead
+        self.verbose = verbose
         #self.__check_config()
         self.__load_config()
         self.__load_book_items()
@@ -72,62 +135,175 @@ class manager():
         Load existing config file
         Namely, define dbJSON, dbNote and opener attributes
         '''
-        with open(self.pathConfig, 'r') as hFileIn:
-            self.__dictConfig = json.load(hFileIn)
-        # check config file consistency
-        for key in self.__paraConfigMust:
-            if key not in self.__dictConfig:
-                raise ValueError("Broken config.json: key \"%s\" not found" % key)
-        # JSON and note are in the same directory as configuration json. For travis test
-        if self.__dictConfig["dbJSON"] in ["-", "-/"]:
-            self.dbJSON = os.path.abspath(self.pathConfig + "/../JSON")
-        else:
-            self.dbJSON = os.path.expanduser(os.path.expandvars(self.__dictConfig["dbJSON"]))
-        assert os.path.isdir(self.dbJSON)
-
-        # Archive database under dbJSON
-        self.dbArchive = os.path.join(self.dbJSON, "archive")
+        self.__dictConfig = load_config(self.pathConfig)
+        self.dbJSON = self.__dictConfig["dbJSON"]
+        self.dbNote = self.__dictConfig["dbNote"]
+        self.dbCache = self.__dictConfig["dbCache"]
+        self.pathSnapshot = os.path.join(self.dbCache, nameSnapshot)
+        # the home library, and the other libraries federated into the shelf. See federation module
+        self.libraries = [library(self.__dictConfig.get("name", nameHome), self.pathConfig, \
+                self.__dictConfig)]
+        for name, path in self.__dictConfig.get("libraries", {}).items():
+            if name in [lib.name for lib in self.libraries]:
+                raise ValueError("Broken config.json: duplicate library name \"%s\"" % name)
+            __pathConfig = config_path_of(path)
+            self.libraries.append(library(name, __pathConfig, load_config(__pathConfig)))
+        # store of the previous versions of book JSONs, with optional retention policy
+        # e.g. "backup": {"keepLast": 10, "keepDaily": 30}
+        self.backup = self.libraries[0].backup
+        self.layout = self.__dictConfig["layout"]
+        self.storage = self.__dictConfig["storage"]
+        # template files of new notes by noteType, see notetemplate module
+        self.noteTemplates = self.__dictConfig.get("noteTemplates", {})
+        # saved filter views, e.g. "views": {"physics": "tag:physics AND unfinished"}
         try:
-            assert os.path.isdir(self.dbArchive)
-        except AssertionError:
-            os.makedirs(self.dbArchive)
+            self.views = view_index(self.__dictConfig.get("views", {}))
+        except ValueError as err:
+            raise ValueError("Broken config.json: %s" % err)
 
-        if self.__dictConfig["dbNote"] in ["-", "-/"]:
-            self.dbNote = os.path.abspath(self.pathConfig + "/../note")
-        else:
-            self.dbNote = os.path.expanduser(os.path.expandvars(self.__dictConfig["dbNote"]))
-        assert os.path.isdir(self.dbNote)
+        # Archive database under dbJSON, created by library
+        self.dbArchive = self.__dictConfig["dbArchive"]
 
         self.opener = self.__openerDe
         if "opener" in self.__dictConfig:
             self.opener = self.__dictConfig["opener"]
         assert isinstance(self.opener, dict)
 
+    @profiler.timed("manager.load")
     def __load_book_items(self, reLoad=False):
         '''
         load all json files in dbJSON directory as a list of book_item instances to self.books list
         Note that this method will first clean the self.books list.
+        The books of federated libraries are loaded in turn and sorted once together
         '''
-        if not reLoad:
-            print("Manager getting all book items...", end=" ")
-        else:
-            print("Manager reloading...", end=" ")
+        if self.verbose:
+            print("Manager reloading..." if reLoad else "Manager getting all book items...", end=" ")
         
         # clear books
         self.books = []
         self.booksArchive = []
-        for ifile in os.listdir(self.dbJSON):
-            if fnmatch(ifile.lower(), "*.json"):
-                self.books.append(book_item(os.path.join(self.dbJSON, ifile)))
-        for ifile in os.listdir(self.dbArchive):
-            if fnmatch(ifile.lower(), "*.json"):
-                self.booksArchive.append(book_item(os.path.join(self.dbArchive, ifile)))
-        if not reLoad:
-            print("Done. %d items read." % len(self.books))
-        else:
-            print("Reloaded. %d items read." % len(self.books))
+        self.__fuzzy = None
+        for _, snap in self.__snaps:
+            snap.close()
+        __loaded = [self.__load_library(lib) for lib in self.libraries]
+        self.__snaps = [(lib, snap) for lib, (_, _, snap) in zip(self.libraries, __loaded) \
+                if snap is not None]
+        for _, booksArchive, _ in __loaded:
+            self.booksArchive.extend(booksArchive)
+        if self.verbose:
+            print("%s. %d items read." % ("Reloaded" if reLoad else "Done", \
+                    sum(len(books) for books, _, _ in __loaded)))
+        for books, _, _ in __loaded:
+            self.books.extend(books)
         self.sort_books_by("read")
 
+    def __load_library(self, lib):
+        '''
+        Load the books of a library. In read mode, the books on the shelf are loaded from
+        its catalog snapshot if it is up to date, otherwise the snapshot is published again,
+        unless the library is not writable, e.g. a shared library mounted read-only
+
+        Parameters
+        ----------
+        lib : library instance
+
+        Returns
+        -------
+        list, list, catalog_snapshot : the books on the shelf, in the archive,
+            and the snapshot mapped, None if not in read mode
+        '''
+        snap = self.__load_snapshot(lib) if self.modeRead else None
+        if snap is not None:
+            books = [snapshot_book(snap, i) for i in range(len(snap))]
+        else:
+            books = [book_item(pathJSON) for pathJSON in iter_book_jsons(lib.dbJSON)]
+            if self.modeRead:
+                try:
+                    publish(books, lib.pathSnapshot)
+                    # mapped only to watch for changes by check_snapshot
+                    snap = catalog_snapshot(lib.pathSnapshot)
+                except OSError:
+                    pass
+        booksArchive = []
+        if not self.modeRead:
+            booksArchive = [book_item(pathJSON) for pathJSON in iter_book_jsons(lib.dbArchive)]
+        return books, booksArchive, snap
+
+    @staticmethod
+    def __load_snapshot(lib):
+        '''
+        Map the catalog snapshot of a library
+
+        Returns
+        -------
+        catalog_snapshot instance : None if the snapshot is not found, invalid or outdated
+        '''
+        if not is_current(lib.pathSnapshot, lib.dbJSON):
+            return None
+        try:
+            return catalog_snapshot(lib.pathSnapshot)
+        except (OSError, ValueError):
+            return None
+
+    def library_of(self, bi):
+        '''
+        Get the library owning a book item, on the shelf or in the archive
+
+        Parameters
+        ----------
+        bi : book_item instance
+
+        Returns
+        -------
+        library instance
+        '''
+        for lib in self.libraries[1:]:
+            if lib.owns(bi.filepath):
+                return lib
+        return self.libraries[0]
+
+    def get_sources(self):
+        '''
+        Get the names of the libraries owning the books on the shelf
+        '''
+        return [self.library_of(bi).name for bi in self.books]
+
+    def publish_snapshot(self):
+        '''
+        Publish the catalog snapshot of the books on the shelf for read-mode sessions,
+        one for each library
+
+        Returns
+        -------
+        int : the generation of the snapshot of the home library
+        '''
+        if len(self.libraries) == 1:
+            return publish(self.books, self.pathSnapshot)
+        __books = {lib.name: [] for lib in self.libraries}
+        for bi in self.books:
+            __books[self.library_of(bi).name].append(bi)
+        __generations = [publish(__books[lib.name], lib.pathSnapshot) for lib in self.libraries]
+        return __generations[0]
+
+    def check_snapshot(self):
+        '''
+        Reload the books in read mode if a newer snapshot has been published,
+        e.g. by a session that saved the books, or a book JSON has been changed since,
+        e.g. edited by hand
+
+        Returns
+        -------
+        bool : True if reloaded
+        '''
+        if all(not snap.is_stale() and is_current(lib.pathSnapshot, lib.dbJSON) \
+                for lib, snap in self.__snaps):
+            return False
+        __sortKey = self.sortKey
+        self.__load_book_items(reLoad=True)
+        self.sort_books_by(__sortKey)
+        return True
+
+    @profiler.timed("manager.sort")
     def sort_books_by(self, sortkey):
         '''
         Sort the book items by the keyword sortkey
@@ -135,41 +311,105 @@ class manager():
         Parameters
         ----------
         sortkey : str
-            the keyword to sort
-        '''
-        __sortMethod = {
-            "mod": self.__sort_books_by_mod_time, 
-            "read": self.__sort_books_by_read_time, 
-            "author": self.__sort_books_by_author, 
-            "title": self.__sort_books_by_title, 
-            }
-        if sortkey in __sortMethod.keys():
-            __sortMethod[sortkey]()
-
+            a key, e.g. "read", or a comma-separated spec of keys, e.g. "tag,-lag,title".
+            See readmanager.sorting for the keys. Nothing is done if it is invalid
 
-    def __sort_books_by_mod_time(self):
+        Returns
+        -------
+        bool : True if sorted
         '''
-        Sort book_item instances by descending datetime
+        try:
+            __specs = parse_spec(sortkey)
+        except (ValueError, AttributeError):
+            return False
+        __order = sort_order(self.books, __specs)
+        self.books = [self.books[i] for i in __order]
+        self.sortKey = sortkey
+        return True
+
+    def top_indices(self, n, sortkey="read", fFinished=False):
         '''
-        self.books = sorted(self.books, key=lambda x: x.get_last_time("mod"), reverse=True)
+        Get the indices of the first n books by sortkey, without sorting all books,
+        e.g. to decide what to read next. The order of books is not changed.
 
-    def __sort_books_by_read_time(self):
+        Parameters
+        ----------
+        n : int
+        sortkey : str
+            a key or comma-separated spec, see sort_books_by, e.g. "read" for the latest read,
+            "lag" for the most behind plan and "remain" for the closest to finish
+        fFinished : bool
+            True to include the finished books
+
+        Returns
+        -------
+        list of int : indices of books in self.books
+
+        Raises
+        ------
+        ValueError : if sortkey is invalid
+        '''
+        __specs = parse_spec(sortkey)
+        __indices = [i for i, bi in enumerate(self.books) \
+                if fFinished or bi.pageCurrent < bi.pageTotal]
+        __order = top_order([self.books[i] for i in __indices], __specs, n)
+        return [__indices[i] for i in __order]
+
+    def __insert_sorted(self, listBI):
         '''
-        Sort book_item instances by descending datetime
+        Insert book_item instances to self.books, keeping the current sort order.
+        The new items are sorted and merged in, instead of sorting all books again.
+
+        Parameters
+        ----------
+        listBI : list of book_item instances
         '''
-        self.books = sorted(self.books, key=lambda x: x.get_last_time("read"), reverse=True)
+        try:
+            __specs = parse_spec(self.sortKey)
+        except (ValueError, AttributeError):
+            self.books.extend(listBI)
+            return
+        if len(__specs) > 1:
+            # any spec of several keys, even of the same direction, is sorted again in full,
+            # as the merge below takes a single key
+            self.books.extend(listBI)
+            self.sort_books_by(self.sortKey)
+            return
+        __key, __reverse = __specs[0]
+        __func = lambda bi: sort_value(__key, bi)
+        self.books = list(merge(self.books, sorted(listBI, key=__func, reverse=__reverse), \
+                                key=__func, reverse=__reverse))
 
-    def __sort_books_by_author(self):
+    def json_path(self, name, fArchive=False, compressed=None, lib=None):
         '''
-        Sort book_item instances by ascending author name, with simple string comparing
+        Get the path of a book JSON with name under the layout of database
+
+        Parameters
+        ----------
+        name : str
+            the name of JSON without extension
+        fArchive : bool
+            True for the path in dbArchive
+        compressed : bool
+            True for .json.gz extension. None to follow the storage of database
+        lib : library instance
+            the library of database, the home library if None
+
+        Returns
+        -------
+        str
         '''
-        self.books = sorted(self.books, key=lambda x: x.get_author())
+        lib = lib or self.libraries[0]
+        if compressed is None:
+            compressed = lib.storage == "gzip"
+        return book_json_path(lib.dbArchive if fArchive else lib.dbJSON, name, lib.layout, \
+                compressed)
 
-    def __sort_books_by_title(self):
+    def has_book_name(self, name):
         '''
-        Sort book_item instances by ascending author name, with simple string comparing
+        Check if a book JSON with name exists on the shelf or in the archive, in either layout
         '''
-        self.books = sorted(self.books, key=lambda x: x.get_title(short=False))
+        return book_exists(self.dbJSON, name) or book_exists(self.dbArchive, name)
 
     def add_new_book(self, bi):
         '''
@@ -177,15 +417,96 @@ class manager():
         '''
         assert isinstance(bi, book_item)
         self.books.append(bi)
+        self.reindex(bi)
+
+    def replace_books(self, listBI, removed=()):
+        '''
+        Put reloaded book items on the shelf, e.g. after their JSONs are changed by other tools.
+        An item replaces the book with the same filepath, or is added if there is none.
+        The books are sorted again by the current sort key.
+
+        Parameters
+        ----------
+        listBI : list of book_item instances
+        removed : iterable of str
+            the paths of JSONs no longer on the shelf, whose books are dropped
+
+        Returns
+        -------
+        bool : True if the order of books is changed, i.e. a book is added, removed or moved
+        '''
+        __pathsOld = [bi.filepath for bi in self.books]
+        __index = {path: i for i, path in enumerate(__pathsOld)}
+        __removed = set(removed)
+        for bi in listBI:
+            i = __index.get(bi.filepath, None)
+            if i is None:
+                self.books.append(bi)
+            else:
+                if self.__fuzzy is not None:
+                    self.__fuzzy.remove(self.books[i])
+                self.books[i] = bi
+            self.reindex(bi)
+        if __removed:
+            for bi in self.books:
+                if bi.filepath in __removed and self.__fuzzy is not None:
+                    self.__fuzzy.remove(bi)
+            self.books = [bi for bi in self.books if bi.filepath not in __removed]
+        self.sort_books_by(self.sortKey)
+        return [bi.filepath for bi in self.books] != __pathsOld
+
+    @staticmethod
+    def __fuzzy_texts(bi):
+        '''
+        the texts of a book item for fuzzy search
+        '''
+        return [bi.get_title(), bi.get_key("titleShort"), bi.get_author()]
+
+    def reindex(self, bi):
+        '''
+        Update the fuzzy search index for a book item on the shelf,
+        after its title or author is edited. Nothing is done if the index is not built.
+
+        Parameters
+        ----------
+        bi : book_item instance
+        '''
+        if self.__fuzzy is not None:
+            self.__fuzzy.add(bi, self.__fuzzy_texts(bi))
+
+    def fuzzy_find(self, query, limit=20):
+        '''
+        Find books on the shelf whose title, short title or author is similar to query,
+        tolerant to typos. The trigram index is built on the first call.
+
+        Parameters
+        ----------
+        query : str
+        limit : int
 
+        Returns
+        -------
+        list of int : indices of books, the most similar first
+        '''
+        if self.__fuzzy is None:
+            from readmanager.fuzzy import trigram_index
+            self.__fuzzy = trigram_index()
+            for bi in self.books:
+                self.__fuzzy.add(bi, self.__fuzzy_texts(bi))
+        results = self.__fuzzy.query(query, limit)
+        if not results:
+            return []
+        __indices = {id(bi): i for i, bi in enumerate(self.books)}
+        return [__indices[id(bi)] for bi, _ in results]
+
+    @profiler.timed("manager.save")
     def update_json_all(self):
         '''
         Update all book_item JSONs with update_json method
         '''
-        for bi in self.books:
-            bi.update_json()
-        for bi in self.booksArchive:
-            bi.update_json()
+        for bi in self.books + self.booksArchive:
+            bi.update_json(store=self.library_of(bi).backup)
+        self.publish_snapshot()
 
     def refresh(self):
         '''
@@ -224,6 +545,7 @@ class manager():
                     
         return [bi.get_key(key) for bi in self.books]
 
+    @profiler.timed("manager.progress")
     def get_progress_all(self):
         '''
         get progress of all books
@@ -243,8 +565,24 @@ class manager():
         otherwise str : the path of note
         '''
         assert iBI < len(self.books)
-        noteLoc = self.books[iBI].get_key("noteLocation")
-        noteType = self.books[iBI].get_key("noteType")
+        return self.get_note_path_of(self.books[iBI])
+
+    def get_note_path_of(self, bi):
+        '''
+        Get the note path of a book item, which can be either on the shelf or in the archive.
+        A note location "-/" is under the dbNote of the library owning the book
+
+        Parameters
+        ----------
+        bi : book_item instance
+
+        Returns
+        -------
+        None : if the book item does not have note
+        otherwise str : the path of note
+        '''
+        noteLoc = bi.get_key("noteLocation")
+        noteType = bi.get_key("noteType")
      
         if noteLoc is None or noteType is None:
             return None
@@ -253,7 +591,7 @@ class manager():
         notePath = os.path.join(os.path.expanduser(noteLoc), notePrefix)
         notePath = notePath + "." + noteType
         if notePath.startswith("-/"):
-            notePath = os.path.join(self.dbNote, notePath[2:])
+            notePath = os.path.join(self.library_of(bi).dbNote, notePath[2:])
         return notePath
 
     def get_first_match(self, key, pattern):
@@ -262,6 +600,7 @@ class manager():
         '''
         pass
 
+    @profiler.timed("manager.file_state")
     def get_note_source_state(self, iBI):
         '''
         Parameters
@@ -286,16 +625,111 @@ class manager():
         
         return tuple(state)
 
-# TODO archive/unarchive books
+    def filter_indices(self, filterTitle='', filterAuthor='', filterTag='', fAnd=True, \
+                       fFinished=False, fArchive=False):
+        '''
+        Get the indices of books passing the filter. See book_item.filter
+
+        Parameters
+        ----------
+        filterTitle : str, list or tuple
+        filterAuthor : str, list or tuple
+        filterTag : str, list or tuple
+        fAnd : bool
+        fFinished : bool
+            if True, select finished books only
+        fArchive : bool
+            if True, filter the archived books instead
+
+        Returns
+        -------
+        list of int
+        '''
+        __books = self.booksArchive if fArchive else self.books
+        __indices = []
+        for i, bi in enumerate(__books):
+            if fFinished and bi.pageCurrent < bi.pageTotal:
+                continue
+            if bi.filter(filterTitle, filterAuthor, filterTag, fAnd):
+                __indices.append(i)
+        return __indices
+
+    @profiler.timed("manager.views")
+    def view_indices(self, name):
+        '''
+        Get the indices of books in the saved view name. See readmanager.views
+
+        Only the books added or modified since the last call are evaluated again
+
+        Parameters
+        ----------
+        name : str
+
+        Returns
+        -------
+        list of int
+
+        Raises
+        ------
+        KeyError : if there is no view name
+        '''
+        if name not in self.views:
+            raise KeyError("no view \"%s\". Available: %s" % (name, ", ".join(self.views.names())))
+        return self.views.members(name, self.books)
+
+    @profiler.timed("manager.archive")
     def archive(self, iBI, op):
         '''
         Archive/Unarchive
 
+        The JSON files are moved between dbJSON and dbArchive of their library by os.replace,
+        and the books and booksArchive lists are updated in place without reloading.
+        Unarchived books are merged into books keeping the current sort order.
+
         Parameters
         ----------
         iBI : int or a list of int
-            index or list of indices of book item
+            index or list of indices of book item,
+            in books for "arch" and in booksArchive for "unarch"
         op : str, "arch" or "unarch"
-        
+
+        Returns
+        -------
+        list of book_item : the moved book items
         '''
-        pass
+        if op == "arch":
+            __src, __fArchive = self.books, True
+        elif op == "unarch":
+            __src, __fArchive = self.booksArchive, False
+        else:
+            raise ValueError("op should be either \"arch\" or \"unarch\".")
+        if isinstance(iBI, int):
+            iBI = [iBI]
+        for i in iBI:
+            assert -len(__src) <= i < len(__src)
+        # unique, non-negative indices
+        __indices = sorted(set(i % len(__src) for i in iBI))
+
+        __movedIndices = set()
+        try:
+            for i in __indices:
+                bi = __src[i]
+                bi.relocate(self.json_path(book_name(bi.filepath), __fArchive, \
+                        is_compressed(bi.filepath), self.library_of(bi)))
+                __movedIndices.add(i)
+        finally:
+            # even if a move fails, the lists follow the files already moved.
+            # remove in a single pass to keep the order of the remaining
+            __moved = [__src[i] for i in sorted(__movedIndices)]
+            __src[:] = [bi for i, bi in enumerate(__src) if i not in __movedIndices]
+            if op == "arch":
+                self.booksArchive.extend(__moved)
+            else:
+                self.__insert_sorted(__moved)
+            for bi in __moved:
+                if self.__fuzzy is not None:
+                    if op == "arch":
+                        self.__fuzzy.remove(bi)
+                    else:
+                        self.reindex(bi)
+        return __moved
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+'''
+Extraction of the page count, title and author from local PDF and EPUB sources,
+by pure-Python parsing.
+
+PDF: the /Count of the root of page tree, following /Root in the trailer (or the
+cross-reference stream), with objects looked up both in the file and in the
+compressed object streams. If the root is not found, the largest /Count of
+the page tree nodes is used. Title and author are read from the /Info dictionary.
+
+EPUB: title (dc:title) and author (dc:creator) from the OPF package document.
+Pages are the entries of the page list (EPUB 3 navigation or EPUB 2 NCX) if provided,
+otherwise estimated from the text of the spine documents at charsPerPage per page.
+
+The results are cached by the sha256 of file, and the hash by path, mtime and size,
+so a file is read again only when it is changed, and copies are parsed once.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import re
+import json
+import zlib
+import hashlib
+import posixpath
+from readmanager import profiler
+# zipfile, xml.etree and concurrent.futures are imported when used,
+# to keep them out of the start-up of readmana
+
+nameCache = "metadata.json"
+typesSource = ("pdf", "epub")
+charsPerPage = 1500
+
+__reObj = re.compile(rb'(?<![0-9])(\d+)\s+(\d+)\s+obj\b')
+__reRoot = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+__reInfo = re.compile(rb'/Info\s+(\d+)\s+\d+\s+R')
+__reTypePages = re.compile(rb'/Type\s*/Pages\b')
+__reTypePage = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+__reTypeObjStm = re.compile(rb'/Type\s*/ObjStm\b')
+__reTags = re.compile(r'<[^>]*>')
+__reSpace = re.compile(r'\s+')
+
+# ===========================================================
+# PDF
+def __dict_span(data, pos):
+    '''
+    Get the span of the innermost dictionary << >> enclosing pos
+    '''
+    depth = 0
+    start = pos
+    while start > 0:
+        start -= 1
+        pair = data[start:start + 2]
+        if pair == b">>":
+            depth += 1
+        elif pair == b"<<":
+            if depth == 0:
+                break
+            depth -= 1
+    else:
+        return 0, len(data)
+    depth = 0
+    end = start + 2
+    while end < len(data) - 1:
+        pair = data[end:end + 2]
+        if pair == b"<<":
+            depth += 1
+            end += 2
+        elif pair == b">>":
+            if depth == 0:
+                return start, end + 2
+            depth -= 1
+            end += 2
+        else:
+            end += 1
+    return start, len(data)
+
+def __dict_value(body, key):
+    '''
+    Get the raw value of key in a PDF dictionary, e.g. b"12" or b"3 0 R"
+    '''
+    m = re.search(rb'/' + key + rb'(?![A-Za-z])\s*(\d+\s+\d+\s+R|\d+|\(|<(?!<))', body)
+    if m is None:
+        return None
+    value = m.group(1)
+    if value == b"(":
+        return body[m.start(1):]
+    if value == b"<":
+        end = body.find(b">", m.start(1))
+        return body[m.start(1):end + 1]
+    return value
+
+def __parse_string(raw):
+    '''
+    Decode a PDF literal (...) or hex <...> string, in PDFDocEncoding or UTF-16
+    '''
+    if raw.startswith(b"<"):
+        try:
+            content = bytes.fromhex(re.sub(rb'\s', b'', raw[1:-1]).decode("ascii"))
+        except ValueError:
+            return None
+    else:
+        out = bytearray()
+        depth = 0
+        i = 1
+        escapes = {ord('n'): b"\n", ord('r'): b"\r", ord('t'): b"\t", ord('b'): b"\b", \
+                   ord('f'): b"\f"}
+        while i < len(raw):
+            c = raw[i]
+            if c == 0x5c and i + 1 < len(raw):
+                n = raw[i + 1]
+                if n in escapes:
+                    out += escapes[n]
+                    i += 2
+                elif 0x30 <= n <= 0x37:
+                    m = re.match(rb'[0-7]{1,3}', raw[i + 1:i + 4])
+                    out.append(int(m.group(0), 8) & 0xff)
+                    i += 1 + len(m.group(0))
+                elif n in (0x0a, 0x0d):
+                    i += 2
+                else:
+                    out.append(n)
+                    i += 2
+                continue
+            if c == 0x28:
+                depth += 1
+            elif c == 0x29:
+                if depth == 0:
+                    break
+                depth -= 1
+            out.append(c)
+            i += 1
+        content = bytes(out)
+    if content.startswith(b"\xfe\xff"):
+        text = content[2:].decode("utf-16-be", errors="replace")
+    elif content.startswith(b"\xef\xbb\xbf"):
+        text = content[3:].decode("utf-8", errors="replace")
+    else:
+        text = content.decode("latin-1")
+    return text.strip() or None
+
+def __stream_data(data, posDict):
+    '''
+    Get the (decompressed if FlateDecode) data of the stream whose dictionary spans posDict
+    '''
+    start, end = posDict
+    m = re.compile(rb'\s*stream\r?\n').match(data, end)
+    if m is None:
+        return None
+    stop = data.find(b"endstream", m.end())
+    if stop < 0:
+        return None
+    raw = data[m.end():stop]
+    if b"/FlateDecode" not in data[start:end]:
+        return raw
+    try:
+        return zlib.decompressobj().decompress(raw)
+    except zlib.error:
+        return None
+
+def __pdf_objects(data):
+    '''
+    Index the objects of PDF
+
+    Returns
+    -------
+    dict : object number -> the dictionary bytes of object, the latest definition kept
+    list of bytes : decompressed object streams
+    '''
+    objects = {}
+    streams = []
+    for m in __reObj.finditer(data):
+        end = data.find(b"endobj", m.end())
+        if end < 0:
+            end = len(data)
+        stop = data.find(b"stream", m.end(), end)
+        objects[int(m.group(1))] = data[m.end():stop if stop >= 0 else end]
+    for m in __reTypeObjStm.finditer(data):
+        span = __dict_span(data, m.start())
+        body = data[span[0]:span[1]]
+        stream = __stream_data(data, span)
+        nObj, first = __dict_value(body, b"N"), __dict_value(body, b"First")
+        if stream is None or nObj is None or first is None or not nObj.isdigit() \
+                or not first.isdigit():
+            continue
+        streams.append(stream)
+        header = stream[:int(first)].split()
+        pairs = [(int(header[i]), int(header[i + 1])) for i in range(0, min(len(header), \
+                2 * int(nObj)) - 1, 2)]
+        for i, (num, offset) in enumerate(pairs):
+            endObj = pairs[i + 1][1] if i + 1 < len(pairs) else len(stream) - int(first)
+            objects.setdefault(num, stream[int(first) + offset:int(first) + endObj])
+    return objects, streams
+
+def __resolve(objects, ref):
+    '''
+    Get the object referred to by b"N G R"
+    '''
+    if ref is None or not ref.endswith(b"R"):
+        return None
+    return objects.get(int(ref.split()[0]), None)
+
+@profiler.timed("metadata.pdf")
+def pdf_info(path):
+    '''
+    Extract the page count, title and author of a PDF
+
+    Returns
+    -------
+    dict : with keys "pages", "title" and "author", None if not found
+    '''
+    with open(path, 'rb') as hFileIn:
+        data = hFileIn.read()
+    objects, streams = __pdf_objects(data)
+    info = {"pages": None, "title": None, "author": None}
+    roots = __reRoot.findall(data)
+    if roots:
+        catalog = objects.get(int(roots[-1]), None)
+        pages = __resolve(objects, __dict_value(catalog, b"Pages")) if catalog else None
+        count = __dict_value(pages, b"Count") if pages else None
+        if count is not None and count.isdigit():
+            info["pages"] = int(count)
+    if info["pages"] is None:
+        counts = []
+        for text in [data] + streams:
+            for m in __reTypePages.finditer(text):
+                start, end = __dict_span(text, m.start())
+                count = __dict_value(text[start:end], b"Count")
+                if count is not None and count.isdigit():
+                    counts.append(int(count))
+        if counts:
+            info["pages"] = max(counts)
+        else:
+            info["pages"] = sum(len(__reTypePage.findall(text)) for text in [data] + streams) \
+                    or None
+    infos = __reInfo.findall(data)
+    # strings are not readable in an encrypted PDF
+    if infos and not re.search(rb'/Encrypt\s*(\d|<<)', data):
+        dictInfo = objects.get(int(infos[-1]), None)
+        for key in ["title", "author"]:
+            raw = __dict_value(dictInfo, key.capitalize().encode()) if dictInfo else None
+            if raw is not None and raw[:1] in (b"(", b"<"):
+                info[key] = __parse_string(raw)
+    return info
+
+# ===========================================================
+# EPUB
+__nsOPF = "{http://www.idpf.org/2007/opf}"
+__nsDC = "{http://purl.org/dc/elements/1.1/}"
+
+def __count_page_list(zf, pathItem, mediaType):
+    '''
+    Count the entries of the page list in a navigation document or NCX, 0 if none
+    '''
+    try:
+        text = zf.read(pathItem).decode("utf-8", errors="replace")
+    except KeyError:
+        return 0
+    if "ncx" in mediaType:
+        m = re.search(r'<pageList\b.*?</pageList>', text, re.S)
+        return len(re.findall(r'<pageTarget\b', m.group(0))) if m else 0
+    m = re.search(r'<nav\b[^>]*epub:type="page-list"[^>]*>.*?</nav>', text, re.S)
+    return len(re.findall(r'<li\b', m.group(0))) if m else 0
+
+@profiler.timed("metadata.epub")
+def epub_info(path):
+    '''
+    Extract the page count, title and author of an EPUB
+
+    Returns
+    -------
+    dict : with keys "pages", "title" and "author", None if not found
+    '''
+    import zipfile
+    import xml.etree.ElementTree as ET
+    info = {"pages": None, "title": None, "author": None}
+    with zipfile.ZipFile(path) as zf:
+        container = ET.fromstring(zf.read("META-INF/container.xml"))
+        rootfile = container.find(".//{urn:oasis:names:tc:opendocument:xmlns:container}rootfile")
+        pathOPF = rootfile.get("full-path")
+        dirOPF = posixpath.dirname(pathOPF)
+        opf = ET.fromstring(zf.read(pathOPF))
+        title = opf.find(".//%stitle" % __nsDC)
+        if title is not None and title.text:
+            info["title"] = title.text.strip()
+        authors = [c.text.strip() for c in opf.iter("%screator" % __nsDC) if c.text]
+        if authors:
+            info["author"] = ", ".join(authors)
+        manifest = {}
+        for item in opf.iter("%sitem" % __nsOPF):
+            manifest[item.get("id")] = item
+        nPages = 0
+        for item in manifest.values():
+            mediaType = item.get("media-type", "")
+            if "nav" in (item.get("properties") or "").split() or "ncx" in mediaType:
+                nPages = max(nPages, __count_page_list(zf, \
+                        posixpath.join(dirOPF, item.get("href")), mediaType))
+        if nPages == 0:
+            nChars = 0
+            for itemref in opf.iter("%sitemref" % __nsOPF):
+                item = manifest.get(itemref.get("idref"), None)
+                if item is None:
+                    continue
+                try:
+                    text = zf.read(posixpath.join(dirOPF, item.get("href"))).decode( \
+                            "utf-8", errors="replace")
+                except KeyError:
+                    continue
+                body = text.split("<body", 1)[-1]
+                nChars += len(__reSpace.sub(" ", __reTags.sub(" ", body)).strip())
+            nPages = -(-nChars // charsPerPage)
+        info["pages"] = nPages or None
+    return info
+
+# ===========================================================
+def extract(path):
+    '''
+    Extract the metadata of a local source, dispatched by extension
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    dict : with keys "pages", "title" and "author", None if not found.
+        None if the type is not supported
+    '''
+    ext = os.path.splitext(path)[1][1:].lower()
+    if ext == "pdf":
+        return pdf_info(path)
+    if ext == "epub":
+        return epub_info(path)
+    return None
+
+def hash_file(path):
+    '''
+    Get the sha256 hex digest of a file, read in chunks
+    '''
+    h = hashlib.sha256()
+    with open(path, 'rb') as hFileIn:
+        for chunk in iter(lambda: hFileIn.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def __extract_file(path, digest=None):
+    '''
+    Hash and extract a file, in a worker process
+
+    Returns
+    -------
+    str, dict : the hash and metadata, the latter None if not readable
+    '''
+    digest = digest or hash_file(path)
+    try:
+        return digest, extract(path)
+    except Exception:
+        # a broken or unusual file should not stop the bulk extraction
+        return digest, None
+
+class metadata_cache():
+    '''
+    Cache of extracted metadata in a JSON file
+
+    attributes:
+        private:
+            __files : dict
+                path -> [mtime_ns, size, hash]
+            __info : dict
+                hash -> metadata
+    '''
+
+    def __init__(self, pathCache=None):
+        self.pathCache = pathCache
+        self.__files = {}
+        self.__info = {}
+        if pathCache is not None and os.path.isfile(pathCache):
+            with open(pathCache, 'r') as hFileIn:
+                cache = json.load(hFileIn)
+            self.__files = cache.get("files", {})
+            self.__info = cache.get("info", {})
+
+    def lookup(self, path):
+        '''
+        Get the cached hash and metadata of an unchanged file
+
+        Returns
+        -------
+        str, dict : the hash (None if the file is changed) and metadata
+            (None if not cached)
+        '''
+        st = os.stat(path)
+        entry = self.__files.get(path, None)
+        if entry is None or entry[:2] != [st.st_mtime_ns, st.st_size]:
+            return None, None
+        return entry[2], self.__info.get(entry[2], None)
+
+    def has_hash(self, digest):
+        '''
+        Check if the metadata of a file with hash digest is cached
+        '''
+        return digest in self.__info
+
+    def get(self, digest):
+        '''
+        Get the cached metadata of a file with hash digest
+        '''
+        return self.__info.get(digest, None)
+
+    def store(self, path, digest, info):
+        '''
+        Record the hash and metadata of a file
+        '''
+        st = os.stat(path)
+        self.__files[path] = [st.st_mtime_ns, st.st_size, digest]
+        self.__info[digest] = info
+
+    def save(self):
+        '''
+        Write the cache file, dropping metadata no longer referred to
+        '''
+        if self.pathCache is None:
+            return
+        used = set(entry[2] for entry in self.__files.values())
+        self.__info = {k: v for k, v in self.__info.items() if k in used}
+        os.makedirs(os.path.dirname(self.pathCache), exist_ok=True)
+        pathTmp = self.pathCache + ".tmp%d" % os.getpid()
+        with open(pathTmp, 'w') as hFileOut:
+            json.dump({"files": self.__files, "info": self.__info}, hFileOut)
+        os.replace(pathTmp, self.pathCache)
+
+@profiler.timed("metadata.extract_all")
+def extract_all(paths, pathCache=None, nWorkers=None, verbose=False):
+    '''
+    Extract the metadata of many sources, in a process pool
+
+    Parameters
+    ----------
+    paths : iterable of str
+        paths of source files. Those not found or not supported are skipped
+    pathCache : str
+        the cache file. None for no cache
+    nWorkers : int
+        the number of processes. None for the number of CPUs, 1 to run in this process
+    verbose : bool
+
+    Returns
+    -------
+    dict : path -> metadata, for the sources read successfully
+    '''
+    cache = metadata_cache(pathCache)
+    results = {}
+    todo = []
+    for path in dict.fromkeys(paths):
+        if path is None or os.path.splitext(path)[1][1:].lower() not in typesSource \
+                or not os.path.isfile(path):
+            continue
+        digest, info = cache.lookup(path)
+        if digest is None:
+            todo.append(path)
+        elif info is not None:
+            results[path] = info
+    # hash the changed files first, so that copies of cached files are not parsed
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=nWorkers) \
+            if nWorkers != 1 and len(todo) > 1 else None
+    try:
+        digests = list(pool.map(hash_file, todo, chunksize=8)) if pool \
+                else [hash_file(path) for path in todo]
+        toParse = []
+        for path, digest in zip(todo, digests):
+            if cache.has_hash(digest):
+                cache.store(path, digest, cache.get(digest))
+            else:
+                toParse.append((path, digest))
+        if pool and len(toParse) > 1:
+            extracted = list(pool.map(__extract_file, *zip(*toParse), chunksize=8))
+        else:
+            extracted = [__extract_file(path, digest) for path, digest in toParse]
+    finally:
+        if pool:
+            pool.shutdown()
+    for (path, _), (digest, info) in zip(toParse, extracted):
+        cache.store(path, digest, info)
+    for path in todo:
+        info = cache.lookup(path)[1]
+        if info is not None:
+            results[path] = info
+    cache.save()
+    if verbose:
+        print("--  %d sources changed, %d of them parsed" % (len(todo), len(toParse)))
+    return results
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+'''
+Delta sync of a library to a mirror directory.
+
+Each directory synced keeps a manifest of the files copied to it, i.e. the relative path ->
+size, mtime and SHA-256 of content, in its .manifest. At each sync, a file of the source whose
+size and mtime are those in the manifest, and of its copy in the mirror, is taken as unchanged
+without reading it. The other files are hashed in parallel, and copied only if their contents
+differ from those in the manifest. A copy is written to a temporary file and moved by os.replace,
+so the mirror never has a partial file. The files copied before but removed from the source
+are removed from the mirror, as are those removed between the scan and their hash or copy.
+Files in the mirror not in the manifest are left alone.
+Subdirectories of the source can be skipped, e.g. the cache of a library, which is local to
+the machine.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import re
+import json
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from readmanager import profiler
+
+# not ending with .json, not to be taken as a book JSON
+nameManifest = ".manifest"
+# temporary files of atomic writes, e.g. of snapshot and codec
+__reTemp = re.compile(r"\.tmp\d+$")
+
+def hash_file(path):
+    '''
+    Get the SHA-256 of the content of the file at path
+    '''
+    h = hashlib.sha256()
+    with open(path, 'rb') as hFileIn:
+        for chunk in iter(lambda: hFileIn.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def __hash_or_none(path):
+    '''
+    Get the SHA-256 of the file at path, None if it is removed after the scan
+    '''
+    try:
+        return hash_file(path)
+    except FileNotFoundError:
+        return None
+
+def scan(dirSrc, dirsSkip=()):
+    '''
+    Get the stats of files under dirSrc, except the manifest and temporary files
+
+    Parameters
+    ----------
+    dirSrc : str
+    dirsSkip : list of str
+        the subdirectories not entered, relative to dirSrc, e.g. [".readmana"]
+
+    Returns
+    -------
+    dict : relative path with "/" -> (size, mtime_ns)
+    '''
+    stats = {}
+    dirsSkip = set(os.path.normpath(os.path.join(dirSrc, d)) for d in dirsSkip)
+    for dirPath, dirNames, fileNames in os.walk(dirSrc):
+        dirNames[:] = [d for d in dirNames \
+                if os.path.normpath(os.path.join(dirPath, d)) not in dirsSkip]
+        for fileName in fileNames:
+            if fileName == nameManifest or __reTemp.search(fileName):
+                continue
+            path = os.path.join(dirPath, fileName)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # removed in the meantime
+                continue
+            stats[os.path.relpath(path, dirSrc).replace(os.sep, "/")] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+def load_manifest(dirDst):
+    '''
+    Load the manifest of the mirror dirDst
+
+    Returns
+    -------
+    dict : relative path -> [size, mtime_ns, sha256]. Empty if not found or broken
+    '''
+    try:
+        with open(os.path.join(dirDst, nameManifest), 'r') as hFileIn:
+            return json.load(hFileIn)["files"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+def save_manifest(dirDst, files):
+    '''
+    Write the manifest of the mirror dirDst atomically
+    '''
+    pathManifest = os.path.join(dirDst, nameManifest)
+    pathTmp = pathManifest + ".tmp%d" % os.getpid()
+    with open(pathTmp, 'w') as hFileOut:
+        json.dump({"version": 1, "files": files}, hFileOut, separators=(',', ':'))
+    os.replace(pathTmp, pathManifest)
+
+def __stat_of(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+def __copy(pathSrc, pathDst):
+    '''
+    Copy a file with its mtime, replacing the destination atomically
+    '''
+    os.makedirs(os.path.dirname(pathDst), exist_ok=True)
+    pathTmp = pathDst + ".tmp%d" % os.getpid()
+    shutil.copy2(pathSrc, pathTmp)
+    os.replace(pathTmp, pathDst)
+
+@profiler.timed("mirror.sync")
+def sync_tree(dirSrc, dirDst, nWorkers=None, dirsSkip=()):
+    '''
+    Sync the files under dirSrc to the mirror dirDst
+
+    Parameters
+    ----------
+    dirSrc : str
+    dirDst : str
+    nWorkers : int
+        the number of threads hashing files, by ThreadPoolExecutor if None
+    dirsSkip : list of str
+        the subdirectories not synced, see scan. Their files synced before are removed
+
+    Returns
+    -------
+    dict : report with keys "files" (in source), "hashed", "copied", "bytes" (copied),
+        "removed" and "vanished" (removed from source after the scan, so not synced)
+    '''
+    os.makedirs(dirDst, exist_ok=True)
+    manifest = load_manifest(dirDst)
+    stats = scan(dirSrc, dirsSkip)
+    report = {"files": len(stats), "hashed": 0, "copied": 0, "bytes": 0, "removed": 0, \
+              "vanished": 0}
+
+    candidates = []
+    for path, st in stats.items():
+        entry = manifest.get(path, None)
+        if entry is not None and tuple(entry[:2]) == st and \
+                __stat_of(os.path.join(dirDst, path)) == st:
+            continue
+        candidates.append(path)
+    with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        digests = list(pool.map(lambda path: __hash_or_none(os.path.join(dirSrc, path)), \
+                candidates))
+
+    for path, digest in zip(candidates, digests):
+        pathDst = os.path.join(dirDst, path)
+        entry = manifest.get(path, None)
+        if digest is None:
+            pass
+        elif entry is not None and entry[2] == digest and __stat_of(pathDst) == tuple(entry[:2]):
+            # the source only touched, and the copy intact. Follow the mtime without copying
+            os.utime(pathDst, ns=(stats[path][1], stats[path][1]))
+        else:
+            try:
+                __copy(os.path.join(dirSrc, path), pathDst)
+            except FileNotFoundError:
+                digest = None
+            else:
+                report["copied"] += 1
+                report["bytes"] += stats[path][0]
+        if digest is None:
+            # removed from source in the meantime: removed from the mirror below
+            del stats[path]
+            report["vanished"] += 1
+            continue
+        report["hashed"] += 1
+        manifest[path] = [stats[path][0], stats[path][1], digest]
+
+    for path in [path for path in manifest if path not in stats]:
+        try:
+            os.remove(os.path.join(dirDst, path))
+            report["removed"] += 1
+        except FileNotFoundError:
+            pass
+        del manifest[path]
+    save_manifest(dirDst, manifest)
+    return report
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+'''
+Full-text search over the notes of book items.
+
+The text of md, tex and txt notes is indexed in an SQLite database under the cache
+directory of manager, using the FTS5 extension when it is available and a plain
+table otherwise. The index is updated incrementally: a note is read again only
+when its mtime or size changed, and notes no longer referred to are dropped.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import re
+import sqlite3
+from readmanager.layout import book_name
+from readmanager import profiler
+
+nameIndex = "notes.sqlite"
+typesText = ("md", "tex", "txt")
+
+def has_fts5():
+    '''
+    Check if the sqlite3 module is built with FTS5
+
+    Returns
+    -------
+    bool
+    '''
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(a)")
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+class note_index():
+    '''
+    On-disk full-text index of notes
+
+    attributes:
+        public:
+            pathIndex : str
+                the path of SQLite database
+            useFTS : bool
+                True if the FTS5 table is used
+    '''
+
+    def __init__(self, pathIndex, useFTS=None):
+        '''
+        Open or create the index at pathIndex
+
+        Parameters
+        ----------
+        pathIndex : str
+        useFTS : bool
+            None to use FTS5 if available
+        '''
+        self.pathIndex = pathIndex
+        os.makedirs(os.path.dirname(os.path.abspath(pathIndex)), exist_ok=True)
+        self.__conn = sqlite3.connect(pathIndex)
+        fFTS = self.__table_is_fts()
+        if fFTS is None:
+            self.useFTS = has_fts5() if useFTS is None else useFTS
+            self.__create_tables()
+        else:
+            self.useFTS = fFTS
+
+    def __table_is_fts(self):
+        '''
+        Returns
+        -------
+        None if the tables are not created, otherwise True for FTS5 table
+        '''
+        row = self.__conn.execute( \
+                "SELECT sql FROM sqlite_master WHERE name = 'notes'").fetchone()
+        if row is None:
+            return None
+        return "fts5" in row[0].lower()
+
+    def __create_tables(self):
+        '''
+        Create the tables. The rowid of notes is the same as that of files
+        '''
+        with self.__conn:
+            self.__conn.execute("CREATE TABLE IF NOT EXISTS files (" \
+                    "id INTEGER PRIMARY KEY, path TEXT UNIQUE, book TEXT, " \
+                    "mtime INTEGER, size INTEGER)")
+            if self.useFTS:
+                self.__conn.execute("CREATE VIRTUAL TABLE notes USING fts5(body)")
+            else:
+                self.__conn.execute("CREATE TABLE notes (body TEXT)")
+
+    def close(self):
+        '''
+        Close the database connection
+        '''
+        self.__conn.close()
+
+    @profiler.timed("notesearch.update")
+    def update(self, notes):
+        '''
+        Update the index incrementally
+
+        Parameters
+        ----------
+        notes : iterable of (str, str)
+            the book name and the path of its note. A note shared by several books
+            is indexed once, under the first of them
+
+        Returns
+        -------
+        int, int : the number of notes (re)indexed and removed
+        '''
+        indexed = {}
+        for rowid, path, book, mtime, size in \
+                self.__conn.execute("SELECT id, path, book, mtime, size FROM files"):
+            indexed[path] = (rowid, book, mtime, size)
+        nIndexed = 0
+        pathsSeen = set()
+        with self.__conn:
+            for book, pathNote in notes:
+                if pathNote is None or pathNote in pathsSeen or \
+                        os.path.splitext(pathNote)[1][1:].lower() not in typesText:
+                    continue
+                try:
+                    st = os.stat(pathNote)
+                except OSError:
+                    continue
+                pathsSeen.add(pathNote)
+                entry = indexed.get(pathNote, None)
+                if entry is not None and entry[1:] == (book, st.st_mtime_ns, st.st_size):
+                    continue
+                with open(pathNote, 'r', encoding='utf-8', errors='replace') as hFileIn:
+                    body = hFileIn.read()
+                if entry is not None:
+                    self.__delete(entry[0])
+                cur = self.__conn.execute("INSERT INTO files (path, book, mtime, size) " \
+                        "VALUES (?, ?, ?, ?)", (pathNote, book, st.st_mtime_ns, st.st_size))
+                self.__conn.execute("INSERT INTO notes (rowid, body) VALUES (?, ?)", \
+                        (cur.lastrowid, body))
+                nIndexed += 1
+            nRemoved = 0
+            for path, entry in indexed.items():
+                if path not in pathsSeen:
+                    self.__delete(entry[0])
+                    nRemoved += 1
+        return nIndexed, nRemoved
+
+    def __delete(self, rowid):
+        '''
+        Delete a note from the index
+        '''
+        self.__conn.execute("DELETE FROM notes WHERE rowid = ?", (rowid,))
+        self.__conn.execute("DELETE FROM files WHERE id = ?", (rowid,))
+
+    @profiler.timed("notesearch.search")
+    def search(self, query, limit=20):
+        '''
+        Search the notes
+
+        Parameters
+        ----------
+        query : str
+            words to search, all of which should be found. A trailing * matches a prefix
+        limit : int
+
+        Returns
+        -------
+        list of (str, str, str) : book name, note path and snippet, best match first
+        '''
+        terms = [t for t in query.split() if t.strip('*"')]
+        if not terms:
+            return []
+        if self.useFTS:
+            # quote each term to avoid FTS5 query syntax in user input
+            ftsQuery = " ".join('"%s"%s' % (t.rstrip('*').replace('"', '""'), \
+                    '*' if t.endswith('*') else '') for t in terms)
+            return [tuple(row) for row in self.__conn.execute( \
+                    "SELECT files.book, files.path, " \
+                    "snippet(notes, 0, '[', ']', '...', 12) FROM notes " \
+                    "JOIN files ON files.id = notes.rowid " \
+                    "WHERE notes MATCH ? ORDER BY bm25(notes) LIMIT ?", (ftsQuery, limit))]
+        return self.__search_plain(terms, limit)
+
+    def __search_plain(self, terms, limit):
+        '''
+        Search without FTS5, ranking by the number of occurrences of terms
+        '''
+        words = [t.rstrip('*').lower() for t in terms]
+        sqlWhere = " AND ".join(["lower(notes.body) LIKE ?"] * len(words))
+        results = []
+        for book, path, body in self.__conn.execute( \
+                "SELECT files.book, files.path, notes.body FROM notes " \
+                "JOIN files ON files.id = notes.rowid WHERE " + sqlWhere, \
+                ["%" + w.replace("%", "") + "%" for w in words]):
+            bodyLower = body.lower()
+            score = sum(bodyLower.count(w) for w in words)
+            results.append((score, book, path, make_snippet(body, words[0])))
+        results.sort(key=lambda x: x[0], reverse=True)
+        return [r[1:] for r in results[:limit]]
+
+def make_snippet(body, word, nChars=40):
+    '''
+    Cut the text around the first occurrence of word, marked by brackets
+
+    Parameters
+    ----------
+    body : str
+    word : str
+        in lower case
+    nChars : int
+        the number of characters kept on each side
+
+    Returns
+    -------
+    str
+    '''
+    i = body.lower().find(word)
+    if i < 0:
+        return ""
+    start = max(0, i - nChars)
+    end = min(len(body), i + len(word) + nChars)
+    snippet = body[start:i] + "[" + body[i:i + len(word)] + "]" + body[i + len(word):end]
+    snippet = re.sub(r'\s+', ' ', snippet)
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(body) else "")
+
+def search_notes(bm, query, limit=20):
+    '''
+    Update the note index of a manager and search it
+
+    Parameters
+    ----------
+    bm : manager instance
+    query : str
+    limit : int
+
+    Returns
+    -------
+    list of (book_item, bool, str) : the book item, True if it is archived,
+        and the snippet, best match first
+    '''
+    booksByName = {}
+    for fArchive, books in [(False, bm.books), (True, bm.booksArchive)]:
+        for bi in books:
+            booksByName[book_name(bi.filepath)] = (bi, fArchive)
+    index = note_index(os.path.join(bm.dbCache, nameIndex))
+    try:
+        index.update((name, bm.get_note_path_of(bi)) for name, (bi, _) in booksByName.items())
+        results = index.search(query, limit)
+    finally:
+        index.close()
+    return [booksByName[book] + (snippet,) for book, _, snippet in results \
+            if book in booksByName]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+'''
+Templates of new notes.
+
+A template is the text of a new note with placeholders of the book, by string.Template:
+    $title, $titleShort, $author, $tags, $pageTotal, $dateAdded, $datePlan, $today
+Unknown placeholders are kept as they are, so "$" in e.g. LaTeX math is safe unless it is
+followed by the name of a placeholder. Write "$$" for a literal "$" in that case.
+
+In tex notes, the LaTeX special characters in the values, e.g. "&" or "_", are escaped.
+
+The noteTypes md, tex and txt have a built-in template. They can be replaced by files set in
+the optional key "noteTemplates" of config, e.g.
+    "noteTemplates": {"md": "~/notes/template.md"}
+The template files are read and compiled once per modification. A template file not found
+is reported once, and the built-in template is used instead.
+Notes of a noteType without template, e.g. docx, are not created.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import datetime as dt
+from string import Template
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from readmanager import profiler
+
+templatesDefault = {
+    "md": "# $title\n\n- Author: $author\n- Tags: $tags\n- Added: $dateAdded\n- Plan: $datePlan\n\n",
+    "tex": "\\documentclass{article}\n\\title{$title}\n\\author{$author}\n\\date{$today}\n\n"
+           "\\begin{document}\n\\maketitle\n\n% Tags: $tags\n% Added: $dateAdded, plan: $datePlan\n\n"
+           "\\end{document}\n",
+    "txt": "$title\n$author\nTags: $tags\nAdded: $dateAdded, plan: $datePlan\n\n",
+    }
+# LaTeX special characters in the values of placeholders
+__escapeTex = str.maketrans({
+    "\\": "\\textbackslash{}",
+    "&": "\\&",
+    "%": "\\%",
+    "$": "\\$",
+    "#": "\\#",
+    "_": "\\_",
+    "{": "\\{",
+    "}": "\\}",
+    "~": "\\textasciitilde{}",
+    "^": "\\textasciicircum{}",
+    })
+# the template files not found, reported once
+__missing = set()
+
+@lru_cache(maxsize=None)
+def __compile_default(noteType):
+    return Template(templatesDefault[noteType])
+
+@lru_cache(maxsize=32)
+def __compile_file(path, mtime):
+    # mtime is a part of the cache key, so that an edited template is read again
+    with open(path, 'r') as hFileIn:
+        return Template(hFileIn.read())
+
+def get_template(noteType, pathTemplate=None):
+    '''
+    Get the compiled template of noteType
+
+    Parameters
+    ----------
+    noteType : str
+    pathTemplate : str
+        the template file replacing the built-in one
+
+    Returns
+    -------
+    string.Template instance, None if there is no template for noteType, e.g. docx
+    '''
+    if pathTemplate:
+        pathTemplate = os.path.expanduser(os.path.expandvars(pathTemplate))
+        try:
+            return __compile_file(pathTemplate, os.stat(pathTemplate).st_mtime_ns)
+        except FileNotFoundError:
+            if pathTemplate not in __missing:
+                __missing.add(pathTemplate)
+                print("--  Template of %s not found: %s. The built-in one is used" \
+                        % (noteType, pathTemplate))
+    if noteType not in templatesDefault:
+        return None
+    return __compile_default(noteType)
+
+def placeholders(get_key):
+    '''
+    Get the values of placeholders of a book
+
+    Parameters
+    ----------
+    get_key : function
+        key -> value of the book, e.g. book_item.get_key or dict.get
+
+    Returns
+    -------
+    dict
+    '''
+    values = {key: get_key(key) for key in \
+            ("title", "titleShort", "author", "pageTotal", "dateAdded", "datePlan")}
+    values = {key: "" if value is None else str(value) for key, value in values.items()}
+    values["titleShort"] = values["titleShort"] or values["title"]
+    values["tags"] = ", ".join(get_key("tag") or [])
+    values["today"] = str(dt.date.today())
+    return values
+
+def escape_tex(text):
+    '''
+    Escape the LaTeX special characters in text
+    '''
+    return text.translate(__escapeTex)
+
+def render(get_key, noteType, templates=None):
+    '''
+    Render the new note of a book. The values are escaped for LaTeX if noteType is tex
+
+    Parameters
+    ----------
+    get_key : function
+        see placeholders
+    noteType : str
+    templates : dict
+        noteType -> path of template file, e.g. the "noteTemplates" of config
+
+    Returns
+    -------
+    str : the text of note, None if there is no template for noteType
+    '''
+    template = get_template(noteType, (templates or {}).get(noteType, None))
+    if template is None:
+        return None
+    values = placeholders(get_key)
+    if noteType == "tex":
+        values = {key: escape_tex(value) for key, value in values.items()}
+    return template.safe_substitute(values)
+
+def write_note(pathNote, text):
+    '''
+    Write a new note, never overwriting
+
+    Returns
+    -------
+    bool : True if written, False if the note exists
+    '''
+    os.makedirs(os.path.dirname(pathNote), exist_ok=True)
+    try:
+        with open(pathNote, 'x') as hFileOut:
+            hFileOut.write(text)
+    except FileExistsError:
+        return False
+    return True
+
+@profiler.timed("notetemplate.create")
+def create_notes(books, note_path_of, templates=None, nWorkers=8):
+    '''
+    Create the missing notes of books from templates, except those of a noteType
+    without template. The notes are rendered in turn and written by a pool of threads
+
+    Parameters
+    ----------
+    books : list of book_item instances
+    note_path_of : function
+        book_item -> path of note, None if noteLocation or noteType is not set
+    templates : dict
+        see render
+    nWorkers : int
+        the number of threads writing notes
+
+    Returns
+    -------
+    list of str : the paths of notes created
+    '''
+    jobs = []
+    for bi in books:
+        pathNote = note_path_of(bi)
+        if pathNote is None or os.path.exists(pathNote):
+            continue
+        text = render(bi.get_key, bi.get_key("noteType"), templates)
+        if text is not None:
+            jobs.append((pathNote, text))
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=nWorkers) as pool:
+        written = list(pool.map(lambda job: write_note(*job), jobs))
+    return [pathNote for (pathNote, _), fWritten in zip(jobs, written) if fWritten]
@@ -6,17 +6,75 @@ Routines used to open the book and note files
 
 from __future__ import print_function, absolute_import
 import sys
-import time
+import shlex
+import shutil
 import subprocess as sp
 from readmanager.manager import manager
 from readmanager.utils import ask_for_sure
 
+# viewer processes started, reaped when they exit
+children = []
+
+def reap():
+    '''
+    Reap the viewer processes that have exited, so that no zombie is left
+
+    Returns
+    -------
+    int : the number of viewer processes still running
+    '''
+    children[:] = [proc for proc in children if proc.poll() is None]
+    return len(children)
+
+def spawn(command):
+    '''
+    Start a viewer fully detached, i.e. in a new session without the terminal as its input or output,
+    and return without waiting for it
+
+    Parameters
+    ----------
+    command : list of str
+
+    Returns
+    -------
+    Popen instance, or None if the command is not found
+    '''
+    reap()
+    try:
+        proc = sp.Popen(command, stdin=sp.DEVNULL, stdout=sp.DEVNULL, stderr=sp.DEVNULL, \
+                        start_new_session=True, close_fds=True)
+    except OSError as err:
+        print("--  Fail to open by %s: %s" % (command[0], err))
+        return None
+    children.append(proc)
+    return proc
+
+def linux_command(opener, path, ext):
+    '''
+    Get the command to open a file on Linux
+
+    Parameters
+    ----------
+    opener : dict
+        extension -> command, e.g. {"pdf": "zathura --fork"}. xdg-open is used if None
+    path : str
+    ext : str
+        the extension of file
+
+    Returns
+    -------
+    list of str
+    '''
+    if opener.get(ext, None) is not None:
+        return shlex.split(opener[ext]) + [path]
+    return ["xdg-open", path]
+
 # ===========================================================
 def open_book(bm, iBI, fNoNote=False):
     '''
     Open the book and note with the default opener in subprocess
-    and ask for page and log update
-    Note: currently support macOS only
+    and ask for page and log update, while the viewers start in background
+    Note: currently support macOS and Linux
 
     Parameters
     ----------
@@ -37,7 +95,7 @@ def open_book(bm, iBI, fNoNote=False):
     openSystem = { \
             "darwin": __open_book_darwin, \
     #        "windows": __open_book_windows, \
-    #        "linux": __open_book_linux, \
+            "linux": __open_book_linux, \
             }
     platform = sys.platform
 
@@ -69,11 +127,10 @@ def open_book(bm, iBI, fNoNote=False):
         book.update_page("current", __pageNew)
         book.update_last_time("read")
         book.update_log()
-        book.update_json()
+        book.update_json(store=bm.library_of(book).backup)
         print("--  Log, JSON updated :)")
     else:
         print("--  Maybe next time :)")
-    time.sleep(1)
 
 def __open_book_darwin(bm, states, paths, exts, fNoNote=False):
     '''
@@ -108,9 +165,9 @@ def __open_book_darwin(bm, states, paths, exts, fNoNote=False):
 
     # start opening by calling subprocess
     if stateNote and not fNoNote:
-        noteProc = sp.Popen(openerNote)
+        spawn(openerNote)
     if stateFile:
-        fileProc = sp.Popen(openerFile)
+        spawn(openerFile)
 
 # TODO Windows open utility
 def __open_book_windows(bm, states, paths, exts, fNoNote=False):
@@ -150,10 +207,10 @@ def __open_book_windows(bm, states, paths, exts, fNoNote=False):
     if stateFile:
         fileProc = sp.Popen(openerFile)
 
-# TODO Linux open utility
 def __open_book_linux(bm, states, paths, exts, fNoNote=False):
     '''
-    Open the book and note with the default opener in subprocess for Linux
+    Open the book and note with the commands in bm.opener, or xdg-open,
+    in subprocess for Linux
 
     Parameters
     ----------
@@ -169,22 +226,15 @@ def __open_book_linux(bm, states, paths, exts, fNoNote=False):
     pathNote, pathFile = paths
     extNote, extFile = exts
 
-    openerNote = ["", pathNote]
-    openerFile = ["", pathFile]
-
-    if extFile == '':
-        # opener with Textedit for file without extension
-        openerFile.append("")
-    if extNote in bm.opener:
-        if bm.opener[extNote] is not None:
-            openerNote.extend(["", bm.opener[extNote]])
-    if extFile in bm.opener:
-        if bm.opener[extFile] is not None:
-            openerFile.extend(["", bm.opener[extFile]])
-
-    # start opening by calling subprocess
-    if stateNote and not fNoNote:
-        noteProc = sp.Popen(openerNote)
-    if stateFile:
-        fileProc = sp.Popen(openerFile)
+    openerNote = linux_command(bm.opener, pathNote, extNote)
+    openerFile = linux_command(bm.opener, pathFile, extFile)
+    # start opening by calling subprocess, both in background.
+    # Failing to open one does not keep the other from opening
+    for opener, state in [(openerNote, stateNote and not fNoNote), (openerFile, stateFile)]:
+        if not state:
+            continue
+        if opener[0] == "xdg-open" and shutil.which("xdg-open") is None:
+            print("--  xdg-open is not found. Set the opener in config.json, or open manually.")
+            continue
+        spawn(opener)
 
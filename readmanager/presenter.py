@@ -6,8 +6,10 @@ the presenter class is defined to show the reading and note progress of books
 from __future__ import print_function, absolute_import
 import sys
 import re
-import subprocess as sp
+import os
 from readmanager.manager import manager
+from readmanager import profiler
+from readmanager.forecast import forecast_all, forecast_str, forecast_finish
 #from readmanager.bookitem import book_item
 try:
     import curses
@@ -23,15 +25,24 @@ class presenter:
     __lenNoteMark = 2
     __lenSourceMark = 2
     __lenProg = 4
+    # optional column of forecast finish date, taken from the progress bar
+    __lenForecast = 12
+    # optional column of the library of book when libraries are federated, likewise
+    __lenSource = 10
+    # the progress bar is not narrowed below, the optional columns not fitting are dropped
+    __lenProgBarMin = 12
     # get terminal widths, allocate proportionally for title, author and ProgBar
     if sys.platform.lower() in ["linux", "darwin"]:
-        __rows, __cols = sp.check_output(['stty', 'size']).split()
+        # as by stty size, without starting a process
+        __cols, __rows = os.get_terminal_size(sys.stdin.fileno())
+        __nRows = int(__rows)
         __colsAvail = int(__cols) - \
                 __lenIndex - __lenPageTot - __lenNoteMark - __lenSourceMark -__lenProg
         __lenTitle = int(__colsAvail * 0.33)
         __lenAuthor = int(__colsAvail * 0.2)
         __lenProgBar = __colsAvail - __lenTitle - __lenAuthor
     else:
+        __nRows = None
         __lenTitle = 72
         __lenAuthor = 40
         __lenProgBar = 102
@@ -68,14 +79,24 @@ class presenter:
             )
     __lenHead = len(__head) - len(__colorHead) - len(__colorEnd)
 
-    def __init__(self, bookmanager):
+    def __init__(self, bookmanager, showForecast=False):
         '''
         Initialize
+
+        Parameters
+        ----------
+        bookmanager : manager instance
+        showForecast : bool
+            flag to show the column of forecast finish date
         '''
         assert isinstance(bookmanager, manager)
         self.__manager = bookmanager
+        self.showForecast = showForecast
+        # the saved view shown, None for all books
+        self.view = None
         self.__build()
 
+    @profiler.timed("presenter.build")
     def __build(self):
         '''
         Build the items to show
@@ -85,6 +106,64 @@ class presenter:
         self.__authors = self.__manager.get_keys("author")
         self.__progress = self.__manager.get_progress_all()
         self.__pages = self.__manager.get_keys("pageTotal")
+        self.__forecast = []
+        self.__sources = []
+        self.__lenBarShow = self.__lenProgBar
+        self.__headShow = self.__head
+        # the optional columns shown, in the narrow terminal maybe not all of those asked
+        self.__fForecast = self.showForecast and \
+                self.__lenBarShow - self.__lenForecast >= self.__lenProgBarMin
+        if self.__fForecast:
+            self.__forecast = forecast_all(self.__manager)
+            self.__lenBarShow -= self.__lenForecast
+        self.__fSource = len(self.__manager.libraries) > 1 and \
+                self.__lenBarShow - self.__lenSource >= self.__lenProgBarMin
+        if self.__fSource:
+            self.__sources = self.__manager.get_sources()
+            self.__lenBarShow -= self.__lenSource
+        if self.__lenBarShow != self.__lenProgBar:
+            self.__headShow = self.__formatItem % (\
+                self.__colorHead, \
+                self.__lenIndex, "#", \
+                self.__lenAuthor, self.__lenAuthor, "Author", \
+                self.__lenTitle, self.__lenTitle, "Title", \
+                self.__lenPageTot, "Page", \
+                self.__lenNoteMark, "N", \
+                self.__lenSourceMark, "S", \
+                self.__lenBarShow, "Progress", \
+                self.__lenProg, "%", \
+                self.__extra_columns("Finish", "Library"), \
+                )
+
+    def __extra_columns(self, strForecast, strSource):
+        '''
+        Format the optional columns, ended with the color end code
+        '''
+        columns = ""
+        if self.__fForecast:
+            columns += "%*s" % (self.__lenForecast, strForecast)
+        if self.__fSource:
+            columns += "  %-*.*s" % (self.__lenSource - 2, self.__lenSource - 2, strSource)
+        return columns + self.__colorEnd
+
+    def set_forecast(self, flag):
+        '''
+        Show (True) or hide (False) the column of forecast finish date
+        '''
+        self.showForecast = flag
+        self.__build()
+
+    def set_view(self, name):
+        '''
+        Show the books in the saved view name only, or all books if name is None
+
+        Raises
+        ------
+        KeyError : if there is no view name
+        '''
+        if name is not None and name not in self.__manager.views:
+            raise KeyError("no view \"%s\"" % name)
+        self.view = name
 
     def rebuild(self):
         '''
@@ -92,6 +171,7 @@ class presenter:
         '''
         self.__build()
 
+    @profiler.timed("presenter.render")
     def show(self, filterAuthor='', filterTitle='', filterTag='', fAnd=True):
         '''
         Show the presenter
@@ -101,13 +181,86 @@ class presenter:
         if self.__nBooks != len(self.__manager):
             self.__build()
         
-        print("=" * self.__lenHead)
-        print(self.__head)
-        for iBI in range(self.__nBooks):
-            flag = self.__manager[iBI].filter(filterAuthor, filterTitle, filterTag, fAnd)
-            if flag:
-                self.print_item_status(iBI)
-        print("=" * self.__lenHead)
+        if filterAuthor or filterTitle or filterTag or not fAnd:
+            indices = [iBI for iBI in range(self.__nBooks) \
+                    if self.__manager[iBI].filter(filterAuthor, filterTitle, filterTag, fAnd)]
+        elif self.view is not None and self.view in self.__manager.views:
+            indices = self.__manager.view_indices(self.view)
+        else:
+            indices = range(self.__nBooks)
+        self.__print_table(indices)
+
+    @profiler.timed("presenter.render")
+    def show_indices(self, indices):
+        '''
+        Show the book items at indices only, in the given order
+
+        Parameters
+        ----------
+        indices : list of int
+            indices of items in self.__manager.books
+        '''
+        if self.__nBooks != len(self.__manager):
+            self.__build()
+        self.__print_table(indices)
+
+    def __print_table(self, indices):
+        '''
+        Print the head and the items at indices, in one write
+        '''
+        lines = ["=" * self.__lenHead, self.__headShow]
+        lines.extend(self.format_item_status(iBI) for iBI in indices)
+        lines.append("=" * self.__lenHead)
+        print("\n".join(lines))
+
+    def update_rows(self, indices):
+        '''
+        Redraw the rows of book items at indices in place, by cursor movement,
+        after the items are changed but not reordered.
+        The table should be shown by show from the top of a cleared screen.
+        It is shown again if the books are added or removed,
+        or it does not fit in the terminal, as the rows are then not addressable.
+
+        Parameters
+        ----------
+        indices : list of int
+            indices of items in self.__manager.books
+
+        Returns
+        -------
+        bool : True if only the rows are redrawn, False if the table is shown again
+        '''
+        if self.__nBooks != len(self.__manager) or self.__nRows is None \
+                or self.__nBooks + 3 >= self.__nRows:
+            self.__build()
+            print("\033[H\033[J", end="")
+            self.show()
+            return False
+        for iBI in indices:
+            bi = self.__manager[iBI]
+            self.__titles[iBI] = bi.get_key("title")
+            self.__authors[iBI] = bi.get_key("author")
+            self.__progress[iBI] = bi.get_progress()
+            self.__pages[iBI] = bi.get_key("pageTotal")
+            if self.__fForecast:
+                self.__forecast[iBI] = forecast_finish(bi)
+        # the rule and head take the first two rows
+        sys.stdout.write("".join("\033[%d;1H%s\033[K" % (iBI + 3, self.format_item_status(iBI)) \
+                for iBI in indices))
+        sys.stdout.write("\033[%d;1H" % (self.__nBooks + 4))
+        sys.stdout.flush()
+        return True
+
+    def find_fuzzy(self, query, limit=20):
+        '''
+        Show the book items whose title or author is similar to query, the most similar first
+
+        Parameters
+        ----------
+        query : str
+        limit : int
+        '''
+        self.show_indices(self.__manager.fuzzy_find(query, limit))
 
     def print_item_status(self, iBI):
         '''
@@ -118,24 +271,46 @@ class presenter:
         iBI : int
             the index of item in self.__manager.books
         '''
+        print(self.format_item_status(iBI))
+
+    def format_item_status(self, iBI):
+        '''
+        Format the status of a book item as a line of the table
+
+        Parameters
+        ----------
+        iBI : int
+            the index of item in self.__manager.books
+
+        Returns
+        -------
+        str
+        '''
         # set __nSpaceSep to avoid bad view for too long title/author
         __nSpaceSep = 4
         noteState, sourceState = self.__manager.get_note_source_state(iBI)
         au = self.__authors[iBI]
         ti = self.__titles[iBI]
-        print(self.__formatItem % (
+        colorEnd = self.__colorEnd
+        if self.__lenBarShow != self.__lenProgBar:
+            colorEnd = self.__extra_columns( \
+                    forecast_str(self.__forecast[iBI]) if self.__fForecast else "", \
+                    self.__sources[iBI] if self.__fSource else "")
+        nAu = get_n_cjk(au)
+        nTi = get_n_cjk(ti)
+        return self.__formatItem % (
             self.__colorItem, \
             self.__lenIndex, iBI + 1, \
-            self.__lenAuthor - get_n_cjk(au), self.__lenAuthor - get_n_cjk(au) - __nSpaceSep, au, \
-            self.__lenTitle - get_n_cjk(ti), self.__lenTitle - get_n_cjk(ti) - __nSpaceSep, ti, \
+            self.__lenAuthor - nAu, self.__lenAuthor - nAu - __nSpaceSep, au, \
+            self.__lenTitle - nTi, self.__lenTitle - nTi - __nSpaceSep, ti, \
             self.__lenPageTot, self.__pages[iBI], \
             self.__lenNoteMark, get_file_state_marker(noteState), \
             self.__lenSourceMark, get_file_state_marker(sourceState), \
-            self.__lenProgBar, \
-            prog_barstr(self.__progress[iBI], self.__lenProgBar, self.__use256), \
+            self.__lenBarShow, \
+            prog_barstr(self.__progress[iBI], self.__lenBarShow, self.__use256), \
             self.__lenProg, self.__progress[iBI][0], \
-            self.__colorEnd, \
-            ))
+            colorEnd, \
+            )
 
 
 def get_file_state_marker(fileState):
@@ -155,6 +330,9 @@ def get_file_state_marker(fileState):
         return "◆"
     return "?"
 
+# common CJK, symbols and punctuation, hiragana and katakana
+__reCJK = re.compile(u'[\u4e00-\u9fff\u3000-\u303F\u3040-\u309F\u30A0-\u30FF]')
+
 def get_n_cjk(cjkstr):
     '''
     get the number of CJK characters, hiragana and katakana, for the support of viewing Chinese etc.
@@ -167,25 +345,9 @@ def get_n_cjk(cjkstr):
     Returns
     int : the number of CJK characters
     '''
-    n = 0
-    __uCommonCJK = u'[\u4e00-\u9fff]'
-    __uSymbolPunc = u'[\u3000-\u303F]'
-    __uHiraGana = u'[\u3040-\u309F]'
-    __uKataKana = u'[\u30A0-\u30FF]'
-
-    __uList = [
-        __uCommonCJK, \
-        __uSymbolPunc, \
-        __uHiraGana, \
-        __uKataKana, \
-            ]
-    __ucjkstr = u'%s' % cjkstr
-    
-    for x in cjkstr:
-        for ul in __uList:
-            if re.search(ul, x):
-                n += 1
-    return n
+    if cjkstr.isascii():
+        return 0
+    return len(__reCJK.findall(cjkstr))
 
 def prog_barstr(prog, totalBarLen, use256=False):
     '''
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+'''
+Named phase timers and profiling hooks of readmanager.
+
+The profiler is disabled by default, and the timers then cost only a flag check.
+It is enabled by the --profile flag of readmana or by setting the environment
+variable READMANA_PROFILE to a non-empty value other than "0".
+If READMANA_PROFILE_STATS is set, cProfile statistics will be dumped to that path on exit.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import sys
+import time
+import atexit
+from functools import wraps
+
+class _null_phase():
+    '''
+    context manager doing nothing, used when the profiler is disabled
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+class _timed_phase():
+    '''
+    context manager to accumulate the wall time of a named phase
+    '''
+    __slots__ = ("name", "tStart")
+
+    def __init__(self, name):
+        self.name = name
+        self.tStart = 0.0
+
+    def __enter__(self):
+        self.tStart = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        dt = time.perf_counter() - self.tStart
+        _record(self.name, dt)
+        return False
+
+_nullPhase = _null_phase()
+_state = {"enabled": False, "cprofile": None, "pathStats": None, "registered": False, "stream": None}
+# phase name -> [number of calls, total seconds]
+timings = {}
+
+def _record(name, dt):
+    '''
+    accumulate one call of phase name taking dt seconds
+    '''
+    entry = timings.get(name)
+    if entry is None:
+        timings[name] = [1, dt]
+    else:
+        entry[0] += 1
+        entry[1] += dt
+
+def enable(pathStats=None, stream=None):
+    '''
+    Enable the phase timers and print the breakdown on exit
+
+    Parameters
+    ----------
+    pathStats : str
+        if set, run cProfile and dump the statistics to pathStats on exit
+    stream : file object
+        where the phase breakdown is printed, default sys.stderr
+    '''
+    _state["enabled"] = True
+    if pathStats and _state["cprofile"] is None:
+        import cProfile
+        _state["pathStats"] = os.path.expanduser(pathStats)
+        _state["cprofile"] = cProfile.Profile()
+        _state["cprofile"].enable()
+    _state["stream"] = stream
+    if not _state["registered"]:
+        atexit.register(_report_at_exit)
+        _state["registered"] = True
+
+def disable():
+    '''
+    Disable the phase timers and cancel the breakdown on exit.
+    Timings recorded so far are kept, and cProfile statistics are dumped now if requested
+    '''
+    _state["enabled"] = False
+    if _state["registered"]:
+        atexit.unregister(_report_at_exit)
+        _state["registered"] = False
+    if _state["cprofile"] is not None:
+        _state["cprofile"].disable()
+        _state["cprofile"].dump_stats(_state["pathStats"])
+        _state["cprofile"] = None
+
+def _report_at_exit():
+    '''
+    print the breakdown to the stream given to the last enable
+    '''
+    report(_state["stream"])
+
+def is_enabled():
+    '''
+    Returns
+    -------
+    bool : True if the profiler is enabled
+    '''
+    return _state["enabled"]
+
+def phase(name):
+    '''
+    Get the context manager timing the phase name
+
+    Parameters
+    ----------
+    name : str
+        the name of phase, e.g. "manager.load"
+
+    Returns
+    -------
+    context manager : a timer if the profiler is enabled, otherwise a shared no-op
+    '''
+    if _state["enabled"]:
+        return _timed_phase(name)
+    return _nullPhase
+
+def timed(name):
+    '''
+    Decorator to time every call of the decorated function as phase name
+
+    Parameters
+    ----------
+    name : str
+        the name of phase
+    '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return func(*args, **kwargs)
+            tStart = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - tStart)
+        return wrapper
+    return decorator
+
+def report(stream=None):
+    '''
+    Print the phase breakdown, and dump cProfile statistics if requested
+
+    Parameters
+    ----------
+    stream : file object
+        default sys.stderr
+    '''
+    if stream is None:
+        stream = sys.stderr
+    if _state["cprofile"] is not None:
+        _state["cprofile"].disable()
+        _state["cprofile"].dump_stats(_state["pathStats"])
+    if not timings:
+        return
+    lenName = max(len(name) for name in timings)
+    print("=" * (lenName + 32), file=stream)
+    print("%-*s %8s %12s %10s" % (lenName, "Phase", "Calls", "Total (ms)", "Per (ms)"), file=stream)
+    for name, (nCalls, tTotal) in sorted(timings.items(), key=lambda x: x[1][1], reverse=True):
+        print("%-*s %8d %12.3f %10.4f" % \
+                (lenName, name, nCalls, tTotal * 1000.0, tTotal * 1000.0 / nCalls), file=stream)
+    print("=" * (lenName + 32), file=stream)
+    if _state["cprofile"] is not None:
+        print("cProfile stats dumped to %s" % _state["pathStats"], file=stream)
+
+def reset():
+    '''
+    Clear all recorded timings
+    '''
+    timings.clear()
+
+if os.environ.get("READMANA_PROFILE", "") not in ["", "0"]:
+    enable(os.environ.get("READMANA_PROFILE_STATS", None))
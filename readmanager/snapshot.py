@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+'''
+Read-only, memory-mapped snapshot of the headline fields of the catalog.
+
+A session that saves book JSONs publishes the snapshot under the cache directory,
+and read-mode sessions map it instead of parsing every JSON.
+The file is replaced atomically, and carries a generation number increased
+at each publication, by which a reader detects a newer snapshot.
+
+Layout, little-endian:
+    header : magic (8 bytes), generation (uint64), number of books (uint32), number of fields (uint32)
+    table  : (offset, length) uint32 pairs of each field of each book, into the blob
+    blob   : utf-8 encoded field values, each followed by the separator 0x1E, so that
+             a book is decoded at once. Length 0xFFFFFFFF marks a null value
+Page numbers are stored as integers, e.g. 300 for 300.0 or "300" in the JSON,
+and as null if they are not numbers.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import mmap
+import struct
+from readmanager.bookitem import book_item, calculate_progress, parse_time
+from readmanager.layout import iter_book_jsons
+from readmanager import profiler
+
+nameSnapshot = "catalog.snap"
+magicSnapshot = b"RMSNAP03"
+formatHeader = "<8sQII"
+sizeHeader = struct.calcsize(formatHeader)
+formatEntry = "<II"
+sizeEntry = struct.calcsize(formatEntry)
+lengthNull = 0xFFFFFFFF
+# separator of tags in the tag field
+sepTag = "\x1f"
+# terminator of each field value in the blob
+sepField = "\x1e"
+fieldsSnapshot = ("filepath", "title", "titleShort", "author", "pageTotal", "pageCurrent", \
+        "noteType", "noteLocation", "bookLocalSource", "timeLastRead", "timeLastMod", \
+        "dateAdded", "datePlan", "tag")
+fieldsInt = ("pageTotal", "pageCurrent")
+indexField = {field: i for i, field in enumerate(fieldsSnapshot)}
+# the table entries of all fields of a book
+formatRecord = "<%dI" % (2 * len(fieldsSnapshot))
+
+def read_generation(pathSnapshot):
+    '''
+    Read the generation number of a snapshot without mapping it
+
+    Returns
+    -------
+    int : the generation, 0 if the snapshot is not found or invalid
+    '''
+    try:
+        with open(pathSnapshot, 'rb') as hFileIn:
+            header = hFileIn.read(sizeHeader)
+    except OSError:
+        return 0
+    if len(header) < sizeHeader:
+        return 0
+    magic, generation, _, _ = struct.unpack(formatHeader, header)
+    if magic != magicSnapshot:
+        return 0
+    return generation
+
+def __page_of(value):
+    '''
+    Get a page number as int, None if it is not a number
+    '''
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+@profiler.timed("snapshot.check")
+def is_current(pathSnapshot, dirDB):
+    '''
+    Check if the snapshot is newer than all book JSONs in dirDB and the directories
+    holding them, i.e. no book has been changed, added or removed since its publication,
+    e.g. by editing the JSON by hand or syncing the library
+
+    Parameters
+    ----------
+    pathSnapshot : str
+    dirDB : str
+
+    Returns
+    -------
+    bool : False if the snapshot is not found or outdated
+    '''
+    try:
+        mtimeSnap = os.stat(pathSnapshot).st_mtime_ns
+    except OSError:
+        return False
+    dirs = set([dirDB])
+    for pathJSON in iter_book_jsons(dirDB):
+        if os.stat(pathJSON).st_mtime_ns >= mtimeSnap:
+            return False
+        dirs.add(os.path.dirname(pathJSON))
+    return all(os.stat(d).st_mtime_ns < mtimeSnap for d in dirs)
+
+@profiler.timed("snapshot.publish")
+def publish(books, pathSnapshot):
+    '''
+    Write the snapshot of books atomically, with the generation increased by one
+
+    Parameters
+    ----------
+    books : list of book_item (or snapshot_book) instances
+    pathSnapshot : str
+
+    Returns
+    -------
+    int : the generation of the new snapshot
+    '''
+    generation = read_generation(pathSnapshot) + 1
+    table = []
+    blob = bytearray()
+    for bi in books:
+        for field in fieldsSnapshot:
+            if field == "filepath":
+                value = bi.filepath
+            elif field == "tag":
+                value = sepTag.join(bi.get_key("tag") or [])
+            elif field in fieldsInt:
+                value = __page_of(bi.get_key(field))
+            else:
+                value = bi.get_key(field)
+            if value is None:
+                table.append((len(blob), lengthNull))
+            else:
+                encoded = str(value).encode("utf-8")
+                table.append((len(blob), len(encoded)))
+                blob.extend(encoded)
+            blob.extend(sepField.encode("utf-8"))
+    os.makedirs(os.path.dirname(pathSnapshot), exist_ok=True)
+    pathTmp = pathSnapshot + ".tmp%d" % os.getpid()
+    with open(pathTmp, 'wb') as hFileOut:
+        hFileOut.write(struct.pack(formatHeader, magicSnapshot, generation, \
+                len(books), len(fieldsSnapshot)))
+        hFileOut.write(b"".join(struct.pack(formatEntry, *entry) for entry in table))
+        hFileOut.write(blob)
+    os.replace(pathTmp, pathSnapshot)
+    return generation
+
+class catalog_snapshot():
+    '''
+    Memory-mapped snapshot reader
+
+    attributes:
+        public:
+            path : str
+            generation : int
+            nBooks : int
+    '''
+
+    def __init__(self, pathSnapshot):
+        '''
+        Map the snapshot at pathSnapshot. ValueError is raised if it is invalid
+        '''
+        self.path = pathSnapshot
+        with open(pathSnapshot, 'rb') as hFileIn:
+            self.__mm = mmap.mmap(hFileIn.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.nBooks, nFields = \
+                struct.unpack_from(formatHeader, self.__mm, 0)
+        if magic != magicSnapshot or nFields != len(fieldsSnapshot):
+            self.__mm.close()
+            raise ValueError("invalid catalog snapshot: %s" % pathSnapshot)
+        self.__view = memoryview(self.__mm)
+        self.__offBlob = sizeHeader + self.nBooks * nFields * sizeEntry
+
+    def __len__(self):
+        return self.nBooks
+
+    def raw(self, iBook, field):
+        '''
+        Get the encoded value of a field without copying
+
+        Returns
+        -------
+        memoryview or None : utf-8 bytes of the value, None for null
+        '''
+        offset, length = struct.unpack_from(formatEntry, self.__mm, \
+                sizeHeader + (iBook * len(fieldsSnapshot) + indexField[field]) * sizeEntry)
+        if length == lengthNull:
+            return None
+        return self.__view[self.__offBlob + offset:self.__offBlob + offset + length]
+
+    def get(self, iBook, field):
+        '''
+        Get the decoded value of a field
+
+        Returns
+        -------
+        str, int, list or None
+        '''
+        raw = self.raw(iBook, field)
+        if raw is None:
+            return None
+        value = str(raw, "utf-8")
+        if field in fieldsInt:
+            return int(value)
+        if field == "tag":
+            return value.split(sepTag) if value else []
+        return value
+
+    def record(self, iBook):
+        '''
+        Get the decoded values of all fields of a book at once
+
+        Returns
+        -------
+        dict : field -> value, as by get
+        '''
+        entries = struct.unpack_from(formatRecord, self.__mm, \
+                sizeHeader + iBook * len(fieldsSnapshot) * sizeEntry)
+        lengths = entries[1::2]
+        # the values of a book are contiguous, each terminated by sepField
+        start = self.__offBlob + entries[0]
+        end = self.__offBlob + entries[-2] + (0 if lengths[-1] == lengthNull else lengths[-1])
+        values = self.__mm[start:end].decode("utf-8").split(sepField)
+        if len(values) != len(fieldsSnapshot):
+            # a value holding sepField itself
+            values = [None if raw is None else str(raw, "utf-8") for raw in \
+                    (self.raw(iBook, field) for field in fieldsSnapshot)]
+        record = dict(zip(fieldsSnapshot, values))
+        if lengthNull in lengths:
+            for field, length in zip(fieldsSnapshot, lengths):
+                if length == lengthNull:
+                    record[field] = None
+        for field in fieldsInt:
+            if record[field] is not None:
+                record[field] = int(record[field])
+        tags = record["tag"]
+        if tags is not None:
+            record["tag"] = tags.split(sepTag) if tags else []
+        return record
+
+    def is_stale(self):
+        '''
+        Check if a newer snapshot has been published
+
+        Returns
+        -------
+        bool
+        '''
+        return read_generation(self.path) > self.generation
+
+    def close(self):
+        '''
+        Unmap the snapshot
+        '''
+        self.__view.release()
+        self.__mm.close()
+
+class snapshot_book():
+    '''
+    A book item backed by a snapshot record.
+    The headline fields are read from the snapshot. Any other access,
+    e.g. updating the page, loads the book JSON into a book_item to which
+    the proxy delegates from then on.
+    '''
+
+    # filter only uses get_title, get_author and get_tag
+    filter = book_item.filter
+
+    def __init__(self, snap, iBook):
+        self.__snap = snap
+        self.__iBook = iBook
+        self.__book = None
+        # decoded on first access
+        self.__record = None
+        self.filepath = snap.get(iBook, "filepath")
+
+    def __getattr__(self, name):
+        # only called for attributes not defined by the proxy
+        return getattr(self.load(), name)
+
+    def load(self):
+        '''
+        Load and return the full book_item
+        '''
+        if self.__book is None:
+            self.__book = book_item(self.filepath)
+        return self.__book
+
+    @property
+    def revision(self):
+        # unmodified until loaded
+        return 0 if self.__book is None else self.__book.revision
+
+    @property
+    def title(self):
+        return self.get_key("title")
+
+    @property
+    def pageTotal(self):
+        return self.get_key("pageTotal")
+
+    @property
+    def pageCurrent(self):
+        return self.get_key("pageCurrent")
+
+    @property
+    def noteLocation(self):
+        return self.get_key("noteLocation")
+
+    def update_json(self, overwrite=False, store=None):
+        '''
+        See book_item.update_json. Nothing to save if the book is not loaded
+        '''
+        if self.__book is not None:
+            self.__book.update_json(overwrite, store)
+
+    def get_key(self, key):
+        '''
+        See book_item.get_key
+        '''
+        if self.__book is not None or key not in indexField:
+            return self.load().get_key(key)
+        if self.__record is None:
+            self.__record = self.__snap.record(self.__iBook)
+        return self.__record[key]
+
+    def get_title(self, short=False):
+        '''
+        See book_item.get_title
+        '''
+        if short:
+            titleShort = self.get_key("titleShort")
+            if titleShort is not None:
+                return titleShort
+        return self.get_key("title")
+
+    def get_author(self):
+        '''
+        See book_item.get_author
+        '''
+        return self.get_key("author")
+
+    def get_tag(self):
+        '''
+        See book_item.get_tag
+        '''
+        return self.get_key("tag")
+
+    def get_progress(self):
+        '''
+        See book_item.get_progress
+        '''
+        return calculate_progress(self.pageCurrent, self.pageTotal, \
+                self.get_key("dateAdded"), self.get_key("datePlan"), self.filepath)
+
+    def get_source(self, ext=False):
+        '''
+        See book_item.get_source
+        '''
+        if self.__book is not None or ext:
+            return self.load().get_source(ext)
+        return self.get_key("bookLocalSource")
+
+    def get_last_time(self, timeType):
+        '''
+        See book_item.get_last_time
+        '''
+        if self.__book is not None:
+            return self.__book.get_last_time(timeType)
+        __timeType = timeType.strip().lower()
+        if __timeType == "read":
+            return parse_time(self.get_key("timeLastRead"))
+        if __timeType.startswith("mod"):
+            return parse_time(self.get_key("timeLastMod"))
+        raise ValueError("timeType should be either \"read\" or \"mod\".")
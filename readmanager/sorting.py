@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+'''
+Multi-key sorting of book items.
+
+A sort spec is a comma-separated list of keys, e.g. "tag,-lag,title".
+A key prefixed by "-" is sorted descending, by "+" ascending,
+and a bare key in its default direction (see keysSort).
+The values of all keys are computed in a single pass over the books,
+then the books are sorted by stable passes from the last key to the first.
+To take only the first few books, top_order selects them by a heap instead of sorting all.
+'''
+
+from __future__ import print_function, absolute_import
+import heapq
+from readmanager import profiler
+
+# key -> (default reverse, description)
+keysSort = {
+    "title": (False, "title"),
+    "author": (False, "author"),
+    "mod": (True, "time of last modification, latest first"),
+    "read": (True, "time of last read, latest first"),
+    "tag": (False, "first tag alphabetically, untagged last"),
+    "prog": (True, "current progress %"),
+    "plan": (True, "plan progress %"),
+    "lag": (True, "plan % minus current %, the most behind first"),
+    "added": (True, "date added, latest first"),
+    "remain": (False, "pages remaining, the fewest first"),
+    }
+# keys computed from the progress
+__keysProgress = ("prog", "plan", "lag")
+
+def __first_tag(bi):
+    tags = bi.get_tag()
+    if not tags:
+        return (True, "")
+    return (False, min(t.lower() for t in tags))
+
+__getters = {
+    "title": lambda bi, prog: bi.get_title(short=False) or "",
+    "author": lambda bi, prog: bi.get_author() or "",
+    "mod": lambda bi, prog: bi.get_last_time("mod"),
+    "read": lambda bi, prog: bi.get_last_time("read"),
+    "tag": lambda bi, prog: __first_tag(bi),
+    "prog": lambda bi, prog: prog[0],
+    "plan": lambda bi, prog: prog[1],
+    "lag": lambda bi, prog: prog[1] - prog[0],
+    "added": lambda bi, prog: bi.get_key("dateAdded") or "",
+    "remain": lambda bi, prog: bi.pageTotal - bi.pageCurrent,
+    }
+
+def parse_spec(spec):
+    '''
+    Parse a sort spec
+
+    Parameters
+    ----------
+    spec : str
+        e.g. "tag,-lag,title"
+
+    Returns
+    -------
+    list of (str, bool) : key and reverse flag, from the primary key
+
+    Raises
+    ------
+    ValueError : if spec is empty or has an unknown key
+    '''
+    keys = []
+    for item in spec.split(","):
+        item = item.strip()
+        reverse = None
+        if item[:1] in ("-", "+"):
+            reverse = item[0] == "-"
+            item = item[1:].strip()
+        if item not in keysSort:
+            raise ValueError("unknown sort key \"%s\". Available: %s" % \
+                    (item, ", ".join(keysSort)))
+        keys.append((item, keysSort[item][0] if reverse is None else reverse))
+    return keys
+
+def sort_value(key, bi):
+    '''
+    Get the value of key of a book item for sorting
+    '''
+    prog = bi.get_progress() if key in __keysProgress else None
+    return __getters[key](bi, prog)
+
+@profiler.timed("sorting.columns")
+def sort_columns(books, keys):
+    '''
+    Compute the values of keys of all books in a single pass.
+    The progress is computed once per book for all keys derived from it
+
+    Parameters
+    ----------
+    books : list of book_item instances
+    keys : list of str
+
+    Returns
+    -------
+    list of list : the values of each key, in the order of keys
+    '''
+    keys = list(keys)
+    getters = [__getters[key] for key in keys]
+    columns = [[] for _ in keys]
+    fProgress = any(key in __keysProgress for key in keys)
+    for bi in books:
+        prog = bi.get_progress() if fProgress else None
+        for column, getter in zip(columns, getters):
+            column.append(getter(bi, prog))
+    return columns
+
+def sort_order(books, specs):
+    '''
+    Get the order of books sorted by specs
+
+    Parameters
+    ----------
+    books : list of book_item instances
+    specs : list of (str, bool), see parse_spec
+
+    Returns
+    -------
+    list of int : indices of books in sorted order
+    '''
+    columns = sort_columns(books, [key for key, _ in specs])
+    order = list(range(len(books)))
+    # stable passes from the least significant key
+    for column, (_, reverse) in reversed(list(zip(columns, specs))):
+        order.sort(key=column.__getitem__, reverse=reverse)
+    return order
+
+@profiler.timed("sorting.top")
+def top_order(books, specs, n):
+    '''
+    Get the first n books sorted by specs, by partial selection with a heap
+    in O(len(books) log n), without sorting all books.
+    Ties are broken by the order of books, as a stable sort would
+
+    Parameters
+    ----------
+    books : list of book_item instances
+    specs : list of (str, bool), see parse_spec
+    n : int
+
+    Returns
+    -------
+    list of int : indices of at most n books, in sorted order
+    '''
+    if n <= 0:
+        return []
+    reverses = set(reverse for _, reverse in specs)
+    if len(reverses) > 1:
+        # keys of mixed directions make no single comparable key
+        return sort_order(books, specs)[:n]
+    columns = sort_columns(books, [key for key, _ in specs])
+    if len(columns) == 1:
+        key = columns[0].__getitem__
+    else:
+        rows = list(zip(*columns))
+        key = rows.__getitem__
+    select = heapq.nlargest if reverses.pop() else heapq.nsmallest
+    return select(n, range(len(books)), key=key)
@@ -9,9 +9,17 @@ import os
 import sys
 import re
 import json
+from functools import lru_cache
 from readmanager.presenter import presenter
 from readmanager.manager import manager
 from readmanager.bookitem import book_item
+from readmanager.manager import load_config
+from readmanager.layout import book_name, migrate, book_json_path, find_book, is_compressed, \
+        extsBook
+from readmanager import codec
+from readmanager.sorting import keysSort, parse_spec
+from readmanager.views import parse_query
+from readmanager.backup import backup_store, nameBackup
 
 def __init_default_config(pathConfig):
     '''
@@ -165,6 +173,8 @@ def modify(bm):
         except KeyError:
             print("    Invalid input. Break out.")
             break
+        # keep the fuzzy search index in sync with title/author edits
+        bm.reindex(__book)
 
 # ===========================================================
 # key modify utilities
@@ -176,7 +186,7 @@ def __modify_note_dir(BI):
     ---------
     BI : book_item instance
     '''
-    jsonName = os.path.basename(BI.filepath)[:-5]
+    jsonName = book_name(BI.filepath)
     noteDirStr = input("    Note directory (enter for %s): " % jsonName).strip()
     if noteDirStr == '':
         __noteDirStr = "-/" + jsonName
@@ -207,6 +217,36 @@ def __modify_plan_date(BI):
     if __datePlan != "":
         BI.update_date("plan", __datePlan)
 
+def __source_hint(BI, key):
+    '''
+    Get the metadata of key ("pages", "title" or "author") extracted from the local source of book,
+    None if not available
+    '''
+    path = BI.get_source()
+    if path is None or not os.path.isfile(path):
+        return None
+    try:
+        info = __source_info(path, os.stat(path).st_mtime_ns)
+    except Exception:
+        return None
+    return info.get(key, None) if info else None
+
+@lru_cache(maxsize=16)
+def __source_info(path, mtime):
+    '''
+    Extract the metadata of a source, cached by path and mtime
+    '''
+    from readmanager.metadata import extract
+    return extract(path)
+
+def __input_with_hint(prompt, hint):
+    '''
+    Ask for input, with hint as the default for empty input
+    '''
+    if hint is None:
+        return input("    %s: " % prompt).strip()
+    return input("    %s (Enter for \"%s\" from source): " % (prompt, hint)).strip() or str(hint)
+
 def __modify_total_page(BI):
     '''
     modify the number of Total Pages of the book
@@ -215,8 +255,9 @@ def __modify_total_page(BI):
     ---------
     BI : book_item instance
     '''
+    __hint = __source_hint(BI, "pages")
     while True:
-        __pageTotal = input("    Total #pages: ").strip()
+        __pageTotal = __input_with_hint("Total #pages", __hint)
         try:
             BI.update_page("total", int(__pageTotal))
             break
@@ -242,7 +283,7 @@ def __modify_author(BI):
     ---------
     BI : book_item instance
     '''
-    __author = input("    Author: ").strip()
+    __author = __input_with_hint("Author", __source_hint(BI, "author"))
     BI.update_author(__author)
 
 def __modify_title(BI):
@@ -253,7 +294,7 @@ def __modify_title(BI):
     ---------
     BI : book_item instance
     '''
-    __title = input("    Title: ").strip()
+    __title = __input_with_hint("Title", __source_hint(BI, "title"))
     BI.update_title(__title)
 
 def __add_tag(BI):
@@ -306,6 +347,189 @@ def add_remark(bm):
     __remark = input("    New remark (be short, otherwise write it in note): \n    > ").strip()
     __book.update_remark(__remark)
 
+def parse_indices(strIndices, nItems):
+    '''
+    Parse a string of book numbers and ranges, e.g. "1-3, 5 8", to indices
+
+    Parameters
+    ----------
+    strIndices : str
+        1-based numbers and ranges, separated by comma or space
+    nItems : int
+        the number of items. Numbers out of range are ignored
+
+    Returns
+    -------
+    list of int : sorted 0-based indices
+    '''
+    __indices = set()
+    for token in re.split(r'[,\s]+', strIndices.strip()):
+        if not token:
+            continue
+        try:
+            if "-" in token:
+                __start, __end = [int(x) for x in token.split("-", 1)]
+            else:
+                __start = __end = int(token)
+        except ValueError:
+            raise ValueError("invalid book number or range: %s" % token)
+        for n in range(max(__start, 1), min(__end, nItems) + 1):
+            __indices.add(n - 1)
+    return sorted(__indices)
+
+def __select_books(bm, action, fArchive=False):
+    '''
+    Ask for the books to archive/unarchive, by numbers, ranges or filter
+
+    Paramters
+    ---------
+    bm : manager instance
+    action : str
+        the action shown in the prompt
+    fArchive : bool
+        True to select from the archived books
+
+    Returns
+    -------
+    list of int : indices of selected books
+    '''
+    __nItems = len(bm.booksArchive) if fArchive else len(bm)
+    __sel = input("--  Which books to %s (#, ranges like 1-3,5; " % action + \
+            "f for filter; done for finished; enter to return): ").strip()
+    if __sel == "":
+        return []
+    if __sel.lower() == "done":
+        return bm.filter_indices(fFinished=True, fArchive=fArchive)
+    if __sel.lower() == "f":
+        __filterTitle = input("--  Title filter? (Enter to skip) ").split()
+        __filterAuthor = input("--  Author filter? (Enter to skip) ").split()
+        __filterTag = input("--  Tag filter? (Enter to skip) ").split()
+        __fAnd = ask_for_sure("--  'AND' search?")
+        return bm.filter_indices(__filterTitle, __filterAuthor, __filterTag, __fAnd, \
+                fArchive=fArchive)
+    try:
+        return parse_indices(__sel, __nItems)
+    except ValueError as err:
+        print("    %s. Break out." % err)
+        return []
+
+def __print_archive(bm):
+    '''
+    print the numbers, titles and authors of the archived books
+    '''
+    if not bm.booksArchive:
+        print("--  No archived book.")
+        return
+    print("--  Archived books:")
+    for i, bi in enumerate(bm.booksArchive):
+        print("%5d: %s / %s" % (i + 1, bi.get_title(), bi.get_author()))
+
+def show_archive(bm):
+    '''
+    check the Archived books
+
+    Paramters
+    ---------
+    bm : manager instance
+    '''
+    assert isinstance(bm, manager)
+    __print_archive(bm)
+    input("--  Enter to return ")
+
+def archive_items(bm):
+    '''
+    archive books
+    '''
+    assert isinstance(bm, manager)
+    __indices = __select_books(bm, "archive")
+    if not __indices:
+        return
+    for i in __indices:
+        print("    %s" % bm[i].get_title())
+    if ask_for_sure("--  Archive %d books?" % len(__indices)):
+        print("--  %d books archived." % len(bm.archive(__indices, "arch")))
+
+def unarchive_items(bm):
+    '''
+    Unarchive books
+    '''
+    assert isinstance(bm, manager)
+    __print_archive(bm)
+    if not bm.booksArchive:
+        return
+    __indices = __select_books(bm, "unarchive", fArchive=True)
+    if not __indices:
+        return
+    print("--  %d books unarchived." % len(bm.archive(__indices, "unarch")))
+
+def search_notes(bm, query=None, verbose=True):
+    '''
+    search Notes by full text
+
+    Paramters
+    ---------
+    bm : manager instance
+    query : str
+        the words to search. Asked if None
+    verbose : bool
+        wait for enter after printing the results
+    '''
+    from readmanager import notesearch
+    assert isinstance(bm, manager)
+    if query is None:
+        query = input("--  Words to search in notes (* for prefix): ").strip()
+    if not query:
+        return
+    results = notesearch.search_notes(bm, query)
+    if not results:
+        print("--  No note found.")
+    __indices = {id(bi): i for i, bi in enumerate(bm.books)}
+    for bi, fArchive, snippet in results:
+        __mark = "A" if fArchive else str(__indices[id(bi)] + 1)
+        print("%5s: %s / %s" % (__mark, bi.get_title(), bi.get_author()))
+        print("       %s" % snippet.replace("\n", " "))
+    if verbose:
+        input("--  Enter to return ")
+
+def show_activity(bm):
+    '''
+    show reading activity from Logs of all books
+
+    Paramters
+    ---------
+    bm : manager instance
+    '''
+    from readmanager import analytics
+    assert isinstance(bm, manager)
+    dirsDB = [bm.dbJSON, bm.dbArchive]
+    for period, nLast in [("day", 14), ("week", 8), ("month", 6)]:
+        print("--  Pages read per %s:" % period)
+        print_series(analytics.activity(dirsDB, bm.dbCache, period), nLast)
+    input("--  Enter to return ")
+
+def print_series(series, nLast=None, lenBar=40):
+    '''
+    print a {label: pages} series with a bar for each label
+
+    Parameters
+    ----------
+    series : dict
+    nLast : int
+        the number of last labels to print. None to print all
+    lenBar : int
+        the length of the longest bar
+    '''
+    labels = list(series.keys())
+    if nLast is not None:
+        labels = labels[-nLast:]
+    if not labels:
+        print("    No reading log found.")
+        return
+    pagesMax = max(series[label] for label in labels)
+    for label in labels:
+        nBar = int(float(series[label]) / pagesMax * lenBar) if pagesMax > 0 else 0
+        print("    %-10s %6d %s" % (label, series[label], "#" * nBar))
+
 def get_func_doc(func):
     '''
     get the main doc line of a function
@@ -340,14 +564,14 @@ def create_new(bm):
     assert isinstance(bm, manager)
   
     newJSONPath = __generate_new_json_path(bm)
-    newBI = book_item(newJSONPath, create_new=True)
-    # update tags
+    newBI = book_item(newJSONPath, create_new=True, storage=bm.storage)
+    # update tags. The source first, to suggest the author, title and pages from it
+    __modify_source_path(newBI)
     __modify_author(newBI)
     __modify_title(newBI)
     __modify_total_page(newBI)
     __modify_note_dir(newBI)
     __modify_note_type(newBI)
-    __modify_source_path(newBI)
     __add_tag(newBI)
     newBI.update_last_time("mod")
     newBI.update_date("added")
@@ -374,6 +598,7 @@ def __create_new_note(bm, iBI, verbose=True):
         the index of book item for note creation
     verbose : bool
     '''
+    from readmanager.notetemplate import render, write_note
     noteState = bm.get_note_source_state(iBI)[0]
     if noteState is None:
         if verbose:
@@ -388,16 +613,15 @@ def __create_new_note(bm, iBI, verbose=True):
     else:
         if verbose:
             print("    Note not found: %s" % notePath)
-            return False
-        flag = ask_for_sure("    Create an empty new?", verbose=verbose)
+        flag = ask_for_sure("    Create a new one from template?", verbose=verbose)
         if flag:
-            try:
-                os.makedirs(os.path.dirname(notePath))
-            except FileExistsError:
-                pass
-            with open(notePath, 'w') as hFileOut:
-                pass
-            return True
+            bi = bm.books[iBI]
+            text = render(bi.get_key, bi.get_key("noteType"), bm.noteTemplates)
+            if text is None:
+                if verbose:
+                    print("    No template of %s notes. Please create it manually." % bi.get_key("noteType"))
+                return False
+            return write_note(notePath, text)
     return False
 
 def __generate_new_json_path(bm):
@@ -412,12 +636,14 @@ def __generate_new_json_path(bm):
         newJSONName = input("--  Enter filename of new item (wo .json): ").strip()
         if newJSONName.lower().endswith(".json"):
             newJSONName = newJSONName[:-5]
-        newJSONPath = os.path.join(bm.dbJSON, newJSONName) + ".json"
-        # check duplicate
-        if os.path.isfile(newJSONPath):
+        newJSONPath = bm.json_path(newJSONName)
+        # check duplicate, in both shelf and archive and either layout
+        if bm.has_book_name(newJSONName):
             print("    Found json with the same name in database. Retry.")
         else:
             break
+    # shard directory, if sharded layout is used
+    os.makedirs(os.path.dirname(newJSONPath), exist_ok=True)
     return newJSONPath
 
 # ===========================================================
@@ -447,12 +673,28 @@ def show_tags(pre):
     '''
     assert isinstance(pre, presenter)
 
+def toggle_forecast(pre):
+    '''
+    toggle the column of forEcast finish dates
+
+    Paramters
+    ---------
+    pre : presenter instance
+    '''
+    assert isinstance(pre, presenter)
+    pre.set_forecast(not pre.showForecast)
+
 # ===========================================================
 def find_item(pre):
     '''
     Find a particular item by title, author or tag
     '''
     assert isinstance(pre, presenter)
+    __query = input("--  Fuzzy search of title/author? (words, Enter for filters) ").strip()
+    if __query:
+        pre.rebuild()
+        pre.find_fuzzy(__query)
+        return
     # ask find criterion
     __filterTitle = input("--  Title filter? (Enter to skip) ").split()
     __filterAuthor = input("--  Author filter? (Enter to skip) ").split()
@@ -461,6 +703,60 @@ def find_item(pre):
     pre.rebuild()
     pre.show(__filterTitle, __filterAuthor, __filterTag, __fAnd)
 
+def show_top(bm, pre):
+    '''
+    show the top-K books to read next, by recency, lag behind plan or pages remaining
+    '''
+    assert isinstance(bm, manager)
+    assert isinstance(pre, presenter)
+    __n = input("--  How many? (Enter for 5) ").strip()
+    __key = input("--  By? [(R)ecent, (L)ag behind plan, (F)inish soon, or keys] ").strip()
+    __keys = {"": "read", "r": "read", "l": "lag", "f": "remain"}
+    try:
+        __indices = bm.top_indices(int(__n) if __n else 5, __keys.get(__key.lower(), __key))
+    except ValueError as err:
+        print("--  %s" % err)
+        input("--  Enter to return ")
+        return
+    pre.rebuild()
+    pre.show_indices(__indices)
+    input("--  Enter to return ")
+
+def switch_view(bm, pre):
+    '''
+    switch to a saved filter View, or save a new one
+    '''
+    assert isinstance(bm, manager)
+    assert isinstance(pre, presenter)
+    __names = bm.views.names()
+    for i, name in enumerate(__names):
+        print("%5d: %s (%d) %s%s" % (i + 1, name, bm.views.count(name, bm.books), \
+                bm.views.query(name), " *" if name == pre.view else ""))
+    print("--  Queries are terms joined by AND/OR, e.g. \"tag:physics AND unfinished\".")
+    print("    Terms: tag:X, title:X, author:X, finished, unfinished, behind. Prefix - to negate")
+    __choice = input("--  View? (#/name, Enter for all books, or \"name = query\" to save) ").strip()
+    if "=" in __choice:
+        __name, _, __query = __choice.partition("=")
+        try:
+            bm.views.add(__name.strip(), __query.strip())
+        except ValueError as err:
+            print("--  %s" % err)
+            input("--  Enter to return ")
+            return
+        save_view(bm.pathConfig, __name.strip(), __query.strip())
+        __choice = __name.strip()
+    if not __choice:
+        pre.set_view(None)
+        return
+    # a number out of range, e.g. 0 or negative, is taken as a name, not counted from the end
+    if __choice.isdigit() and 1 <= int(__choice) <= len(__names):
+        __choice = __names[int(__choice) - 1]
+    try:
+        pre.set_view(__choice)
+    except KeyError:
+        print("--  No view \"%s\"" % __choice)
+        input("--  Enter to return ")
+
 def sort_items(bm, pre):
     '''
     Sort book items
@@ -468,7 +764,10 @@ def sort_items(bm, pre):
     assert isinstance(bm, manager)
     assert isinstance(pre, presenter)
 
-    __key = input("--  Sort by? [(T)itle, (A)uthor, last(M)od, last(R)ead] ").strip()
+    print("--  Keys: %s" % ", ".join(keysSort))
+    print("    comma-separated for multiple keys, prefixed by - for descending or + for ascending,")
+    print("    e.g. \"tag,-lag,title\"")
+    __key = input("--  Sort by? [(T)itle, (A)uthor, last(M)od, last(R)ead, or keys] ").strip()
     __keyTitle = ["t", "T", "title", ]
     __keyAuthor = ["a", "A", "author", ]
     __keyLastMod = ["m", "M", "lastmod", ]
@@ -476,16 +775,287 @@ def sort_items(bm, pre):
 
     if __key in __keyTitle:
         bm.sort_books_by("title")
-    if __key in __keyAuthor:
+    elif __key in __keyAuthor:
         bm.sort_books_by("author")
-    if __key in __keyLastMod:
+    elif __key in __keyLastMod:
         bm.sort_books_by("mod")
-    if __key in __keyLastRead:
+    elif __key in __keyLastRead:
         bm.sort_books_by("read")
+    elif __key:
+        try:
+            parse_spec(__key)
+        except ValueError as err:
+            print("--  %s" % err)
+            input("--  Enter to return ")
+            return
+        bm.sort_books_by(__key)
 
     pre.rebuild()
     pre.show()
 
+# ===========================================================
+def __record_config(pathConfig, key, value):
+    '''
+    Set a key in the config file, keeping the other keys
+    '''
+    with open(pathConfig, 'r') as hFileIn:
+        dictConfig = json.load(hFileIn)
+    dictConfig[key] = value
+    with open(pathConfig, 'w') as hFileOut:
+        json.dump(dictConfig, hFileOut, indent=2)
+    print("--  %s \"%s\" recorded in %s" % (key.capitalize(), value, pathConfig))
+
+def create_notes(pathConfig, nWorkers=8):
+    '''
+    Create the missing notes from templates, for all books on the shelf and
+    in the archive with noteLocation and noteType set
+
+    Parameters
+    ----------
+    pathConfig : str
+    nWorkers : int
+        the number of threads writing notes
+
+    Returns
+    -------
+    list of str : the paths of notes created
+    '''
+    from readmanager.notetemplate import create_notes as create_notes_of
+    bm = manager(pathConfig, verbose=False)
+    __paths = create_notes_of(bm.books + bm.booksArchive, bm.get_note_path_of, \
+            bm.noteTemplates, nWorkers)
+    for path in __paths:
+        print("    %s" % path)
+    print("--  %d notes created" % len(__paths))
+    return __paths
+
+def sync_library(pathConfig, dirTarget, nWorkers=None):
+    '''
+    Sync dbJSON and dbNote of the home library to the JSON and note directories
+    of the mirror dirTarget, copying only the changed files. See mirror module.
+    The cache under dbJSON, e.g. the catalog snapshot and backups, is not synced.
+    A config.json of the mirror is written if absent, so that it can be used as a library
+
+    Parameters
+    ----------
+    pathConfig : str
+    dirTarget : str
+    nWorkers : int
+        the number of threads hashing files
+
+    Returns
+    -------
+    dict : the total of the reports of sync_tree
+    '''
+    from readmanager.mirror import sync_tree
+    config = load_config(pathConfig)
+    dirTarget = os.path.abspath(os.path.expanduser(dirTarget))
+    __trees = [(config["dbJSON"], os.path.join(dirTarget, "JSON"), \
+                [os.path.relpath(config["dbCache"], config["dbJSON"])]), \
+               (config["dbNote"], os.path.join(dirTarget, "note"), [])]
+    for dirSrc, _, _ in __trees:
+        # dbJSON and dbNote may be relative to the working directory
+        dirSrc = os.path.abspath(dirSrc)
+        if os.path.commonpath([dirSrc, dirTarget]) in [dirSrc, dirTarget]:
+            raise ValueError("mirror %s overlaps with %s" % (dirTarget, dirSrc))
+    __total = {}
+    for dirSrc, dirDst, dirsSkip in __trees:
+        report = sync_tree(dirSrc, dirDst, nWorkers, dirsSkip)
+        print("--  %s: %d files, %d hashed, %d copied (%d bytes), %d removed, %d vanished" % \
+                (dirSrc, report["files"], report["hashed"], report["copied"], report["bytes"], \
+                 report["removed"], report["vanished"]))
+        for key, value in report.items():
+            __total[key] = __total.get(key, 0) + value
+    pathConfigMirror = os.path.join(dirTarget, "config.json")
+    if not os.path.exists(pathConfigMirror):
+        with open(pathConfigMirror, 'w') as hFileOut:
+            json.dump({"dbJSON": "-/", "dbNote": "-/"}, hFileOut, indent=2)
+    print("--  Synced to %s: %d files, %d bytes transferred" % \
+            (dirTarget, __total["copied"], __total["bytes"]))
+    return __total
+
+def save_view(pathConfig, name, query):
+    '''
+    Save the filter view name of query in config file, replacing the view of the same name.
+    An empty query deletes the view. See readmanager.views for queries
+
+    Parameters
+    ----------
+    pathConfig : str
+    name : str
+    query : str
+
+    Raises
+    ------
+    ValueError : if query is malformed
+    '''
+    with open(pathConfig, 'r') as hFileIn:
+        __views = json.load(hFileIn).get("views", {})
+    if query.strip():
+        parse_query(query)
+        __views[name] = query
+    else:
+        __views.pop(name, None)
+    __record_config(pathConfig, "views", __views)
+
+def migrate_layout(pathConfig, layout):
+    '''
+    Migrate the JSON database and archive to layout, and record it in config file
+
+    Parameters
+    ----------
+    pathConfig : str
+    layout : str, "flat" or "sharded"
+    '''
+    config = load_config(pathConfig)
+    for dirDB in [config["dbJSON"], config["dbArchive"]]:
+        migrate(dirDB, layout)
+    __record_config(pathConfig, "layout", layout)
+
+def convert_storage(pathConfig, storage):
+    '''
+    Convert the JSON database and archive to storage, and record it in config file
+
+    Parameters
+    ----------
+    pathConfig : str
+    storage : str, "pretty", "compact" or "gzip"
+    '''
+    config = load_config(pathConfig)
+    for dirDB in [config["dbJSON"], config["dbArchive"]]:
+        codec.convert(dirDB, storage)
+    __record_config(pathConfig, "storage", storage)
+
+def compact_logs(pathConfig, keepDays=None):
+    '''
+    Compact the logs of all books on the shelf and in the archive, keeping
+    the entries of the last keepDays days verbatim, or expand them back if keepDays is None
+
+    Parameters
+    ----------
+    pathConfig : str
+    keepDays : int
+    '''
+    bm = manager(pathConfig)
+    nEntries = 0
+    nBooks = 0
+    for bi in bm.books + bm.booksArchive:
+        nMoved = bi.expand_log() if keepDays is None else bi.compact_log(keepDays)
+        if nMoved:
+            nEntries += nMoved
+            nBooks += 1
+    bm.update_json_all()
+    print("--  %d log entries of %d books %s" % \
+            (nEntries, nBooks, "expanded" if keepDays is None else "compacted"))
+
+def backfill_sources(pathConfig, fAll=False, nWorkers=None):
+    '''
+    Fill the total pages, and the missing title and author, of books on the shelf
+    and in the archive from their local PDF/EPUB sources, read in a process pool
+
+    Parameters
+    ----------
+    pathConfig : str
+    fAll : bool
+        True to update the total pages of all books, instead of those without it (i.e. 1)
+    nWorkers : int
+        the number of processes, None for the number of CPUs
+    '''
+    from readmanager.metadata import extract_all, nameCache as nameMetadataCache
+    bm = manager(pathConfig)
+    books = [bi for bi in bm.books + bm.booksArchive if bi.get_source()]
+    infos = extract_all([bi.get_source() for bi in books], \
+            os.path.join(bm.dbCache, nameMetadataCache), nWorkers, verbose=True)
+    nUpdated = 0
+    for bi in books:
+        info = infos.get(bi.get_source(), None)
+        if info is None:
+            continue
+        fMod = False
+        if info["pages"] and (fAll or bi.pageTotal == 1) and info["pages"] != bi.pageTotal \
+                and info["pages"] >= bi.pageCurrent:
+            bi.update_page("total", info["pages"])
+            fMod = True
+        if info["title"] and not bi.get_title():
+            bi.update_title(info["title"])
+            fMod = True
+        if info["author"] and not bi.get_author():
+            bi.update_author(info["author"])
+            fMod = True
+        nUpdated += fMod
+    bm.update_json_all()
+    print("--  %d books updated from %d sources" % (nUpdated, len(infos)))
+
+def __backup_store(config):
+    '''
+    Get the backup store of the library from its config dictionary
+    '''
+    return backup_store(os.path.join(config["dbCache"], nameBackup), **config.get("backup", {}))
+
+def list_backups(pathConfig, name):
+    '''
+    Print the backed-up versions of the book JSON named name, oldest first
+
+    Parameters
+    ----------
+    pathConfig : str
+    name : str
+        the name of book JSON without extension
+    '''
+    versions = __backup_store(load_config(pathConfig)).versions(name)
+    if not versions:
+        print("--  No backup of %s" % name)
+    for timeBackup, digest in versions:
+        print("%s  %s" % (timeBackup, digest[:12]))
+
+def restore_backup(pathConfig, name, digest=None):
+    '''
+    Restore the book JSON named name from the backup store. The current JSON
+    on the shelf or in the archive is replaced, after being backed up itself.
+    A deleted book is restored to the shelf. The extension of the JSON follows the
+    storage of the version restored, i.e. .json.gz if it is gzip-compressed
+
+    Parameters
+    ----------
+    pathConfig : str
+    name : str
+        the name of book JSON without extension
+    digest : str
+        the hash, or its prefix, of the version to restore. None for the latest
+    '''
+    config = load_config(pathConfig)
+    store = __backup_store(config)
+    try:
+        if digest is None:
+            refs = store.versions(name)
+            if not refs:
+                raise KeyError("no backup of %s" % name)
+            digest = refs[-1][1]
+        compressed = codec.storage_of(store.read(digest)) == "gzip"
+    except KeyError as err:
+        print("--  %s" % err.args[0])
+        return
+    pathOld = find_book(config["dbJSON"], name) or find_book(config["dbArchive"], name)
+    if pathOld is None:
+        pathJSON = book_json_path(config["dbJSON"], name, config["layout"], compressed)
+    else:
+        pathJSON = pathOld[:-len(extsBook[0 if is_compressed(pathOld) else 1])] + \
+                extsBook[0 if compressed else 1]
+    if pathOld is not None and pathOld != pathJSON:
+        # replaced by the JSON of the other extension
+        store.backup_file(name, pathOld)
+    digest = store.restore(name, pathJSON, digest)
+    if pathOld is not None and pathOld != pathJSON:
+        os.remove(pathOld)
+    print("--  Version %s restored to %s" % (digest[:12], pathJSON))
+
+def prune_backups(pathConfig):
+    '''
+    Apply the retention policy to the backup store and remove unused versions
+    '''
+    nRemoved = __backup_store(load_config(pathConfig)).prune()
+    print("--  %d backup objects removed" % nRemoved)
+
 # ===========================================================
 def save_exit(bm):
     '''
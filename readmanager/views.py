@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+'''
+Saved filter views of the shelf.
+
+A view is a named query stored in the "views" dict of config.json, e.g.
+    "views": {"physics": "tag:physics AND unfinished"}
+A query is a list of terms joined by AND, which may be omitted, and OR.
+AND binds tighter than OR. A term is negated by a leading "-" or NOT:
+    tag:X       the book has tag X, case-insensitive
+    title:X     X is in the title, case-insensitive
+    author:X    X is in the author
+    finished    the book is finished
+    unfinished  the book is not finished
+    behind      the current progress is behind the plan
+    X           X is in the title or the author
+Quote a value with spaces, e.g. tag:"machine learning".
+
+The membership of views is kept by view_index. Each book item carries a revision
+increased at each modification, so only the books added or edited since the last
+refresh are evaluated again. All books are evaluated again when the date changes,
+as "behind" depends on the date.
+'''
+
+from __future__ import print_function, absolute_import
+import shlex
+import datetime as dt
+
+__fields = ("tag", "title", "author")
+
+def __is_finished(bi):
+    return bi.pageCurrent >= bi.pageTotal
+
+def __is_behind(bi):
+    progCurrent, progPlan = bi.get_progress()
+    return progPlan > progCurrent
+
+def __in_title(bi, value):
+    return value in (bi.get_title() or "").lower()
+
+def __in_author(bi, value):
+    return value in (bi.get_author() or "").lower()
+
+def __has_tag(bi, value):
+    return value in [t.lower() for t in (bi.get_tag() or [])]
+
+def __term(token):
+    '''
+    Get the test of a book item for a term, without negation
+    '''
+    word = token.lower()
+    if word == "finished":
+        return __is_finished
+    if word == "unfinished":
+        return lambda bi: not __is_finished(bi)
+    if word == "behind":
+        return __is_behind
+    field, sep, value = token.partition(":")
+    if sep and field.lower() in __fields:
+        value = value.lower()
+        if not value:
+            raise ValueError("empty value of \"%s:\"" % field)
+        test = {"tag": __has_tag, "title": __in_title, "author": __in_author}[field.lower()]
+        return lambda bi: test(bi, value)
+    return lambda bi: __in_title(bi, word) or __in_author(bi, word)
+
+def parse_query(query):
+    '''
+    Parse a view query into a test of book items
+
+    Parameters
+    ----------
+    query : str
+        e.g. "tag:physics AND unfinished"
+
+    Returns
+    -------
+    function : bi -> bool
+
+    Raises
+    ------
+    ValueError : if query is empty or malformed
+    '''
+    tokens = shlex.split(query)
+    clauses = [[]]
+    fNot = False
+    for token in tokens:
+        upper = token.upper()
+        if upper == "AND" and not fNot:
+            continue
+        if upper == "OR" and not fNot:
+            if not clauses[-1]:
+                raise ValueError("empty clause in view query \"%s\"" % query)
+            clauses.append([])
+            continue
+        if upper == "NOT":
+            fNot = not fNot
+            continue
+        if token.startswith("-") and len(token) > 1:
+            fNot = not fNot
+            token = token[1:]
+        clauses[-1].append((fNot, __term(token)))
+        fNot = False
+    if fNot or not clauses[-1]:
+        raise ValueError("incomplete view query \"%s\"" % query)
+
+    def test(bi):
+        return any(all(fNeg != term(bi) for fNeg, term in clause) for clause in clauses)
+    return test
+
+class view_index():
+    '''
+    Membership of saved views, maintained incrementally
+
+    attributes:
+        private:
+            __queries : dict
+                name of view -> query
+            __tests : dict
+                name of view -> test of book items, see parse_query
+            __members : dict
+                name of view -> set of ids of member book items
+            __seen : dict
+                id of book item -> (book item, revision when evaluated).
+                The item is kept so that its id is not reused
+            __date : datetime.date
+                the date of the last evaluation
+    '''
+
+    def __init__(self, views=None):
+        '''
+        Parameters
+        ----------
+        views : dict
+            name of view -> query
+        '''
+        self.__queries = {}
+        self.__tests = {}
+        self.__members = {}
+        self.__seen = {}
+        self.__date = dt.date.today()
+        for name, query in (views or {}).items():
+            self.add(name, query)
+
+    def __contains__(self, name):
+        return name in self.__queries
+
+    def __len__(self):
+        return len(self.__queries)
+
+    def names(self):
+        '''
+        Get the names of views
+        '''
+        return list(self.__queries)
+
+    def query(self, name):
+        '''
+        Get the query of view name
+        '''
+        return self.__queries[name]
+
+    def add(self, name, query):
+        '''
+        Add or replace a view. The books seen so far are evaluated for it
+
+        Raises
+        ------
+        ValueError : if the query is malformed
+        '''
+        test = parse_query(query)
+        self.__queries[name] = query
+        self.__tests[name] = test
+        self.__members[name] = set(key for key, (bi, _) in self.__seen.items() if test(bi))
+
+    def remove(self, name):
+        '''
+        Remove a view
+        '''
+        del self.__queries[name]
+        del self.__tests[name]
+        del self.__members[name]
+
+    def refresh(self, books):
+        '''
+        Update the membership of views for books, evaluating only the books
+        added or modified since the last refresh
+
+        Parameters
+        ----------
+        books : list of book_item instances
+
+        Returns
+        -------
+        int : the number of books evaluated
+        '''
+        today = dt.date.today()
+        if today != self.__date:
+            self.__seen = {}
+            for members in self.__members.values():
+                members.clear()
+            self.__date = today
+        seen = {}
+        touched = []
+        for bi in books:
+            key = id(bi)
+            old = self.__seen.get(key, None)
+            if old is None or old[1] != bi.revision:
+                touched.append(bi)
+            else:
+                seen[key] = old
+        # books gone from the shelf, e.g. archived or replaced
+        gone = set(self.__seen) - set(seen)
+        for name, test in self.__tests.items():
+            members = self.__members[name]
+            members -= gone
+            for bi in touched:
+                if test(bi):
+                    members.add(id(bi))
+        for bi in touched:
+            seen[id(bi)] = (bi, bi.revision)
+        self.__seen = seen
+        return len(touched)
+
+    def members(self, name, books):
+        '''
+        Get the indices of the books in view name, in the order of books
+
+        Parameters
+        ----------
+        name : str
+        books : list of book_item instances
+
+        Returns
+        -------
+        list of int
+        '''
+        self.refresh(books)
+        members = self.__members[name]
+        return [i for i, bi in enumerate(books) if id(bi) in members]
+
+    def count(self, name, books):
+        '''
+        Get the number of books in view name
+        '''
+        self.refresh(books)
+        return len(self.__members[name])
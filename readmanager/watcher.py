@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+'''
+Watch the shelf for changes made by other tools, e.g. an editor or a file synchronizer.
+
+The book JSONs in dbJSON of all libraries and the notes of books are polled by their stats,
+i.e. (mtime, size), against those of the last poll. Only the changed JSONs are read again.
+Polling needs no dependency and works on network and synced directories,
+where file system events are often not delivered.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import datetime as dt
+from readmanager.manager import manager
+from readmanager.bookitem import book_item, parse_time
+from readmanager.layout import iter_book_jsons
+from readmanager import profiler
+
+# key of the optional "watch" of config -> default
+keysWatch = {"interval": 1.0, "readOnNoteEdit": False}
+
+def watch_config(dictConfig):
+    '''
+    Get the options of watcher from the optional key "watch" of config,
+    e.g. {"interval": 1.0, "readOnNoteEdit": true}
+
+    Parameters
+    ----------
+    dictConfig : dict
+        the config loaded by manager.load_config
+
+    Returns
+    -------
+    dict : "interval" (float) and "readOnNoteEdit" (bool), the defaults for those not set
+
+    Raises
+    ------
+    ValueError : if "watch" has an unknown key, or a value of wrong type or out of range
+    '''
+    dictWatch = dictConfig.get("watch", {})
+    if not isinstance(dictWatch, dict):
+        raise ValueError("Broken config.json: \"watch\" should be an object")
+    for key in dictWatch:
+        if key not in keysWatch:
+            raise ValueError("Broken config.json: unknown key \"%s\" of \"watch\", should be one of %s" \
+                    % (key, ", ".join(keysWatch)))
+    options = dict(keysWatch, **dictWatch)
+    interval = options["interval"]
+    # bool is an int, but not a number of seconds
+    if isinstance(interval, bool) or not isinstance(interval, (int, float)) or not interval > 0:
+        raise ValueError("Broken config.json: \"interval\" of \"watch\" should be a positive number")
+    if not isinstance(options["readOnNoteEdit"], bool):
+        raise ValueError("Broken config.json: \"readOnNoteEdit\" of \"watch\" should be true or false")
+    options["interval"] = float(interval)
+    return options
+
+def stat_of(path):
+    '''
+    Get the (mtime_ns, size) of a file, None if it is not found
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class watcher():
+    '''
+    Poll the book JSONs on the shelf and the notes of books for changes
+
+    attributes:
+        public:
+            interval : float
+                seconds between polls
+            readOnNoteEdit : bool
+                if True, an edit of note updates the timeLastRead of book to the mtime of note.
+                The manager should then be in write mode, as the book JSONs are written
+        private:
+            __bm : manager instance
+            __stats : dict
+                path of JSON -> (mtime_ns, size)
+            __notes : dict
+                path of JSON -> path of note
+            __statsNote : dict
+                path of JSON -> (mtime_ns, size) of note, None if not found
+    '''
+
+    def __init__(self, bm, interval=1.0, readOnNoteEdit=False):
+        '''
+        Parameters
+        ----------
+        bm : manager instance
+        interval : float
+        readOnNoteEdit : bool
+
+        Raises
+        ------
+        ValueError : if readOnNoteEdit but bm is in read mode
+        '''
+        assert isinstance(bm, manager)
+        assert float(interval) > 0
+        if readOnNoteEdit and bm.modeRead:
+            raise ValueError("readOnNoteEdit writes the book JSONs, not possible in read mode")
+        self.__bm = bm
+        self.interval = float(interval)
+        self.readOnNoteEdit = bool(readOnNoteEdit)
+        self.__stats = self.__scan_jsons()
+        self.__notes = {bi.filepath: bm.get_note_path_of(bi) for bi in bm.books}
+        self.__statsNote = self.__scan_notes()
+
+    def __scan_jsons(self):
+        '''
+        Stat the book JSONs on the shelf
+        '''
+        stats = {}
+        for lib in self.__bm.libraries:
+            for pathJSON in iter_book_jsons(lib.dbJSON):
+                st = stat_of(pathJSON)
+                # None if removed in the meantime
+                if st is not None:
+                    stats[pathJSON] = st
+        return stats
+
+    def __scan_notes(self):
+        '''
+        Stat the notes of books
+        '''
+        return {pathJSON: stat_of(pathNote) for pathJSON, pathNote in self.__notes.items() \
+                if pathNote is not None}
+
+    @profiler.timed("watcher.poll")
+    def poll(self):
+        '''
+        Check for changes once. The changed books are reloaded into the manager,
+        and the timeLastRead of books whose notes are edited is updated if readOnNoteEdit
+
+        Returns
+        -------
+        bool : True if the books are added, removed or reordered, then the table should be shown again
+        list of int : the indices of books changed
+        '''
+        stats = self.__scan_jsons()
+        removed = [path for path in self.__stats if path not in stats]
+        books = []
+        for pathJSON, st in list(stats.items()):
+            if self.__stats.get(pathJSON, None) == st:
+                continue
+            try:
+                books.append(book_item(pathJSON))
+            except (OSError, ValueError):
+                # e.g. being written by another tool. Read again at the next poll
+                if pathJSON in self.__stats:
+                    stats[pathJSON] = self.__stats[pathJSON]
+                else:
+                    del stats[pathJSON]
+        self.__stats = stats
+        changed = set(bi.filepath for bi in books)
+        fReorder = False
+        if books or removed:
+            fReorder = self.__bm.replace_books(books, removed)
+            for path in removed:
+                self.__notes.pop(path, None)
+            for bi in books:
+                self.__notes[bi.filepath] = self.__bm.get_note_path_of(bi)
+
+        statsNote = self.__scan_notes()
+        edited = [path for path, st in statsNote.items() \
+                if path in self.__statsNote and self.__statsNote[path] != st]
+        self.__statsNote = statsNote
+        changed.update(edited)
+        if self.readOnNoteEdit and edited:
+            fReorder = self.__read_on_note_edit(edited) or fReorder
+        # keep the catalog snapshot up to date for check and read modes
+        if books or removed or (self.readOnNoteEdit and edited):
+            self.__bm.publish_snapshot()
+        index = {bi.filepath: i for i, bi in enumerate(self.__bm.books)}
+        return fReorder, sorted(index[path] for path in changed if path in index)
+
+    def __read_on_note_edit(self, paths):
+        '''
+        Update the timeLastRead of books of paths to the mtime of their notes, if later
+
+        Returns
+        -------
+        bool : True if the books are reordered
+        '''
+        __pathsOld = [bi.filepath for bi in self.__bm.books]
+        paths = set(paths)
+        fMod = False
+        for bi in self.__bm.books:
+            st = self.__statsNote.get(bi.filepath, None)
+            if bi.filepath not in paths or st is None:
+                continue
+            timeNote = st[0] / 1e9
+            if dt.datetime.fromtimestamp(int(timeNote)) <= parse_time(bi.get_key("timeLastRead")):
+                continue
+            bi.update_last_time("read", timeNote)
+            bi.update_json(store=self.__bm.library_of(bi).backup)
+            # not to take our own write as an external change
+            self.__stats[bi.filepath] = stat_of(bi.filepath)
+            fMod = True
+        if not fMod:
+            return False
+        self.__bm.sort_books_by(self.__bm.sortKey)
+        return [bi.filepath for bi in self.__bm.books] != __pathsOld
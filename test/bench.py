@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Benchmarks on a synthetic library
+
+    PYTHONPATH=.. python bench.py [N]
+
+Each available codec backend loads and dumps (pretty and compact) N book JSONs (default 5000),
+and the check mode (readmana -c) shows them, timed end to end in a new interpreter.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import sys
+import time
+import tempfile
+import subprocess as sp
+from synthetic import make_library
+from readmanager import codec
+from readmanager.layout import iter_book_jsons
+
+dirRepo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def bench_codec(dirJSON):
+    '''
+    Time loading and dumping the books in dirJSON with each backend
+
+    Returns
+    -------
+    dict : backend -> (load, pretty dump, compact dump) in seconds
+    '''
+    paths = list(iter_book_jsons(dirJSON))
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as hFileIn:
+            contents.append(hFileIn.read())
+    results = {}
+    backendOrig = codec.backend
+    for backend in codec.backends:
+        try:
+            codec.set_backend(backend)
+        except ImportError:
+            continue
+        t0 = time.perf_counter()
+        books = [codec.loads(content) for content in contents]
+        t1 = time.perf_counter()
+        pretty = [codec.dumps(book, pretty=True) for book in books]
+        t2 = time.perf_counter()
+        for book in books:
+            codec.dumps(book, pretty=False)
+        t3 = time.perf_counter()
+        assert pretty == contents
+        results[backend] = (t1 - t0, t2 - t1, t3 - t2)
+    codec.set_backend(backendOrig)
+    return results
+
+def bench_check(pathConfig, repeat=5):
+    '''
+    Time readmana -c as run from the shell, i.e. including the start-up of the interpreter
+    and the imports, after a first run that publishes the catalog snapshot.
+    The terminal is taken from the standard input, as by readmana.
+    A bare interpreter is timed between the runs, as the measure of the speed of the machine
+
+    Parameters
+    ----------
+    pathConfig : str
+    repeat : int
+
+    Returns
+    -------
+    float, float, str : the best times in seconds of readmana -c and of the bare interpreter,
+        and the output of the last run
+    '''
+    env = dict(os.environ, READMANA_CONFIG=pathConfig, PYTHONPATH=dirRepo)
+    # as installed, i.e. with the modules compiled once, not at each run
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    command = [sys.executable, os.path.join(dirRepo, "readmana"), "-c"]
+    sp.run(command, env=env, stdout=sp.DEVNULL, check=True)
+    times = []
+    timesStart = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = sp.run(command, env=env, stdout=sp.PIPE, check=True)
+        t1 = time.perf_counter()
+        sp.run([sys.executable, "-c", "pass"], env=env, check=True)
+        timesStart.append(time.perf_counter() - t1)
+        times.append(t1 - t0)
+    return min(times), min(timesStart), proc.stdout.decode("utf-8")
+
+if __name__ == "__main__":
+    nBooks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as dirLib:
+        make_library(dirLib, nBooks)
+        results = bench_codec(os.path.join(dirLib, "JSON"))
+        timeCheck, timeStart, _ = bench_check(os.path.join(dirLib, "config.json"))
+    print("%d books, seconds" % nBooks)
+    print("%-8s %10s %10s %10s" % ("codec", "load", "pretty", "compact"))
+    for backend, times in results.items():
+        print("%-8s %10.4f %10.4f %10.4f" % ((backend,) + times))
+    print("check mode %10.4f (bare interpreter %.4f)" % (timeCheck, timeStart))
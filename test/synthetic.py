@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Generate a synthetic library of book JSONs, for benchmarks and tests at scale
+
+    python synthetic.py DIR [N]
+
+writes DIR/config.json, N book JSONs (default 1000) under DIR/JSON and an empty DIR/note.
+'''
+
+from __future__ import print_function, absolute_import
+import os
+import sys
+import json
+import random
+import datetime as dt
+
+__words = ["quantum", "field", "theory", "introduction", "statistical", "mechanics",
+           "group", "renormalization", "modern", "physics", "solid", "state",
+           "electronic", "structure", "methods", "density", "functional", "lectures",
+           "量子", "力学", "Schrödinger", "Mécanique", "analysis", "algebra"]
+__authors = ["A. Zee", "J. J. Sakurai", "R. M. Martin", "L. D. Landau", "R. Feynman",
+             "曾谨言", "C. Kittel", "N. W. Ashcroft", "S. Weinberg", "M. Peskin"]
+__tags = ["physics", "math", "qft", "condensed matter", "textbook", "lecture", "中文"]
+
+def make_book(rng, today=None):
+    '''
+    Make the dictionary of a random book
+
+    Parameters
+    ----------
+    rng : random.Random instance
+    today : datetime.date
+
+    Returns
+    -------
+    dict
+    '''
+    today = today or dt.date.today()
+    pageTotal = rng.randint(100, 1200)
+    dateAdded = today - dt.timedelta(days=rng.randint(30, 2000))
+    log = {}
+    page = 0
+    date = dateAdded
+    while date < today and page < pageTotal:
+        date += dt.timedelta(days=rng.randint(1, 20))
+        page = min(pageTotal, page + rng.randint(1, 40))
+        log[str(date)] = page
+    title = " ".join(rng.choice(__words) for _ in range(rng.randint(2, 6))).capitalize()
+    timeLast = "%s %02d:%02d:%02d" % (max(log) if log else str(dateAdded), \
+            rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+    return {
+        "title": title,
+        "titleShort": title[:12],
+        "author": rng.choice(__authors),
+        "pageTotal": pageTotal,
+        "pageCurrent": page,
+        "noteType": rng.choice([None, "md", "tex"]),
+        "noteLocation": None,
+        "bookLocalSource": None,
+        "timeLastRead": timeLast,
+        "timeLastMod": timeLast,
+        "dateAdded": str(dateAdded),
+        "datePlan": str(today + dt.timedelta(days=rng.randint(60, 3000))),
+        "log": log,
+        "remark": {d: ["remark on page %d" % p] for d, p in list(log.items())[::5]},
+        "tag": rng.sample(__tags, rng.randint(0, 3)),
+    }
+
+def make_library(dirLib, nBooks=1000, seed=0):
+    '''
+    Write a synthetic library to dirLib
+
+    Parameters
+    ----------
+    dirLib : str
+    nBooks : int
+    seed : int
+
+    Returns
+    -------
+    str : the path of config.json
+    '''
+    rng = random.Random(seed)
+    dirJSON = os.path.join(dirLib, "JSON")
+    os.makedirs(dirJSON, exist_ok=True)
+    os.makedirs(os.path.join(dirLib, "note"), exist_ok=True)
+    for i in range(nBooks):
+        with open(os.path.join(dirJSON, "book_%06d.json" % i), 'w') as hFileOut:
+            json.dump(make_book(rng), hFileOut, indent=2)
+    pathConfig = os.path.join(dirLib, "config.json")
+    with open(pathConfig, 'w') as hFileOut:
+        json.dump({"dbJSON": "-/", "dbNote": "-/"}, hFileOut, indent=2)
+    return pathConfig
+
+if __name__ == "__main__":
+    print(make_library(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1000))
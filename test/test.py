@@ -6,10 +6,50 @@ test module
 
 from __future__ import print_function, absolute_import
 import os
+import sys
+import subprocess as sp
 import unittest as ut
+import io
+import atexit
+import csv
+import gzip
+import json
+import shutil
+import random
+import time
+import zlib
+import zipfile
+from unittest import mock
+import contextlib
+import tempfile
 import datetime as dt
 from readmanager.bookitem import book_item
 from readmanager.manager import manager
+from readmanager.presenter import presenter
+from readmanager import profiler
+from readmanager import analytics
+from readmanager import forecast
+from readmanager import importer
+from readmanager import exporter
+from readmanager import layout
+from readmanager import notesearch
+from readmanager import fuzzy
+from readmanager import snapshot
+from readmanager import backup
+from readmanager import mirror
+from readmanager import codec
+from readmanager import logcompact
+from readmanager import opener
+from readmanager import metadata
+from readmanager import main
+from readmanager import watcher
+from readmanager import sorting
+from readmanager import views
+from readmanager import federation
+from readmanager import notetemplate
+from readmanager import utils
+from synthetic import make_book, make_library
+from bench import dirRepo
 
 class test_bookitem(ut.TestCase):
     '''
@@ -56,6 +96,52 @@ class test_bookitem(ut.TestCase):
         book.update_log()
         self.assertTrue(book._book_item__jsonDict["log"][str(dt.date.today())] == 1)
 
+    def test_dirty_fields(self):
+        '''
+        changed keys are recorded with their old values, and no-op changes are detected
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            pathJSON = os.path.join(dirTmp, "book_2.json")
+            shutil.copy("data/JSON/book_2.json", pathJSON)
+            # the keys missing in JSON are added on load
+            book_item(pathJSON).update_json()
+            book = book_item(pathJSON)
+        self.assertFalse(book._book_item__fMod)
+        self.assertEqual(book.get_changes(), {})
+        book.update_page("current", 1)
+        changes = book.get_changes()
+        self.assertEqual(changes["pageCurrent"], (0, 1))
+        self.assertEqual(set(changes) - {"timeLastMod"}, {"pageCurrent"})
+        book.update_log()
+        revision = book.revision
+        book.update_log()
+        self.assertEqual(book.revision, revision)
+        self.assertNotIn(str(dt.date.today()), book.get_changes()["log"][0])
+        self.assertEqual(book.compact_log(10000), 0)
+        self.assertEqual(book.revision, revision)
+        book.update_tag(["physics"])
+        book.update_tag(["physics"], fAdd=False)
+        # changed back: no longer dirty
+        book.update_page("current", 0)
+        self.assertEqual(set(book.get_changes()) - {"timeLastMod"}, {"log"})
+
+    def test_dirty_failed_write(self):
+        '''
+        the changes are kept when writing the JSON fails, so a retry saves them
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            pathJSON = os.path.join(dirTmp, "book_2.json")
+            shutil.copy("data/JSON/book_2.json", pathJSON)
+            book = book_item(pathJSON)
+            book.update_page("current", 1)
+            with mock.patch("readmanager.codec.encode", side_effect=OSError("disk full")):
+                self.assertRaises(OSError, book.update_json)
+            self.assertTrue(book._book_item__fMod)
+            self.assertEqual(book.get_changes()["pageCurrent"], (0, 1))
+            book.update_json()
+            self.assertFalse(book._book_item__fMod)
+            self.assertEqual(book_item(pathJSON).pageCurrent, 1)
+
 
 class test_manager(ut.TestCase):
     '''
@@ -87,12 +173,1127 @@ class test_manager(ut.TestCase):
         progress = mana.get_progress_all()
         self.assertTrue(progress, [(0, 0), (0, 0)])
 
+    def test_archive(self):
+        '''
+        archive and unarchive by moving JSONs, without reloading the manager
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            os.makedirs(os.path.join(dirLib, "JSON"))
+            os.makedirs(os.path.join(dirLib, "note"))
+            for name in ["book_1.json", "book_2.json"]:
+                shutil.copy2(os.path.join("data", "JSON", name), os.path.join(dirLib, "JSON"))
+            pathConfig = os.path.join(dirLib, "config.json")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/"}, h)
+            mana = manager(pathConfig)
+            mana.sort_books_by("title")
+            self.assertEqual(mana.filter_indices(filterTitle="book 2"), [0])
+            moved = mana.archive([0, -2], "arch")
+            self.assertEqual(len(moved), 1)
+            self.assertEqual(len(mana), 1)
+            self.assertEqual(len(mana.booksArchive), 1)
+            self.assertTrue(os.path.isfile(os.path.join(mana.dbArchive, "book_2.json")))
+            self.assertFalse(os.path.isfile(os.path.join(mana.dbJSON, "book_2.json")))
+            self.assertEqual(moved[0].filepath, os.path.join(mana.dbArchive, "book_2.json"))
+            # merged back in title order
+            mana.archive(0, "unarch")
+            self.assertEqual([bi.get_title() for bi in mana], ["my test book 2", "test_book"])
+            self.assertEqual(len(mana.booksArchive), 0)
+
+    def test_sharded_layout(self):
+        '''
+        migrate to the sharded layout, load and archive in it, and migrate back
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            dbJSON = os.path.join(dirLib, "JSON")
+            os.makedirs(dbJSON)
+            os.makedirs(os.path.join(dirLib, "note"))
+            for name in ["book_1.json", "book_2.json"]:
+                shutil.copy2(os.path.join("data", "JSON", name), dbJSON)
+            pathConfig = os.path.join(dirLib, "config.json")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/", "layout": "sharded"}, h)
+            self.assertEqual(layout.migrate(dbJSON, "sharded", verbose=False), 2)
+            pathSharded = layout.book_json_path(dbJSON, "book_1", "sharded")
+            self.assertTrue(os.path.isfile(pathSharded))
+            self.assertEqual(os.path.basename(os.path.dirname(pathSharded)), \
+                    layout.shard_of("book_1"))
+
+            mana = manager(pathConfig)
+            self.assertEqual(len(mana), 2)
+            self.assertTrue(mana.has_book_name("book_2"))
+            self.assertEqual(mana.json_path("new"), layout.book_json_path(dbJSON, "new", "sharded"))
+            mana.archive(mana.filter_indices(filterTitle="book 2"), "arch")
+            self.assertTrue(os.path.isfile( \
+                    layout.book_json_path(mana.dbArchive, "book_2", "sharded")))
+
+            self.assertEqual(layout.migrate(dbJSON, "flat", verbose=False), 1)
+            self.assertEqual(sorted(os.listdir(dbJSON)), ["archive", "book_1.json"])
+
+    def test_fuzzy_find(self):
+        '''
+        typo-tolerant search, with the index following title edits
+        '''
+        mana = manager('data/config_test.json')
+        mana.sort_books_by("title")
+        # "my test book 2" and "test_book"
+        self.assertEqual(mana.fuzzy_find("my tset bok"), [0, 1])
+        mana[1].update_title("Schrödinger's cat")
+        mana.reindex(mana[1])
+        self.assertEqual(mana.fuzzy_find("schrodinger"), [1])
+
+        index = fuzzy.trigram_index()
+        index.add("knuth", ["The Art of Computer Programming", "Donald E. Knuth"])
+        index.add("feynman", ["The Feynman Lectures on Physics", "Richard Feynman"])
+        self.assertEqual(index.query("knuht")[0][0], "knuth")
+        self.assertEqual(index.query("feinman lectures")[0][0], "feynman")
+        index.remove("knuth")
+        self.assertEqual(index.query("knuht"), [])
+
+    def test_storage(self):
+        '''
+        convert to gzip storage, load and save in it, and convert back
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            dbJSON = os.path.join(dirLib, "JSON")
+            shutil.copytree("data/JSON", dbJSON)
+            os.makedirs(os.path.join(dirLib, "note"))
+            pathConfig = os.path.join(dirLib, "config.json")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/", "storage": "gzip"}, h)
+            dictOrig = codec.load_path(os.path.join(dbJSON, "book_2.json"))
+            self.assertEqual(codec.convert(dbJSON, "gzip", verbose=False), 2)
+            self.assertEqual(sorted(os.listdir(dbJSON)), ["archive", "book_1.json.gz", "book_2.json.gz"])
+
+            mana = manager(pathConfig)
+            self.assertEqual(len(mana), 2)
+            self.assertTrue(mana.has_book_name("book_2"))
+            self.assertEqual(mana.json_path("new"), os.path.join(dbJSON, "new.json.gz"))
+            i = mana.filter_indices(filterTitle="book 2")[0]
+            mana[i].update_page("current", 3)
+            mana.update_json_all()
+            pathGz = os.path.join(dbJSON, "book_2.json.gz")
+            with open(pathGz, 'rb') as h:
+                self.assertEqual(codec.storage_of(h.read()), "gzip")
+            # without the mtime of gzip.compress, not in Python 3.7, and no time stamp
+            with mock.patch.object(gzip, "compress", side_effect=TypeError("mtime")):
+                content = codec.encode(dictOrig, "gzip")
+            self.assertEqual(content[4:8], b"\0\0\0\0")
+            self.assertEqual(codec.decode(content), dictOrig)
+            mana.archive(i, "arch")
+            self.assertTrue(os.path.isfile(os.path.join(mana.dbArchive, "book_2.json.gz")))
+
+            self.assertEqual(codec.convert(mana.dbArchive, "pretty", verbose=False), 1)
+            pathJSON = os.path.join(mana.dbArchive, "book_2.json")
+            dictNew = codec.load_path(pathJSON)
+            self.assertEqual(dictNew["pageCurrent"], 3)
+            for key in ["title", "author", "pageTotal", "dateAdded", "log"]:
+                self.assertEqual(dictNew[key], dictOrig[key])
+            with open(pathJSON, 'rb') as h:
+                self.assertEqual(h.read(), json.dumps(codec.load_path(pathJSON), indent=2).encode())
+
+    def test_snapshot(self):
+        '''
+        read mode from the catalog snapshot, reloaded when a save publishes a newer one
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            shutil.copytree("data/JSON", os.path.join(dirLib, "JSON"))
+            os.makedirs(os.path.join(dirLib, "note"))
+            pathConfig = os.path.join(dirLib, "config.json")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/"}, h)
+            manaWrite = manager(pathConfig)
+            # the first read session publishes the snapshot
+            manager(pathConfig, modeRead=True)
+            manaRead = manager(pathConfig, modeRead=True)
+            self.assertTrue(all(isinstance(bi, snapshot.snapshot_book) for bi in manaRead))
+            self.assertEqual(manaRead.booksArchive, [])
+            manaWrite.sort_books_by("title")
+            manaRead.sort_books_by("title")
+            for biW, biR in zip(manaWrite, manaRead):
+                self.assertEqual(biR.filepath, biW.filepath)
+                self.assertEqual(biR.get_title(short=True), biW.get_title(short=True))
+                self.assertEqual(biR.get_tag(), biW.get_tag())
+                self.assertEqual(biR.get_progress(), biW.get_progress())
+                self.assertEqual(biR.get_last_time("read"), biW.get_last_time("read"))
+            self.assertEqual(manaRead.filter_indices(filterTitle="book 2"), \
+                    manaWrite.filter_indices(filterTitle="book 2"))
+            self.assertFalse(manaRead.check_snapshot())
+
+            manaWrite[0].update_title("renamed")
+            manaWrite.update_json_all()
+            self.assertTrue(manaRead.check_snapshot())
+            self.assertIn("renamed", manaRead.get_keys("title"))
+            # keys out of the snapshot load the JSON
+            self.assertEqual(manaRead[0].get_key("log"), manaWrite[0].get_key("log"))
+
+            # a JSON changed out of readmana outdates the snapshot
+            pathJSON = manaWrite[0].filepath
+            with open(pathJSON, 'rb') as h:
+                content = h.read()
+            with open(pathJSON, 'wb') as h:
+                h.write(content.replace(b"renamed", b"edited"))
+            self.assertFalse(snapshot.is_current(manaRead.pathSnapshot, manaRead.dbJSON))
+            self.assertTrue(manaRead.check_snapshot())
+            self.assertIn("edited", manaRead.get_keys("title"))
+            self.assertTrue(snapshot.is_current(manaRead.pathSnapshot, manaRead.dbJSON))
+            self.assertFalse(manaRead.check_snapshot())
+
+            # page numbers stored as floats in the JSON
+            dictBook = codec.load_path(pathJSON)
+            dictBook["pageTotal"] = float(dictBook["pageTotal"])
+            with open(pathJSON, 'w') as h:
+                json.dump(dictBook, h)
+            manager(pathConfig, modeRead=True)
+            manaRead = manager(pathConfig, modeRead=True)
+            self.assertIsInstance(manaRead[0], snapshot.snapshot_book)
+            self.assertEqual(sorted(manaRead.get_keys("pageTotal")), \
+                    sorted(int(p) for p in manaWrite.get_keys("pageTotal")))
+
+    def test_check_work(self):
+        '''
+        check mode parses no JSON when the snapshot is current, and imports no feature module.
+        Its latency is reported by bench.py
+        '''
+        nBooks = 200
+        with tempfile.TemporaryDirectory() as dirLib:
+            pathConfig = make_library(dirLib, nBooks)
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.check(pathConfig)
+            self.assertTrue(os.path.isfile(os.path.join(dirLib, "JSON", ".readmana", \
+                    snapshot.nameSnapshot)))
+            out = io.StringIO()
+            with mock.patch("readmanager.codec.decode", wraps=codec.decode) as decode, \
+                    contextlib.redirect_stdout(out):
+                main.check(pathConfig)
+            self.assertEqual(decode.call_count, 0)
+            # the head and 2 rules
+            self.assertEqual(out.getvalue().count("\n"), nBooks + 3)
+
+        proc = sp.run([sys.executable, "-c", "import sys, readmanager.main; " \
+                "print(' '.join(sorted(m for m in sys.modules if m.startswith('readmanager'))))"], \
+                stdout=sp.PIPE, check=True, env=dict(os.environ, PYTHONPATH=dirRepo))
+        modules = proc.stdout.decode("utf-8").split()
+        self.assertIn("readmanager.presenter", modules)
+        for name in ["analytics", "importer", "exporter", "notesearch", "notetemplate", \
+                "metadata", "mirror", "fuzzy", "opener"]:
+            self.assertNotIn("readmanager." + name, modules)
+
     def test_from_environ(self):
         '''
         test from reading config file defined in the environment variable READ
         '''
         pass
 
+class test_opener(ut.TestCase):
+    '''
+    test the opener utilities
+    '''
+
+    def test_spawn_reap(self):
+        '''
+        commands on Linux, and viewers started detached and reaped
+        '''
+        self.assertEqual(opener.linux_command({"pdf": "zathura --fork", "md": None}, "a b.pdf", "pdf"), \
+                ["zathura", "--fork", "a b.pdf"])
+        self.assertEqual(opener.linux_command({"md": None}, "a.md", "md"), ["xdg-open", "a.md"])
+        proc = opener.spawn(["sleep", "0.1"])
+        self.assertIn(proc, opener.children)
+        self.assertNotEqual(os.getsid(proc.pid), os.getsid(0))
+        proc.wait()
+        self.assertEqual(opener.reap(), 0)
+        self.assertIsNone(opener.spawn(["readmana-no-such-viewer"]))
+        # the source is opened even if the note fails to
+        bm = mock.Mock(opener={"md": "readmana-no-such-viewer", "pdf": "true"})
+        getattr(opener, "__open_book_linux")(bm, (True, True), ("a.md", "a.pdf"), ("md", "pdf"))
+        self.assertEqual([proc.args for proc in opener.children], [["true", "a.pdf"]])
+        opener.children[0].wait()
+        self.assertEqual(opener.reap(), 0)
+
+def make_pdf(path, objects, trailer):
+    '''
+    Write a minimal PDF of objects, a list of bytes, numbered from 1
+    '''
+    with open(path, 'wb') as h:
+        h.write(b"%PDF-1.5\n")
+        for i, obj in enumerate(objects):
+            h.write(b"%d 0 obj\n" % (i + 1) + obj + b"\nendobj\n")
+        h.write(b"trailer\n" + trailer + b"\n%%EOF\n")
+
+def make_epub(path, title, author, nav=None, text=""):
+    '''
+    Write a minimal EPUB, with the page list of nav entries if given
+    '''
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr("mimetype", "application/epub+zip")
+        zf.writestr("META-INF/container.xml", '''<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>''')
+        zf.writestr("OEBPS/content.opf", '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>%s</dc:title><dc:creator>%s</dc:creator></metadata>
+<manifest><item id="nav" href="nav.xhtml" properties="nav" media-type="application/xhtml+xml"/>
+<item id="c1" href="c1.xhtml" media-type="application/xhtml+xml"/></manifest>
+<spine><itemref idref="c1"/></spine>
+</package>''' % (title, author))
+        pages = "" if nav is None else \
+                '<nav epub:type="page-list"><ol>%s</ol></nav>' % ("<li>p</li>" * nav)
+        zf.writestr("OEBPS/nav.xhtml", "<html><body>%s</body></html>" % pages)
+        zf.writestr("OEBPS/c1.xhtml", "<html><head><title>t</title></head><body><p>%s</p></body></html>" \
+                % text)
+
+class test_metadata(ut.TestCase):
+    '''
+    test the metadata extraction of local sources
+    '''
+
+    def test_extract(self):
+        '''
+        pages, title and author of PDF and EPUB, and the cached bulk extraction
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            pathPlain = os.path.join(dirTmp, "plain.pdf")
+            make_pdf(pathPlain, [b"<< /Type /Catalog /Pages 2 0 R >>", \
+                    b"<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>", \
+                    b"<< /Type /Page /Parent 2 0 R >>", b"<< /Type /Page /Parent 2 0 R >>", \
+                    b"<< /Title <FEFF91CF5B50> /Author (A. \\(Zee\\) \\351) >>"], \
+                    b"<< /Size 6 /Root 1 0 R /Info 5 0 R >>")
+            self.assertEqual(metadata.extract(pathPlain), \
+                    {"pages": 2, "title": "量子", "author": "A. (Zee) é"})
+
+            # catalog, page tree and info in a compressed object stream
+            objs = [b"<< /Type /Catalog /Pages 4 0 R >>", b"<< /Title (Compressed) >>", \
+                    b"<< /Type /Pages /Kids [] /Count 321 >>"]
+            header = b""
+            body = b""
+            for i, obj in enumerate(objs):
+                header += b"%d %d " % (i + 2, len(body))
+                body += obj + b" "
+            stream = zlib.compress(header + body)
+            pathStm = os.path.join(dirTmp, "objstm.pdf")
+            make_pdf(pathStm, [b"<< /Type /ObjStm /N 3 /First %d /Filter /FlateDecode " \
+                    b"/Length %d >>\nstream\n" % (len(header), len(stream)) + stream + b"\nendstream"], \
+                    b"<< /Type /XRef /Root 2 0 R /Info 3 0 R >>")
+            self.assertEqual(metadata.extract(pathStm), \
+                    {"pages": 321, "title": "Compressed", "author": None})
+
+            pathNav = os.path.join(dirTmp, "nav.epub")
+            make_epub(pathNav, "Lectures", "R. Feynman", nav=42)
+            self.assertEqual(metadata.extract(pathNav), \
+                    {"pages": 42, "title": "Lectures", "author": "R. Feynman"})
+            pathText = os.path.join(dirTmp, "text.epub")
+            make_epub(pathText, "Notes", "A", text="x" * (2 * metadata.charsPerPage + 1))
+            self.assertEqual(metadata.extract(pathText)["pages"], 3)
+            self.assertIsNone(metadata.extract(os.path.join(dirTmp, "a.djvu")))
+
+            pathCache = os.path.join(dirTmp, ".readmana", metadata.nameCache)
+            paths = [pathPlain, pathStm, pathNav, pathText, os.path.join(dirTmp, "missing.pdf")]
+            out = io.StringIO()
+            infos = metadata.extract_all(paths, pathCache, nWorkers=2)
+            self.assertEqual(sorted(infos), sorted(paths[:4]))
+            self.assertEqual(infos[pathNav]["pages"], 42)
+            # unchanged files and copies are not parsed again
+            pathCopy = os.path.join(dirTmp, "copy.pdf")
+            shutil.copy(pathPlain, pathCopy)
+            profiler.reset()
+            profiler.enable(stream=out)
+            try:
+                infos = metadata.extract_all(paths + [pathCopy], pathCache, nWorkers=1)
+            finally:
+                profiler.disable()
+            self.assertFalse("metadata.pdf" in profiler.timings)
+            self.assertEqual(infos[pathCopy]["title"], "量子")
+            profiler.reset()
+
+class test_sorting(ut.TestCase):
+    '''
+    test multi-key sorting
+    '''
+
+    def test_multi_key(self):
+        '''
+        parse specs, sort by stable passes and keep the order when books are merged back
+        '''
+        self.assertEqual(sorting.parse_spec("tag, -lag,+read"), \
+                [("tag", False), ("lag", True), ("read", False)])
+        self.assertRaises(ValueError, sorting.parse_spec, "tag,lagg")
+        self.assertRaises(ValueError, sorting.parse_spec, "")
+        with tempfile.TemporaryDirectory() as dirLib:
+            mana = manager(make_library(dirLib, 60), verbose=False)
+            self.assertTrue(mana.sort_books_by("tag,-lag,title"))
+
+            def key(bi):
+                tags = sorted(t.lower() for t in bi.get_tag())
+                prog = bi.get_progress()
+                return (not tags, tags[:1], prog[0] - prog[1], bi.get_title())
+            self.assertEqual([bi.filepath for bi in mana], \
+                    [bi.filepath for bi in sorted(mana.books, key=key)])
+            self.assertFalse(mana.sort_books_by("tag,nokey"))
+            self.assertEqual(mana.sortKey, "tag,-lag,title")
+
+            orderRemain = [bi.filepath for bi in sorted(mana.books, \
+                    key=lambda bi: (bi.pageTotal - bi.pageCurrent, bi.get_key("dateAdded"), \
+                    bi.get_title()))]
+            mana.sort_books_by("-added")
+            mana.sort_books_by("remain,+added,title")
+            self.assertEqual([bi.filepath for bi in mana], orderRemain)
+            mana.archive(list(range(0, 60, 3)), "arch")
+            mana.archive(list(range(len(mana.booksArchive))), "unarch")
+            self.assertEqual([bi.filepath for bi in mana], orderRemain)
+
+    def test_top(self):
+        '''
+        partial selection gives the head of the full sort, ties included
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            mana = manager(make_library(dirLib, 80), verbose=False)
+            for spec in ["read", "lag", "remain", "-prog,title", "tag,-lag", "plan,added"]:
+                specs = sorting.parse_spec(spec)
+                for n in [1, 7, 100]:
+                    self.assertEqual(sorting.top_order(mana.books, specs, n), \
+                            sorting.sort_order(mana.books, specs)[:n])
+            orderOld = list(mana.books)
+            indices = mana.top_indices(5, "remain")
+            self.assertEqual(mana.books, orderOld)
+            unfinished = [bi for bi in mana if bi.pageCurrent < bi.pageTotal]
+            self.assertEqual([mana[i] for i in indices], sorted(unfinished, \
+                    key=lambda bi: bi.pageTotal - bi.pageCurrent)[:5])
+            self.assertRaises(ValueError, mana.top_indices, 5, "urgency")
+
+class test_views(ut.TestCase):
+    '''
+    test saved filter views
+    '''
+
+    def test_incremental(self):
+        '''
+        queries match brute force, only touched books are evaluated again
+        '''
+        self.assertRaises(ValueError, views.parse_query, "")
+        self.assertRaises(ValueError, views.parse_query, "tag:physics OR")
+        self.assertRaises(ValueError, views.parse_query, "unfinished NOT")
+
+        def brute(bi):
+            tags = [t.lower() for t in bi.get_tag()]
+            return ("physics" in tags and bi.pageCurrent < bi.pageTotal) or \
+                    ("zee" in bi.get_author().lower() and "math" not in tags)
+        with tempfile.TemporaryDirectory() as dirLib:
+            pathConfig = make_library(dirLib, 60)
+            utils.save_view(pathConfig, "mixed", \
+                    "tag:Physics AND unfinished OR author:zee -tag:math")
+            self.assertRaises(ValueError, utils.save_view, pathConfig, "bad", "NOT")
+            mana = manager(pathConfig, verbose=False)
+            self.assertEqual(mana.views.names(), ["mixed"])
+            self.assertEqual(mana.view_indices("mixed"), \
+                    [i for i, bi in enumerate(mana) if brute(bi)])
+            self.assertRaises(KeyError, mana.view_indices, "none")
+            self.assertEqual(mana.views.refresh(mana.books), 0)
+
+            bi = next(bi for bi in mana if not brute(bi))
+            bi.update_tag(["physics"])
+            if bi.pageCurrent == bi.pageTotal:
+                bi.update_page("current", 0)
+            self.assertEqual(mana.views.refresh(mana.books), 1)
+            self.assertIn(mana.books.index(bi), mana.view_indices("mixed"))
+            # edited out of the view, by finishing it
+            biOut = next(bi for bi in mana if brute(bi) and "zee" not in bi.get_author().lower())
+            biOut.update_page("current", biOut.pageTotal)
+            self.assertNotIn(mana.books.index(biOut), mana.view_indices("mixed"))
+            mana.sort_books_by("title")
+            mana.archive(mana.books.index(bi), "arch")
+            self.assertEqual(mana.views.refresh(mana.books), 0)
+            self.assertEqual(mana.view_indices("mixed"), \
+                    [i for i, bi in enumerate(mana) if brute(bi)])
+            mana.views.add("behind", "behind")
+            self.assertEqual(mana.view_indices("behind"), [i for i, bi in enumerate(mana) \
+                    if bi.get_progress()[1] > bi.get_progress()[0]])
+
+            # read mode: views evaluated from the snapshot without loading the books
+            mana.update_json_all()
+            manaRead = manager(pathConfig, modeRead=True, verbose=False)
+            self.assertEqual(sorted(manaRead[i].filepath for i in manaRead.view_indices("mixed")), \
+                    sorted(mana[i].filepath for i in mana.view_indices("mixed")))
+            self.assertTrue(all(bi.revision == 0 for bi in manaRead))
+
+            # a number out of range is not counted from the end
+            pre = mock.Mock(spec=presenter, view=None)
+            for choice, view in [("0", "0"), ("-1", "-1"), ("1", "mixed"), ("2", "behind")]:
+                pre.set_view.reset_mock()
+                with mock.patch("builtins.input", return_value=choice), \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    utils.switch_view(mana, pre)
+                pre.set_view.assert_called_once_with(view)
+
+class test_federation(ut.TestCase):
+    '''
+    test libraries federated into one shelf
+    '''
+
+    def test_merge_and_route(self):
+        '''
+        books of both libraries merged in order, edits and moves routed to their library
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            dirHome = os.path.join(dirTmp, "home")
+            dirLab = os.path.join(dirTmp, "lab")
+            pathConfig = make_library(dirHome, 15)
+            make_library(dirLab, 10, seed=1)
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/", "libraries": {"lab": dirLab}}, h)
+            mana = manager(pathConfig, verbose=False)
+            self.assertEqual([lib.name for lib in mana.libraries], [federation.nameHome, "lab"])
+            self.assertEqual(len(mana), 25)
+            self.assertEqual([bi.get_last_time("read") for bi in mana], \
+                    sorted((bi.get_last_time("read") for bi in mana), reverse=True))
+            self.assertEqual(mana.get_sources().count("lab"), 10)
+
+            biLab = next(bi for bi in mana if mana.library_of(bi).name == "lab")
+            biLab.update_note_dir("-/lab_note")
+            biLab.update_note_type("md")
+            self.assertEqual(mana.get_note_path_of(biLab), \
+                    os.path.join(dirLab, "note", "lab_note", "lab_note.md"))
+            mana.update_json_all()
+            biLab.update_page("current", 0 if biLab.pageCurrent else 1)
+            mana.update_json_all()
+            # the home library has a book of the same name
+            self.assertEqual(len(mana.libraries[1].backup.versions( \
+                    layout.book_name(biLab.filepath))), 2)
+            self.assertEqual(mana.libraries[0].backup.versions(layout.book_name(biLab.filepath)), [])
+            mana.archive(mana.books.index(biLab), "arch")
+            self.assertTrue(biLab.filepath.startswith(os.path.join(dirLab, "JSON", "archive")))
+
+            # read mode: one snapshot for each library
+            manaRead = manager(pathConfig, modeRead=True, verbose=False)
+            self.assertEqual(len(manaRead), 24)
+            manaRead = manager(pathConfig, modeRead=True, verbose=False)
+            self.assertIsInstance(manaRead[0], snapshot.snapshot_book)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main.check(pathConfig)
+            self.assertEqual(out.getvalue().count(" lab"), 9)
+            # a narrow terminal: the optional columns not fitting are dropped, not the bar
+            for lenProgBar, nLab in [(40, 9), (30, 0), (20, 0)]:
+                out = io.StringIO()
+                with mock.patch.object(presenter, "_presenter__lenProgBar", lenProgBar), \
+                        contextlib.redirect_stdout(out):
+                    main.check(pathConfig, showForecast=True)
+                self.assertEqual(out.getvalue().count(" lab"), nLab)
+                self.assertEqual("Finish" in out.getvalue(), lenProgBar >= 24)
+
+            # read mode of libraries not writable, loaded from the JSONs
+            for lib in manaRead.libraries:
+                os.remove(lib.pathSnapshot)
+            with mock.patch("readmanager.manager.publish", side_effect=PermissionError("read-only")):
+                manaRead = manager(pathConfig, modeRead=True, verbose=False)
+            self.assertEqual(len(manaRead), 24)
+            self.assertIsInstance(manaRead[0], book_item)
+            self.assertFalse(manaRead.check_snapshot())
+
+class test_watcher(ut.TestCase):
+    '''
+    test watching the shelf for external changes
+    '''
+
+    def test_poll(self):
+        '''
+        changed books reloaded, note edits update the last read time, removal reorders
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            shutil.copytree("data/JSON", os.path.join(dirLib, "JSON"))
+            shutil.copytree("data/note", os.path.join(dirLib, "note"))
+            pathConfig = os.path.join(dirLib, "config.json")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/"}, h)
+            pathBook1 = os.path.join(dirLib, "JSON", "book_1.json")
+            pathBook2 = os.path.join(dirLib, "JSON", "book_2.json")
+            book = book_item(pathBook2)
+            book.update_note_dir("-/book_2")
+            book.update_note_type("md")
+            book.update_json()
+            # the times of last read are written
+            self.assertRaises(ValueError, watcher.watcher, \
+                    manager(pathConfig, modeRead=True, verbose=False), readOnNoteEdit=True)
+            bm = manager(pathConfig, verbose=False)
+            wat = watcher.watcher(bm, interval=0.1, readOnNoteEdit=True)
+            self.assertEqual(wat.poll(), (False, []))
+
+            book = book_item(pathBook1)
+            book.update_page("current", 7)
+            book.update_json()
+            # not to depend on the resolution of mtime
+            os.utime(pathBook1, ns=(0, 0))
+            fReorder, indices = wat.poll()
+            self.assertFalse(fReorder)
+            self.assertEqual([bm[i].filepath for i in indices], [pathBook1])
+            self.assertEqual(bm[indices[0]].pageCurrent, 7)
+            self.assertEqual(wat.poll(), (False, []))
+
+            timeNote = time.time() - 60
+            os.utime(os.path.join(dirLib, "note", "book_2", "book_2.md"), (timeNote, timeNote))
+            fReorder, indices = wat.poll()
+            self.assertEqual([bm[i].filepath for i in indices], [pathBook2])
+            self.assertEqual(book_item(pathBook2).get_key("timeLastRead"), \
+                    time.strftime("%Y-%m-%d %X", time.localtime(timeNote)))
+            # our own write is not taken as an external change
+            self.assertEqual(wat.poll(), (False, []))
+
+            os.remove(pathBook1)
+            self.assertEqual(wat.poll(), (True, []))
+            self.assertEqual([bi.filepath for bi in bm], [pathBook2])
+
+    def test_watch_config(self):
+        '''
+        the options of watch are taken from config by their keys, and validated
+        '''
+        self.assertEqual(watcher.watch_config({}), {"interval": 1.0, "readOnNoteEdit": False})
+        self.assertEqual(watcher.watch_config({"watch": {"interval": 2, "readOnNoteEdit": True}}), \
+                {"interval": 2.0, "readOnNoteEdit": True})
+        for dictWatch in [{"intervall": 1.0}, {"interval": 0}, {"interval": "1"}, \
+                {"interval": True}, {"readOnNoteEdit": "yes"}, []]:
+            self.assertRaises(ValueError, watcher.watch_config, {"watch": dictWatch})
+
+class test_profiler(ut.TestCase):
+    '''
+    Unit test for the phase timers
+    '''
+
+    def test_phase_timing(self):
+        '''
+        timers record nothing when disabled, and accumulate calls when enabled
+        '''
+        profiler.reset()
+        with profiler.phase("test.disabled"):
+            pass
+        self.assertFalse("test.disabled" in profiler.timings)
+
+        registered = []
+        with mock.patch.object(atexit, "register", registered.append), \
+                mock.patch.object(atexit, "unregister", registered.remove):
+            profiler.enable(stream=io.StringIO())
+            profiler.enable(stream=io.StringIO())
+            # the report on exit is registered once, and cancelled by disable
+            self.assertEqual(len(registered), 1)
+            try:
+                book_item("data/JSON/book_1.json")
+                with profiler.phase("test.enabled"):
+                    pass
+            finally:
+                profiler.disable()
+        self.assertEqual(registered, [])
+        self.assertEqual(profiler.timings["test.enabled"][0], 1)
+        self.assertEqual(profiler.timings["bookitem.readjson"][0], 1)
+        out = io.StringIO()
+        profiler.report(out)
+        self.assertTrue("bookitem.readjson" in out.getvalue())
+        profiler.reset()
+
+class test_codec(ut.TestCase):
+    '''
+    test the JSON codec with each available backend
+    '''
+
+    def test_pretty_stable(self):
+        '''
+        pretty output is the same bytes as json.dumps with indent 2
+        '''
+        rng = random.Random(1)
+        books = [make_book(rng) for _ in range(50)]
+        books.append({"title": "x\x01\x7f\t\"é中\U0001f600\u2028", "f": [1.5, 1e16, 1e-05, 2 ** 70], \
+                "log": {}, "tag": [], "remark": {"a": [{}]}})
+        backendOrig = codec.backend
+        try:
+            for backend in codec.backends:
+                try:
+                    codec.set_backend(backend)
+                except ImportError:
+                    continue
+                for book in books:
+                    content = codec.dumps(book, pretty=True)
+                    self.assertEqual(content, json.dumps(book, indent=2).encode("utf-8"))
+                    self.assertEqual(codec.loads(content), book)
+                    self.assertEqual(codec.loads(codec.dumps(book, pretty=False)), book)
+                # NaN and infinity kept as json writes them
+                book = {"f": [float("nan"), {"g": float("inf")}, -float("inf")]}
+                self.assertEqual(codec.dumps(book), json.dumps(book, indent=2).encode("utf-8"))
+                self.assertEqual(codec.dumps(book, pretty=False), b'{"f":[NaN,{"g":Infinity},-Infinity]}')
+        finally:
+            codec.set_backend(backendOrig)
+
+class test_logcompact(ut.TestCase):
+    '''
+    test the compaction of book logs
+    '''
+
+    def test_compact_expand(self):
+        '''
+        compaction is lossless and reversible, and get_key returns the complete log
+        '''
+        rng = random.Random(2)
+        today = dt.date.today()
+        dictBook = make_book(rng, today)
+        dictBook["log"][str(today)] = 5
+        dictBook["log"]["1900-01-01 old"] = 1
+        logOrig = dict(dictBook["log"])
+        nOld = sum(1 for d in logOrig if d < str(today - dt.timedelta(days=30)))
+        self.assertEqual(logcompact.compact_log(dictBook, 30, today), nOld - 1)
+        self.assertEqual(logcompact.compact_log(dictBook, 30, today), 0)
+        self.assertIn("1900-01-01 old", dictBook["log"])
+        self.assertEqual(logcompact.full_log(dictBook), logOrig)
+
+        with tempfile.TemporaryDirectory() as dirTmp:
+            pathJSON = os.path.join(dirTmp, "book.json")
+            with open(pathJSON, 'wb') as h:
+                h.write(codec.encode(dictBook))
+            book = book_item(pathJSON)
+            self.assertEqual(book.get_key("log"), logOrig)
+            self.assertEqual(analytics.log_to_deltas(book.get_key("log")), \
+                    analytics.log_to_deltas(logOrig))
+            self.assertEqual(book.expand_log(), nOld - 1)
+            book.update_json()
+            self.assertEqual(codec.load_path(pathJSON)["log"], logOrig)
+            self.assertNotIn(logcompact.keyCompact, codec.load_path(pathJSON))
+
+class test_mirror(ut.TestCase):
+    '''
+    Unit test for delta sync to a mirror
+    '''
+
+    def test_sync(self):
+        '''
+        only changed files copied, touched files hashed only, removals followed
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            pathConfig = make_library(os.path.join(dirTmp, "lib"), 20)
+            dirJSON = os.path.join(dirTmp, "lib", "JSON")
+            dirMirror = os.path.join(dirTmp, "mirror")
+            notetemplate.write_note(os.path.join(dirTmp, "lib", "note", "a", "a.md"), "note")
+            # the cache of the library, e.g. the catalog snapshot, is local
+            manager(pathConfig, modeRead=True, verbose=False)
+            self.assertTrue(os.path.isdir(os.path.join(dirJSON, ".readmana")))
+            self.assertRaises(ValueError, utils.sync_library, pathConfig, \
+                    os.path.join(dirJSON, "mirror"))
+
+            # the databases relative to the working directory
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": os.path.relpath(dirJSON), \
+                        "dbNote": os.path.relpath(os.path.join(dirTmp, "lib", "note"))}, h)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertRaises(ValueError, utils.sync_library, pathConfig, \
+                        os.path.join(dirJSON, "mirror"))
+                report = utils.sync_library(pathConfig, dirMirror, nWorkers=4)
+            self.assertEqual((report["files"], report["copied"]), (21, 21))
+            self.assertFalse(os.path.exists(os.path.join(dirMirror, "JSON", ".readmana")))
+            self.assertEqual(len(manager(os.path.join(dirMirror, "config.json"), verbose=False)), 20)
+            report = mirror.sync_tree(dirJSON, os.path.join(dirMirror, "JSON"), \
+                    dirsSkip=[".readmana"])
+            self.assertEqual((report["hashed"], report["copied"]), (0, 0))
+
+            pathTouched = os.path.join(dirJSON, "book_000001.json")
+            os.utime(pathTouched, ns=(0, 0))
+            book = book_item(os.path.join(dirJSON, "book_000002.json"))
+            book.update_tag(["mirrored"])
+            book.update_json()
+            os.remove(os.path.join(dirJSON, "book_000003.json"))
+            report = mirror.sync_tree(dirJSON, os.path.join(dirMirror, "JSON"), \
+                    dirsSkip=[".readmana"])
+            self.assertEqual((report["hashed"], report["copied"], report["removed"]), (2, 1, 1))
+            self.assertEqual(report["bytes"], os.path.getsize(book.filepath))
+            self.assertEqual(os.stat(os.path.join(dirMirror, "JSON", "book_000001.json")).st_mtime_ns, 0)
+            self.assertEqual(mirror.hash_file(os.path.join(dirMirror, "JSON", "book_000002.json")), \
+                    mirror.hash_file(book.filepath))
+            self.assertFalse(os.path.exists(os.path.join(dirMirror, "JSON", "book_000003.json")))
+
+    def test_sync_vanished(self):
+        '''
+        a file removed between the scan and its hash is skipped, counted and unmirrored
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            dirSrc = os.path.join(dirTmp, "src")
+            dirDst = os.path.join(dirTmp, "dst")
+            os.makedirs(dirSrc)
+            for name in ["a.txt", "b.txt", "c.txt"]:
+                with open(os.path.join(dirSrc, name), 'w') as h:
+                    h.write(name)
+            self.assertEqual(mirror.sync_tree(dirSrc, dirDst)["copied"], 3)
+            for name in ["a.txt", "b.txt"]:
+                with open(os.path.join(dirSrc, name), 'w') as h:
+                    h.write(name * 2)
+            hashFile = mirror.hash_file
+            def hash_removing(path):
+                if path.endswith("b.txt"):
+                    os.remove(path)
+                return hashFile(path)
+            with mock.patch("readmanager.mirror.hash_file", side_effect=hash_removing):
+                report = mirror.sync_tree(dirSrc, dirDst, nWorkers=2)
+            self.assertEqual((report["files"], report["hashed"], report["copied"]), (3, 1, 1))
+            self.assertEqual((report["vanished"], report["removed"]), (1, 1))
+            self.assertFalse(os.path.exists(os.path.join(dirDst, "b.txt")))
+            self.assertEqual(set(mirror.load_manifest(dirDst)), {"a.txt", "c.txt"})
+            # a file removed before its copy is skipped the same way
+            with open(os.path.join(dirSrc, "a.txt"), 'w') as h:
+                h.write("a")
+            with mock.patch("shutil.copy2", side_effect=FileNotFoundError):
+                report = mirror.sync_tree(dirSrc, dirDst)
+            self.assertEqual((report["copied"], report["vanished"]), (0, 1))
+            self.assertEqual(set(mirror.load_manifest(dirDst)), {"c.txt"})
+
+class test_backup(ut.TestCase):
+    '''
+    test the content-addressed backup store
+    '''
+
+    def test_backup_restore(self):
+        '''
+        dedup of unchanged content, backup on save, retention and restore
+        '''
+        with tempfile.TemporaryDirectory() as dirTmp:
+            store = backup.backup_store(os.path.join(dirTmp, "backup"), keepLast=2, keepDaily=1)
+            self.assertTrue(store.backup("a", b"v1"))
+            self.assertFalse(store.backup("a", b"v1"))
+            self.assertTrue(store.backup("b", b"v1"))
+            self.assertEqual(len(os.listdir(os.path.join(dirTmp, "backup", "objects"))), 1)
+
+            pathJSON = os.path.join(dirTmp, "book_2.json")
+            shutil.copy2("data/JSON/book_2.json", pathJSON)
+            with open(pathJSON, 'rb') as h:
+                contentOrig = h.read()
+            book = book_item(pathJSON)
+            book.update_page("current", 2)
+            book.update_json(store=store)
+            self.assertEqual(store.versions("book_2")[-1][1], backup.hash_of(contentOrig))
+            self.assertFalse(any(f.endswith("_bak") for f in os.listdir(dirTmp)))
+
+            store.backup("a", b"v2")
+            store.backup("a", b"v3")
+            self.assertEqual([store.read(d) for _, d in store.versions("a")], [b"v2", b"v3"])
+            self.assertEqual(store.prune(), 0)
+            store.restore("book_2", pathJSON)
+            with open(pathJSON, 'rb') as h:
+                self.assertEqual(h.read(), contentOrig)
+            store.backup("b", b"v4")
+            store.backup("b", b"v5")
+            # v1 is no longer referred to
+            self.assertEqual(store.prune(), 1)
+
+    def test_restore_storage(self):
+        '''
+        the restored JSON takes the extension of the storage of the version, not of the config
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            pathConfig = make_library(dirLib, 3)
+            dbJSON = os.path.join(dirLib, "JSON")
+            store = backup.backup_store(os.path.join(dbJSON, ".readmana", backup.nameBackup))
+            pathJSON = os.path.join(dbJSON, "book_000001.json")
+            dictBook = codec.load_path(pathJSON)
+            store.backup("book_000001", codec.encode(dictBook, "gzip"))
+            os.remove(pathJSON)
+            with contextlib.redirect_stdout(io.StringIO()):
+                utils.restore_backup(pathConfig, "book_000001")
+            self.assertFalse(os.path.exists(pathJSON))
+            self.assertEqual(codec.load_path(pathJSON + ".gz"), dictBook)
+
+            # the gzip JSON replaced by a pretty version, and backed up
+            store.backup("book_000001", codec.encode(dictBook, "pretty"))
+            with contextlib.redirect_stdout(io.StringIO()):
+                utils.restore_backup(pathConfig, "book_000001")
+            self.assertFalse(os.path.exists(pathJSON + ".gz"))
+            with open(pathJSON, 'rb') as h:
+                self.assertEqual(codec.storage_of(h.read()), "pretty")
+            self.assertEqual(codec.storage_of(store.read(store.versions("book_000001")[-1][1])), \
+                    "gzip")
+
+class test_analytics(ut.TestCase):
+    '''
+    Unit test for reading activity analytics
+    '''
+
+    def test_daily_series(self):
+        '''
+        convert logs to deltas, roll up and update the cache incrementally
+        '''
+        self.assertEqual(analytics.log_to_deltas( \
+                {"2018-10-02": 30, "2018-10-01": 10, "2018-10-03": 20, "2018-10-05": 25}), \
+                {"2018-10-01": 10, "2018-10-02": 20, "2018-10-05": 5})
+        with tempfile.TemporaryDirectory() as dirDB:
+            pathCache = os.path.join(dirDB, ".readmana", "activity.json")
+            for name, log in [("a", {"2018-10-01": 10, "2018-10-08": 15}), \
+                              ("b", {"2018-10-01": 5})]:
+                with open(os.path.join(dirDB, name + ".json"), 'w') as h:
+                    json.dump({"log": log}, h)
+            daily = analytics.daily_series([dirDB], pathCache)
+            self.assertEqual(daily, {"2018-10-01": 15, "2018-10-08": 5})
+            self.assertTrue(os.path.isfile(pathCache))
+            self.assertEqual(analytics.rollup(daily, "week"), {"2018-W40": 15, "2018-W41": 5})
+            self.assertEqual(analytics.rollup(daily, "month"), {"2018-10": 20})
+            # only b changes, and a is removed
+            with open(os.path.join(dirDB, "b.json"), 'w') as h:
+                json.dump({"log": {"2018-10-01": 5, "2018-11-01": 50}}, h)
+            os.remove(os.path.join(dirDB, "a.json"))
+            daily = analytics.daily_series([dirDB], pathCache)
+            self.assertEqual(daily, {"2018-10-01": 5, "2018-11-01": 45})
+
+class test_forecast(ut.TestCase):
+    '''
+    Unit test for velocity and finish date forecast
+    '''
+
+    def test_forecast_finish(self):
+        '''
+        velocity from the weighted window and the finish date against datePlan
+        '''
+        today = dt.date(2018, 10, 10)
+        # 10 pages per day over the whole window
+        log = {str(today - dt.timedelta(days=i)): 300 - 10 * i for i in range(40)}
+        self.assertAlmostEqual(forecast.velocity(log, today), 10.0)
+        self.assertEqual(forecast.velocity({}, today), 0.0)
+        # started two days ago
+        self.assertAlmostEqual(forecast.velocity({"2018-10-09": 30, "2018-10-10": 60}, today), \
+                (2 * 30 + 1 * 30) / 3.0)
+
+        book = book_item("data/JSON/book_2.json")
+        book._book_item__jsonDict["log"] = log
+        book.update_page("current", 50)
+        v, dateFinish, fLate = forecast.forecast_finish(book, today)
+        self.assertEqual(dateFinish, dt.date(2018, 10, 15))
+        self.assertFalse(fLate)
+        book.update_date("plan", "2018-10-12")
+        self.assertTrue(forecast.forecast_finish(book, today)[2])
+        self.assertEqual(forecast.forecast_str(forecast.forecast_finish(book, today)), \
+                "2018-10-15!")
+
+class test_importer(ut.TestCase):
+    '''
+    Unit test for bulk import
+    '''
+
+    def test_import_books(self):
+        '''
+        import from BibTeX and CSV with collision-free names and dry run
+        '''
+        bib = '''@comment{ignored}
+@book{knuth1997,
+  title = {The Art of {Computer} Programming},
+  author = "Donald E. Knuth and Someone Else",
+  pages = 672,
+  keywords = {algorithm; cs},
+  publisher = {Addison-Wesley},
+  abstract = {ignored field},
+}
+@book{nokey,
+  author = {No Title},
+}
+'''
+        records = list(importer.iter_bibtex(io.StringIO(bib)))
+        self.assertEqual(len(records), 2)
+        dictBook, nameHint, unknown = importer.map_record(records[0], dt.date(2018, 10, 1))
+        self.assertEqual(dictBook["title"], "The Art of Computer Programming")
+        self.assertEqual(dictBook["author"], "Donald E. Knuth, Someone Else")
+        self.assertEqual(dictBook["pageTotal"], 672)
+        self.assertEqual(dictBook["tag"], ["algorithm", "cs"])
+        self.assertEqual(dictBook["press"], "Addison-Wesley")
+        self.assertEqual(dictBook["log"], {"2018-10-01": 0})
+        self.assertEqual((nameHint, unknown), ("knuth1997", ["abstract"]))
+
+        with tempfile.TemporaryDirectory() as dirLib:
+            dbJSON = os.path.join(dirLib, "JSON")
+            dbNote = os.path.join(dirLib, "note")
+            os.makedirs(dbJSON)
+            os.makedirs(dbNote)
+            shutil.copy2(os.path.join("data", "JSON", "book_1.json"), dbJSON)
+            pathCSV = os.path.join(dirLib, "books.csv")
+            with open(pathCSV, 'w') as h:
+                h.write("Title,Authors,Pages,Tags\nBook 1,A,10,x;y\nbook_1,B,20,\n,C,5,\n")
+            report = importer.import_books(pathCSV, dbJSON, dryRun=True, verbose=False)
+            self.assertEqual(report["read"], 3)
+            self.assertEqual(len(report["skipped"]), 1)
+            self.assertEqual([os.path.basename(p) for p in report["paths"]], \
+                    ["book_1_2.json", "book_1_3.json"])
+            self.assertEqual(len(os.listdir(dbJSON)), 1)
+
+            report = importer.import_books(pathCSV, dbJSON, dbNote, noteType="md", verbose=False)
+            self.assertEqual(report["imported"], 2)
+            book = book_item(os.path.join(dbJSON, "book_1_2.json"))
+            self.assertEqual(book.get_tag(), ["x", "y"])
+            self.assertEqual(book.get_key("noteLocation"), "-/book_1_2")
+            self.assertTrue(os.path.isfile(os.path.join(dbNote, "book_1_2", "book_1_2.md")))
+
+            # tags of any type, plans before added, and failed writes are skipped not aborted
+            dictBook, _, _ = importer.map_record({"title": "T", "tags": [1, " X "]})
+            self.assertEqual(dictBook["tag"], ["1", "x"])
+            self.assertRaises(ValueError, importer.map_record, \
+                    {"title": "T", "added": "2020-02-01", "plan": "2020-01-01"})
+            # the progress of either could not be calculated
+            self.assertRaises(ValueError, importer.map_record, \
+                    {"title": "T", "added": "2020-02-01", "plan": "2020-02-01"})
+            self.assertRaises(ValueError, importer.map_record, \
+                    {"title": "T", "added": "2020-02-02"}, dt.date(2020, 2, 1))
+            pathDates = os.path.join(dirLib, "dates.jsonl")
+            with open(pathDates, 'w') as h:
+                today = dt.date.today()
+                for added, plan in [(today, today), (today + dt.timedelta(days=1), None), \
+                        (today, today + dt.timedelta(days=1))]:
+                    record = {"title": "Dated", "added": str(added)}
+                    if plan is not None:
+                        record["plan"] = str(plan)
+                    h.write(json.dumps(record) + "\n")
+            dbDates = os.path.join(dirLib, "dates")
+            os.makedirs(dbDates)
+            report = importer.import_books(pathDates, dbDates, nWorkers=1, verbose=False)
+            self.assertEqual(report["imported"], 1)
+            self.assertEqual([iRecord for iRecord, _ in report["skipped"]], [1, 2])
+            book_item(report["paths"][0]).get_progress()
+            pathJSONL = os.path.join(dirLib, "books.jsonl")
+            with open(pathJSONL, 'w') as h:
+                for title in ["Good", "Bad", "Fine"]:
+                    h.write(json.dumps({"title": title}) + "\n")
+            encode = importer.codec.encode
+            def encode_failing(dictBook, storage):
+                if dictBook["title"] == "Bad":
+                    raise OSError("disk full")
+                return encode(dictBook, storage)
+            with mock.patch.object(importer.codec, "encode", encode_failing):
+                report = importer.import_books(pathJSONL, dbJSON, nWorkers=1, verbose=False)
+            self.assertEqual(report["imported"], 2)
+            self.assertEqual(report["skipped"], [(2, "disk full")])
+
+class test_notetemplate(ut.TestCase):
+    '''
+    Unit test for note templates
+    '''
+
+    def test_create_notes(self):
+        '''
+        missing notes created from built-in and custom templates, existing ones kept
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            pathConfig = make_library(dirLib, 30)
+            pathTemplate = os.path.join(dirLib, "template.md")
+            with open(pathTemplate, 'w') as h:
+                h.write("# $title by $author ($tags) $$5 $unknown\n")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/", \
+                        "noteTemplates": {"md": pathTemplate}}, h)
+            mana = manager(pathConfig, verbose=False)
+            for bi in mana:
+                bi.update_note_dir("-/" + layout.book_name(bi.filepath))
+            mana.update_json_all()
+            withNote = [bi for bi in mana if bi.get_key("noteType") is not None]
+            pathKept = mana.get_note_path_of(withNote[0])
+            notetemplate.write_note(pathKept, "kept")
+
+            paths = utils.create_notes(pathConfig, nWorkers=4)
+            self.assertEqual(sorted(paths), sorted(mana.get_note_path_of(bi) \
+                    for bi in withNote[1:]))
+            with open(pathKept, 'r') as h:
+                self.assertEqual(h.read(), "kept")
+            for bi in withNote[1:]:
+                with open(mana.get_note_path_of(bi), 'r') as h:
+                    text = h.read()
+                if bi.get_key("noteType") == "md":
+                    self.assertEqual(text, "# %s by %s (%s) $5 $unknown\n" % \
+                            (bi.get_title(), bi.get_author(), ", ".join(bi.get_tag())))
+                else:
+                    self.assertIn("\\title{%s}" % bi.get_title(), text)
+            self.assertEqual(utils.create_notes(pathConfig), [])
+
+    def test_fallback_and_escape(self):
+        '''
+        no note without template, a missing template file reported once, tex values escaped
+        '''
+        with tempfile.TemporaryDirectory() as dirLib:
+            pathConfig = make_library(dirLib, 30)
+            pathMissing = os.path.join(dirLib, "missing.md")
+            with open(pathConfig, 'w') as h:
+                json.dump({"dbJSON": "-/", "dbNote": "-/", \
+                        "noteTemplates": {"md": pathMissing}}, h)
+            mana = manager(pathConfig, verbose=False)
+            for bi in mana:
+                bi.update_note_dir("-/" + layout.book_name(bi.filepath))
+            biDocx = next(bi for bi in mana if bi.get_key("noteType") is not None)
+            biDocx.update_note_type("docx")
+            biTex = next(bi for bi in mana if bi.get_key("noteType") == "tex")
+            biTex.update_title("R&D of 100% C_60 {x} #1")
+            mana.update_json_all()
+            withNote = [bi for bi in mana if bi.get_key("noteType") in ["md", "tex"]]
+
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                paths = utils.create_notes(pathConfig, nWorkers=4)
+            self.assertEqual(out.getvalue().count(pathMissing), 1)
+            self.assertEqual(sorted(paths), sorted(mana.get_note_path_of(bi) for bi in withNote))
+            self.assertFalse(os.path.exists(mana.get_note_path_of(biDocx)))
+            for bi in withNote:
+                with open(mana.get_note_path_of(bi), 'r') as h:
+                    text = h.read()
+                if bi.get_key("noteType") == "md":
+                    self.assertTrue(text.startswith("# %s\n" % bi.get_title()))
+            with open(mana.get_note_path_of(biTex), 'r') as h:
+                self.assertIn("\\title{R\\&D of 100\\% C\\_60 \\{x\\} \\#1}", h.read())
+
+class test_exporter(ut.TestCase):
+    '''
+    Unit test for streaming export
+    '''
+
+    def test_export_books(self):
+        '''
+        export to gzipped JSON-lines, CSV and normalized tables
+        '''
+        shelves = [("shelf", os.path.join("data", "JSON"))]
+        with tempfile.TemporaryDirectory() as dirOut:
+            pathOut = os.path.join(dirOut, "books.jsonl.gz")
+            self.assertEqual(exporter.export_books(pathOut, shelves), 2)
+            with gzip.open(pathOut, 'rt') as h:
+                records = sorted([json.loads(line) for line in h], key=lambda x: x["name"])
+            self.assertEqual(records[0]["name"], "book_1")
+            # keysMust defaults are filled
+            self.assertEqual(records[0]["tag"], [])
+
+            pathOut = os.path.join(dirOut, "books.csv")
+            self.assertEqual(exporter.export_books(pathOut, shelves, "csv"), 2)
+            with open(pathOut, 'r') as h:
+                self.assertEqual(len(list(csv.reader(h))), 3)
+
+            dirTables = os.path.join(dirOut, "tables")
+            exporter.export_books(dirTables, shelves, "tables", fCompress=True)
+            self.assertEqual(sorted(os.listdir(dirTables)), \
+                    ["books.csv.gz", "logs.csv.gz", "remarks.csv.gz", "tags.csv.gz"])
+
+class test_notesearch(ut.TestCase):
+    '''
+    Unit test for full-text search of notes
+    '''
+
+    def test_note_index(self):
+        '''
+        index incrementally and search, with and without FTS5
+        '''
+        for useFTS in set([False, notesearch.has_fts5()]):
+            with tempfile.TemporaryDirectory() as dirTmp:
+                notes = []
+                for name, body in [("a", "Quantum mechanics and the harmonic oscillator"), \
+                                   ("b", "Notes on oscillator, oscillator and oscillator"), \
+                                   ("c", "Nothing related")]:
+                    pathNote = os.path.join(dirTmp, name + ".md")
+                    with open(pathNote, 'w') as h:
+                        h.write(body)
+                    notes.append((name, pathNote))
+                index = notesearch.note_index(os.path.join(dirTmp, "idx", "notes.sqlite"), useFTS)
+                self.assertEqual(index.update(notes), (3, 0))
+                # nothing changed, nothing read
+                self.assertEqual(index.update(notes), (0, 0))
+                results = index.search("oscillator")
+                self.assertEqual([r[0] for r in results], ["b", "a"])
+                self.assertTrue("[oscillator]" in results[1][2])
+                self.assertEqual([r[0] for r in index.search("quant*")], ["a"])
+                self.assertEqual(index.search("oscillator quantum")[0][0], "a")
+                # c dropped from the notes
+                self.assertEqual(index.update(notes[:2]), (0, 1))
+                self.assertEqual(index.search("nothing"), [])
+                # a note shared by two books is indexed once
+                self.assertEqual(index.update(notes[:2] + [("d", notes[0][1])]), (0, 0))
+                index.close()
+
 
 if __name__ == "__main__":
     ut.main()